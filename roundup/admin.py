@@ -1324,6 +1324,11 @@ Erase it? Y/N: """))
 
         This will re-generate the search indexes for a tracker.
         This will typically happen automatically.
+
+        The items are indexed in chunks (see the indexer_reindex_*
+        options of config.ini) and the work done is committed every
+        minute: if the reindex is interrupted, running it again with
+        the same arguments resumes it.
         """
         if args:
             for arg in args:
@@ -1337,9 +1342,27 @@ Erase it? Y/N: """))
                             'designator': arg})
                 else:
                     cl = self.get_class(arg)
-                    self.db.reindex(arg)
+                    self.db.reindex(arg, checkpoint=True)
+        else:
+            self.db.reindex(show_progress=True, checkpoint=True)
+        return 0
+
+    def do_rebuildindexes(self, args):
+        ''"""Usage: rebuildindexes [classname]*
+        Re-generate a tracker's property indexes.
+
+        This re-generates the indexes of the Link and Multilink
+        properties, and of the properties declared with an "index",
+        kept by the anydbm backend. They're built automatically when the
+        schema changes, so this is only needed if they got damaged. The
+        SQL backends maintain their indexes themselves.
+        """
+        if args:
+            for arg in args:
+                self.get_class(arg)
+                self.db.rebuild_indexes(arg)
         else:
-            self.db.reindex(show_progress=True)
+            self.db.rebuild_indexes()
         return 0
 
     def do_security(self, args):
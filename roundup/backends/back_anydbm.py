@@ -135,11 +135,14 @@ class Expression:
 class Database(FileStorage, hyperdb.Database, roundupdb.Database):
     """A database for storing records containing flexible data types.
 
-    Transaction stuff TODO:
-
-    - check the timestamp of the class file and nuke the cache if it's
-      modified. Do some sort of conflict checking on the dirty stuff.
-    - perhaps detect write collisions (related to above)?
+    Locking: the first read of a transaction takes a shared lock on the
+    "lock" file, held until commit() or rollback(), so any number of
+    transactions may read at the same time and each sees a consistent
+    state of the data. commit() turns the lock into an exclusive one
+    while it writes. As that isn't atomic, the lock file also counts the
+    commits made: if another commit got in first, the nodes we're about
+    to save are compared against their state on disk and the commit
+    fails if somebody else changed them.
     """
     def __init__(self, config, journaltag=None):
         """Open a hyperdatabase given a specifier to some storage.
@@ -171,45 +174,103 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         self.security = security.Security(self)
         os.umask(config.UMASK)
 
-        # lock it
+        # locked by the transactions, see lock_read()
         lockfilenm = os.path.join(self.dir, 'lock')
-        self.lockfile = locking.acquire_lock(lockfilenm)
-        self.lockfile.write(str(os.getpid()))
+        self.lockfile = open(lockfilenm, 'a+')
+        self.locked = False
+        self.generation = 0
+        self.loaded = {}        # marshalled nodes as read, for commit()
+        # the indexes built; post_init() isn't called when the tracker
+        # is opened with optimize, so don't leave that to update_indexes()
+        self.lock_read()
+        try:
+            self.index_spec = self.load_index_spec()
+        finally:
+            self.unlock()
+
+    def get_generation(self):
+        """ Return the number of commits made, kept in the lock file """
+        if self.lockfile is None:
+            return self.generation
+        self.lockfile.seek(0)
+        try:
+            return int(self.lockfile.read() or 0)
+        except ValueError:
+            return 0
+
+    def set_generation(self, generation):
+        if self.lockfile is None:
+            return
+        self.lockfile.seek(0)
+        self.lockfile.truncate()
+        self.lockfile.write(str(generation))
         self.lockfile.flush()
 
+    # A closed database has always been allowed to commit without any
+    # locking, so the lock methods do nothing once we're closed.
+
+    def lock_read(self):
+        """ Share the database with the other readers until the end of
+            the transaction, unless it's locked already
+        """
+        if self.lockfile is None or self.locked:
+            return
+        locking.lock(self.lockfile, shared=1)
+        self.locked = True
+        self.generation = self.get_generation()
+
+    def lock_exclusive(self):
+        """ Get the database to ourselves for writing """
+        if self.lockfile is None:
+            return
+        if self.locked:
+            locking.change_lock(self.lockfile)
+        else:
+            # nothing read yet, so there's nothing to be in conflict with
+            locking.lock(self.lockfile)
+            self.locked = True
+            self.generation = self.get_generation()
+
+    def lock_shared(self):
+        """ Go back to sharing the database, and see the latest commits """
+        if self.lockfile is None:
+            return
+        locking.change_lock(self.lockfile, shared=1)
+        self.locked = True
+        self.generation = self.get_generation()
+
+    def unlock(self):
+        """ Let the writers in, at the end of the transaction """
+        if self.lockfile is None or not self.locked:
+            return
+        locking.release_lock(self.lockfile)
+        self.locked = False
+
     def post_init(self):
         """Called once the schema initialisation has finished.
         """
+        # build the property indexes declared since last time
+        self.update_indexes()
+
         # reindex the db if necessary
         if self.indexer.should_reindex():
-            self.reindex()
+            self.refresh_database()
 
     def refresh_database(self):
         """Rebuild the database
         """
-        self.reindex()
+        self.lock_exclusive()
+        try:
+            self.reindex()
+        finally:
+            self.lock_shared()
 
     def getSessionManager(self):
-        return Sessions(self)
+        return self.open_sessions(Sessions)
 
     def getOTKManager(self):
         return OneTimeKeys(self)
 
-    def reindex(self, classname=None, show_progress=False):
-        if classname:
-            classes = [self.getclass(classname)]
-        else:
-            classes = self.classes.values()
-        for klass in classes:
-            if show_progress:
-                for nodeid in support.Progress('Reindex %s'%klass.classname,
-                        klass.list()):
-                    klass.index(nodeid)
-            else:
-                for nodeid in klass.list():
-                    klass.index(nodeid)
-        self.indexer.save_index()
-
     def __repr__(self):
         return '<back_anydbm instance at %x>'%id(self)
 
@@ -299,6 +360,9 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         """Low-level database opener that gets around anydbm/dbm
            eccentricities.
         """
+        # the data read is consistent until the end of the transaction
+        self.lock_read()
+
         # figure the class db type
         path = os.path.join(os.getcwd(), self.dir, name)
         db_type = self.determine_db_type(path)
@@ -324,30 +388,230 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
                 "opendb %r.open(%r, %r)"%(db_type, path, mode))
         return dbm.open(path, mode)
 
+    #
+    # Property indexes
+    #
+    # The indexed properties of a class are kept in the "propindex.<class>"
+    # db, mapping "<property>:<value>" to the marshalled list of ids of
+    # the nodes with that value (lowercased for 'nocase' indexes). All the
+    # Link and Multilink properties are indexed, which gives a reverse
+    # index of the links for find() and filter(). The indexes built are
+    # recorded in the "propindexes" file, which commit() reads to know
+    # which ones to maintain.
+    index_spec = None
+
+    def getindexdb(self, classname, mode='r'):
+        return self.opendb('propindex.%s'%classname, mode)
+
+    def load_index_spec(self):
+        """ Return the indexes built, as a dict mapping class names to
+            the sorted list of (property name, kind) of their indexes
+        """
+        path = os.path.join(self.dir, 'propindexes')
+        if not os.path.exists(path):
+            return {}
+        f = open(path, 'rb')
+        try:
+            return marshal.load(f)
+        finally:
+            f.close()
+
+    def save_index_spec(self, spec):
+        path = os.path.join(self.dir, 'propindexes')
+        f = open(path + '.tmp', 'wb')
+        try:
+            marshal.dump(spec, f)
+        finally:
+            f.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    def get_index_spec(self):
+        """ Return the indexes our schema wants, in the format of
+            load_index_spec()
+        """
+        spec = {}
+        for classname, klass in self.classes.iteritems():
+            indexes = klass.getindexes()
+            for propname, prop in klass.getprops(protected=0).iteritems():
+                if isinstance(prop, (hyperdb.Link, hyperdb.Multilink)):
+                    indexes[propname] = 'yes'
+            if indexes:
+                spec[classname] = sorted(indexes.items())
+        return spec
+
+    def update_indexes(self):
+        """ Build the indexes declared on the class properties that don't
+            exist yet, and drop the ones no longer declared
+        """
+        spec = self.get_index_spec()
+        if self.load_index_spec() != spec:
+            self.lock_exclusive()
+            try:
+                built = self.load_index_spec()
+                for classname in set(built) | set(spec):
+                    if built.get(classname) != spec.get(classname):
+                        self.build_index(classname, spec.get(classname))
+                self.save_index_spec(spec)
+            finally:
+                self.lock_shared()
+        self.index_spec = spec
+
+    def rebuild_indexes(self, classname=None):
+        """ Rebuild the property indexes of the class, or of all classes,
+            from their nodes
+        """
+        spec = self.get_index_spec()
+        if classname:
+            classnames = [classname]
+        else:
+            classnames = spec.keys()
+        self.lock_exclusive()
+        try:
+            built = self.load_index_spec()
+            for classname in classnames:
+                self.build_index(classname, spec.get(classname))
+                if classname in spec:
+                    built[classname] = spec[classname]
+                elif classname in built:
+                    del built[classname]
+            self.save_index_spec(built)
+        finally:
+            self.lock_shared()
+        self.index_spec = built
+
+    def build_index(self, classname, indexes):
+        """ (Re)build the property index of the class from its nodes """
+        index = {}
+        if indexes:
+            db = self.getclassdb(classname)
+            try:
+                for nodeid in db.keys():
+                    node = marshal.loads(db[nodeid])
+                    for key in self.index_keys(node, indexes):
+                        index.setdefault(key, []).append(nodeid)
+            finally:
+                db.close()
+        db = self.getindexdb(classname, 'c')
+        try:
+            for key in db.keys():
+                del db[key]
+            for key, nodeids in index.iteritems():
+                db[key] = marshal.dumps(nodeids)
+        finally:
+            db.close()
+
+    def index_keys(self, node, indexes):
+        """ Return the keys of the serialised node in the property index
+        """
+        keys = []
+        for propname, kind in indexes:
+            value = node.get(propname)
+            if value is None:
+                continue
+            if type(value) is not type([]):
+                value = [value]
+            for value in value:
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                if kind == 'nocase':
+                    value = value.lower()
+                key = '%s:%s'%(propname, value)
+                if key not in keys:
+                    keys.append(key)
+        return keys
+
+    def index_lookup(self, classname, propname, kind, value):
+        """ Return the ids of the committed nodes having the value in the
+            property index, or None if the property has no such index
+        """
+        if (propname, kind) not in (self.index_spec or {}).get(classname,
+                ()):
+            return None
+        key = self.index_keys({propname: value}, [(propname, kind)])[0]
+        db = self.getindexdb(classname)
+        try:
+            if key_in(db, key):
+                return marshal.loads(db[key])
+            return []
+        finally:
+            db.close()
+
+    def getCachedIndexDB(self, classname):
+        """ get the property index db, looking in our cache of databases
+            for commit
+        """
+        db_name = 'propindex.%s'%classname
+        if db_name not in self.databases:
+            self.databases[db_name] = self.getindexdb(classname, 'c')
+        return self.databases[db_name]
+
+    def update_index(self, classname, nodeid, old, new):
+        """ Move the node from the 'old' to the 'new' serialised values in
+            the property index of the class
+        """
+        indexes = self.index_spec[classname]
+        old = self.index_keys(old, indexes)
+        new = self.index_keys(new, indexes)
+        if old == new:
+            return
+        db = self.getCachedIndexDB(classname)
+        for key in old:
+            if key in new or not key_in(db, key):
+                continue
+            nodeids = marshal.loads(db[key])
+            if nodeid in nodeids:
+                nodeids.remove(nodeid)
+            if nodeids:
+                db[key] = marshal.dumps(nodeids)
+            else:
+                del db[key]
+        for key in new:
+            if key in old:
+                continue
+            nodeids = []
+            if key_in(db, key):
+                nodeids = marshal.loads(db[key])
+            if nodeid not in nodeids:
+                nodeids.append(nodeid)
+                db[key] = marshal.dumps(nodeids)
+
     #
     # Node IDs
     #
     def newid(self, classname):
         """ Generate a new id for the given class
         """
-        # open the ids DB - create if if doesn't exist
-        db = self.opendb('_ids', 'c')
-        if key_in(db, classname):
-            newid = db[classname] = str(int(db[classname]) + 1)
-        else:
-            # the count() bit is transitional - older dbs won't start at 1
-            newid = str(self.getclass(classname).count()+1)
-            db[classname] = newid
-        db.close()
+        # the ids DB has its own lock as ids are handed out before commit
+        lockfile = locking.acquire_lock(os.path.join(self.dir, 'lock.ids'))
+        try:
+            # open the ids DB - create if if doesn't exist
+            db = self.opendb('_ids', 'c')
+            if key_in(db, classname):
+                newid = db[classname] = str(int(db[classname]) + 1)
+            else:
+                # the count() bit is transitional - older dbs won't start at 1
+                newid = str(self.getclass(classname).count()+1)
+                db[classname] = newid
+            db.close()
+        finally:
+            locking.release_lock(lockfile)
+            lockfile.close()
         return newid
 
     def setid(self, classname, setid):
         """ Set the id counter: used during import of database
         """
-        # open the ids DB - create if if doesn't exist
-        db = self.opendb('_ids', 'c')
-        db[classname] = str(setid)
-        db.close()
+        lockfile = locking.acquire_lock(os.path.join(self.dir, 'lock.ids'))
+        try:
+            # open the ids DB - create if if doesn't exist
+            db = self.opendb('_ids', 'c')
+            db[classname] = str(setid)
+            db.close()
+        finally:
+            locking.release_lock(lockfile)
+            lockfile.close()
 
     #
     # Nodes
@@ -417,8 +681,11 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
                 nodeid in self.destroyednodes[classname]):
             raise IndexError("no such %s %s"%(classname, nodeid))
 
-        # decode
-        res = marshal.loads(db[nodeid])
+        # decode, remembering what we read if we may change it
+        data = db[nodeid]
+        if self.journaltag is not None:
+            self.loaded[(classname, nodeid)] = data
+        res = marshal.loads(data)
 
         # reverse the serialisation
         res = self.unserialise(classname, res)
@@ -645,7 +912,14 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
     def pack(self, pack_before):
         """ Delete all journal entries except "create" before 'pack_before'.
         """
-        pack_before = pack_before.serialise()
+        self.lock_exclusive()
+        try:
+            self.pack_journals(pack_before.serialise())
+        finally:
+            self.lock_shared()
+
+    def pack_journals(self, pack_before):
+        """ Do the packing, with the database locked exclusively """
         for classname in self.getclasses():
             packed = 0
             # get the journal db
@@ -697,6 +971,25 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         logging.getLogger('roundup.hyperdb').info('commit %s transactions'%(
             len(self.transactions)))
 
+        if not self.transactions:
+            # nothing to write, the next read sees the latest state
+            self.clearCache()
+            self.unlock()
+            return
+
+        self.lock_exclusive()
+        try:
+            # maintain the property indexes built, whatever our schema says
+            self.index_spec = self.load_index_spec()
+            self.check_conflicts()
+            self.commit_transactions()
+            self.set_generation(self.get_generation() + 1)
+        finally:
+            self.unlock()
+        self.clearCache()
+
+    def commit_transactions(self):
+        """ Write the changes, with the database locked exclusively """
         # keep a handle to all the database files opened
         self.databases = {}
 
@@ -723,11 +1016,82 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         # save the indexer state
         self.indexer.save_index()
 
-        self.clearCache()
+    def check_conflicts(self):
+        """ Make sure no other commit since we started reading changed
+            the nodes we are about to save or destroy, or took the key
+            values of our new and changed nodes.
+        """
+        if self.get_generation() == self.generation:
+            return
+        for changed in self.dirtynodes, self.destroyednodes:
+            for classname, nodeids in changed.iteritems():
+                db = self.getclassdb(classname)
+                try:
+                    for nodeid in nodeids:
+                        data = None
+                        if key_in(db, nodeid):
+                            data = db[nodeid]
+                        if data != self.loaded.get((classname, nodeid)):
+                            raise hyperdb.DatabaseError(_('%(class)s%(id)s '
+                                'has been changed by somebody else') % {
+                                'class': classname, 'id': nodeid})
+                finally:
+                    db.close()
+
+        for classname in set(self.newnodes) | set(self.dirtynodes):
+            key = self.getclass(classname).key
+            if not key:
+                continue
+            nodeids = {}
+            nodeids.update(self.newnodes.get(classname, {}))
+            nodeids.update(self.dirtynodes.get(classname, {}))
+            keys = {}
+            for nodeid in nodeids:
+                node = self.cache.get(classname, {}).get(nodeid)
+                if node and not node.get(self.RETIRED_FLAG) and \
+                        node.get(key) is not None:
+                    keys[node.get(key)] = nodeid
+            if not keys:
+                continue
+            db = self.getclassdb(classname)
+            try:
+                # only read the whole class if the key isn't indexed
+                candidates = self.key_candidates(classname, key, keys)
+                if candidates is None:
+                    candidates = db.keys()
+                for nodeid in candidates:
+                    if nodeid in nodeids or not key_in(db, nodeid):
+                        continue
+                    node = marshal.loads(db[nodeid])
+                    if node.get(key) in keys and not node.get(
+                            self.RETIRED_FLAG):
+                        raise hyperdb.DatabaseError(_('%(class)s %(key)s '
+                            '"%(value)s" has been taken by somebody else')%{
+                            'class': classname, 'key': key,
+                            'value': node[key]})
+            finally:
+                db.close()
+
+    def key_candidates(self, classname, key, values):
+        """ Return the ids of the committed nodes that may have one of
+            the values for their key property, as found in a property
+            index of the key, or None if the key has no index
+        """
+        for kind in 'yes', 'nocase':
+            nodeids = set()
+            for value in values:
+                found = self.index_lookup(classname, key, kind, value)
+                if found is None:
+                    break
+                nodeids.update(found)
+            else:
+                return nodeids
+        return None
 
     def clearCache(self):
         # all transactions committed, back to normal
         self.cache = {}
+        self.loaded = {}
         self.dirtynodes = {}
         self.newnodes = {}
         self.destroyednodes = {}
@@ -746,9 +1110,17 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
     def doSaveNode(self, classname, nodeid, node):
         db = self.getCachedClassDB(classname)
+        node = self.serialise(classname, node)
+
+        # update the property index
+        if self.index_spec.get(classname):
+            old = {}
+            if key_in(db, nodeid):
+                old = marshal.loads(db[nodeid])
+            self.update_index(classname, nodeid, old, node)
 
         # now save the marshalled data
-        db[nodeid] = marshal.dumps(self.serialise(classname, node))
+        db[nodeid] = marshal.dumps(node)
 
         # return the classname, nodeid so we reindex this content
         return (classname, nodeid)
@@ -806,9 +1178,12 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         db[nodeid] = marshal.dumps(l)
 
     def doDestroyNode(self, classname, nodeid):
-        # delete from the class database
+        # delete from the class database and the property index
         db = self.getCachedClassDB(classname)
         if key_in(db, nodeid):
+            if self.index_spec.get(classname):
+                self.update_index(classname, nodeid,
+                    marshal.loads(db[nodeid]), {})
             del db[nodeid]
 
         # delete from the database
@@ -826,17 +1201,14 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             # delete temporary files
             if method == self.doStoreFile:
                 self.rollbackStoreFile(*args)
-        self.cache = {}
-        self.dirtynodes = {}
-        self.newnodes = {}
-        self.destroyednodes = {}
-        self.transactions = []
+        self.clearCache()
+        self.unlock()
 
     def close(self):
-        """ Nothing to do
+        """ Release our lock on the database
         """
         if self.lockfile is not None:
-            locking.release_lock(self.lockfile)
+            self.unlock()
             self.lockfile.close()
             self.lockfile = None
 
@@ -1516,11 +1888,26 @@ class Class(hyperdb.Class):
                 raise TypeError("'%s' not a Link/Multilink "
                     "property"%propname)
 
-        # ok, now do the find
+        # ok, now do the find, only looking at the nodes found in the
+        # property indexes if all the properties have one
+        nodeids = {}
+        for propname, itemids in propspec.iteritems():
+            if type(itemids) is not type({}):
+                itemids = {itemids:1}
+            found = None
+            if None not in itemids:
+                found = self.indexed_nodeids(propname, 'yes', itemids)
+            if found is None:
+                nodeids = None
+                break
+            nodeids.update(dict.fromkeys(found))
+
         cldb = self.db.getclassdb(self.classname)
         l = []
         try:
-            for id in self.getnodeids(db=cldb):
+            if nodeids is None:
+                nodeids = self.getnodeids(db=cldb)
+            for id in nodeids:
                 item = self.db.getnode(self.classname, id, db=cldb)
                 if self.db.RETIRED_FLAG in item:
                     continue
@@ -1567,10 +1954,20 @@ class Class(hyperdb.Class):
             if not isinstance(prop, hyperdb.String):
                 raise TypeError("'%s' not a String property"%propname)
             requirements[propname] = requirements[propname].lower()
+
+        # only look at the nodes found in a property index if we can
+        nodeids = None
+        for propname, value in requirements.iteritems():
+            nodeids = self.indexed_nodeids(propname, 'nocase', [value])
+            if nodeids is not None:
+                break
+
         l = []
         cldb = self.db.getclassdb(self.classname)
         try:
-            for nodeid in self.getnodeids(cldb):
+            if nodeids is None:
+                nodeids = self.getnodeids(cldb)
+            for nodeid in nodeids:
                 node = self.db.getnode(self.classname, nodeid, cldb)
                 if self.db.RETIRED_FLAG in node:
                     continue
@@ -1585,6 +1982,26 @@ class Class(hyperdb.Class):
             cldb.close()
         return l
 
+    def indexed_nodeids(self, propname, kind, values):
+        """ Return the ids of the nodes that may have one of the values for
+            the property, as found in its index, or None if the property
+            has no such index.
+        """
+        nodeids = {}
+        for value in values:
+            found = self.db.index_lookup(self.classname, propname, kind,
+                value)
+            if found is None:
+                return None
+            nodeids.update(dict.fromkeys(found))
+
+        # the index only knows about the committed nodes
+        for changed in self.db.newnodes, self.db.dirtynodes:
+            nodeids.update(changed.get(self.classname, {}))
+        for nodeid in self.db.destroyednodes.get(self.classname, {}):
+            nodeids.pop(nodeid, None)
+        return nodeids.keys()
+
     def list(self):
         """ Return a list of the ids of the active nodes in this class.
         """
@@ -1746,13 +2163,31 @@ class Class(hyperdb.Class):
 
         filterspec = l
 
+        # the nodes linking to any of some given nodes are found in the
+        # index of the property
+        nodeids = None
+        for t, k, v in filterspec:
+            if t not in (LINK, MULTILINK) or not v:
+                continue
+            if None in v or [x for x in v if not num_re.match(str(x))]:
+                continue
+            found = self.indexed_nodeids(k, 'yes', v)
+            if found is None:
+                continue
+            if nodeids is None:
+                nodeids = set(found)
+            else:
+                nodeids.intersection_update(found)
+
         # now, find all the nodes that are active and pass filtering
         matches = []
         cldb = self.db.getclassdb(cn)
         t = 0
         try:
+            if nodeids is None:
+                nodeids = self.getnodeids(cldb)
             # TODO: only full-scan once (use items())
-            for nodeid in self.getnodeids(cldb):
+            for nodeid in nodeids:
                 node = self.db.getnode(cn, nodeid, cldb)
                 if self.db.RETIRED_FLAG in node:
                     continue
@@ -1947,8 +2382,9 @@ class Class(hyperdb.Class):
                 raise ValueError(key)
         self.properties.update(properties)
 
-    def index(self, nodeid):
-        """ Add (or refresh) the node to search indexes """
+    def index_texts(self, nodeid):
+        """ Return the texts of the node to add to the search indexes """
+        texts = []
         # find all the String properties that have indexme
         for prop, propclass in self.getprops().iteritems():
             if isinstance(propclass, hyperdb.String) and propclass.indexme:
@@ -1958,7 +2394,9 @@ class Class(hyperdb.Class):
                 except IndexError:
                     # node has been destroyed
                     continue
-                self.db.indexer.add_text((self.classname, nodeid, prop), value)
+                texts.append(((self.classname, nodeid, prop), value,
+                    'text/plain'))
+        return texts
 
     #
     # import / export support
@@ -2180,17 +2618,18 @@ class FileClass(hyperdb.FileClass, Class):
         self.fireReactors('set', itemid, oldvalues)
         return propvalues
 
-    def index(self, nodeid):
-        """ Add (or refresh) the node to search indexes.
+    def index_texts(self, nodeid):
+        """ Return the texts of the node to add to the search indexes.
 
         Use the content-type property for the content property.
         """
+        texts = []
         # find all the String properties that have indexme
         for prop, propclass in self.getprops().iteritems():
             if prop == 'content' and propclass.indexme:
                 mime_type = self.get(nodeid, 'type', self.default_mime_type)
-                self.db.indexer.add_text((self.classname, nodeid, 'content'),
-                    str(self.get(nodeid, 'content')), mime_type)
+                texts.append(((self.classname, nodeid, 'content'),
+                    str(self.get(nodeid, 'content')), mime_type))
             elif isinstance(propclass, hyperdb.String) and propclass.indexme:
                 # index them under (classname, nodeid, property)
                 try:
@@ -2198,7 +2637,9 @@ class FileClass(hyperdb.FileClass, Class):
                 except IndexError:
                     # node has been destroyed
                     continue
-                self.db.indexer.add_text((self.classname, nodeid, prop), value)
+                texts.append(((self.classname, nodeid, prop), value,
+                    'text/plain'))
+        return texts
 
 # deviation from spec - was called ItemClass
 class IssueClass(Class, roundupdb.IssueClass):
@@ -2210,7 +2651,8 @@ class IssueClass(Class, roundupdb.IssueClass):
         "creation" or "activity" property, a ValueError is raised.
         """
         if 'title' not in properties:
-            properties['title'] = hyperdb.String(indexme='yes')
+            properties['title'] = hyperdb.String(indexme='yes',
+                index='nocase')
         if 'messages' not in properties:
             properties['messages'] = hyperdb.Multilink("msg")
         if 'files' not in properties:
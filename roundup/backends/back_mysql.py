@@ -115,12 +115,19 @@ class Database(Database):
     # used by some code to switch styles of query
     implements_intersect = 0
 
+    insert_or_ignore = 'insert ignore into %s (%s) values (%s)'
+
     # Backend for MySQL to use.
     # InnoDB is faster, but if you're running <4.0.16 then you'll need to
     # use BDB to pass all unit tests.
     mysql_backend = 'InnoDB'
     #mysql_backend = 'BDB'
 
+    # DATETIME columns only keep whole seconds, so two changes of a node
+    # within a second leave its activity unchanged: a node validated by
+    # its activity could be outdated
+    supports_shared_cache = False
+
     hyperdb_to_sql_datatypes = {
         hyperdb.String : 'TEXT',
         hyperdb.Date   : 'DATETIME',
@@ -202,27 +209,41 @@ class Database(Database):
         self.sql('''CREATE TABLE otks (otk_key VARCHAR(255),
             otk_value TEXT, otk_time FLOAT(20))
             ENGINE=%s'''%self.mysql_backend)
-        self.sql('CREATE INDEX otks_key_idx ON otks(otk_key)')
+        self.sql('CREATE UNIQUE INDEX otks_key_idx ON otks(otk_key)')
 
         # Sessions store
         self.sql('''CREATE TABLE sessions (session_key VARCHAR(255),
             session_time FLOAT(20), session_value TEXT)
             ENGINE=%s'''%self.mysql_backend)
-        self.sql('''CREATE INDEX sessions_key_idx ON
+        self.sql('''CREATE UNIQUE INDEX sessions_key_idx ON
             sessions(session_key)''')
 
         # full-text indexing store
         self.sql('''CREATE TABLE __textids (_class VARCHAR(255),
             _itemid VARCHAR(255), _prop VARCHAR(255), _textid INT)
             ENGINE=%s'''%self.mysql_backend)
-        self.sql('''CREATE TABLE __words (_word VARCHAR(30),
-            _textid INT) ENGINE=%s'''%self.mysql_backend)
-        self.sql('CREATE INDEX words_word_ids ON __words(_word)')
-        self.sql('CREATE INDEX words_by_id ON __words (_textid)')
         self.sql('CREATE UNIQUE INDEX __textids_by_props ON '
                  '__textids (_class, _itemid, _prop)')
         sql = 'insert into ids (name, num) values (%s,%s)'%(self.arg, self.arg)
         self.sql(sql, ('__textids', 1))
+        self.create_word_tables()
+        self.create_schema_fingerprint_table()
+
+    def create_word_tables(self):
+        self.sql('''CREATE TABLE __wordids (_wordid INT PRIMARY KEY,
+            _word VARCHAR(30) BINARY) ENGINE=%s'''%self.mysql_backend)
+        self.sql('CREATE UNIQUE INDEX __wordids_by_word ON __wordids(_word)')
+        self.sql('''CREATE TABLE __postings (_wordid INT,
+            _textid INT) ENGINE=%s'''%self.mysql_backend)
+        self.sql('CREATE INDEX postings_by_word ON '
+                 '__postings (_wordid, _textid)')
+        self.sql('CREATE INDEX postings_by_id ON __postings (_textid)')
+        sql = 'insert into ids (name, num) values (%s,%s)'%(self.arg, self.arg)
+        self.sql(sql, ('__wordids', 1))
+
+    def create_schema_fingerprint_table(self):
+        self.sql('''CREATE TABLE schema_fingerprint (fingerprint VARCHAR(40))
+            ENGINE=%s'''%self.mysql_backend)
 
     def add_new_columns_v2(self):
         '''While we're adding the actor column, we need to update the
@@ -383,6 +404,15 @@ class Database(Database):
     def sql_fetchall(self):
         return self.cursor.fetchall()
 
+    def sql_insert_or_replace(self, table, columns, row):
+        sql = 'insert into %s (%s) values (%s) on duplicate key update %s'%(
+            table, ', '.join(columns), ', '.join([self.arg] * len(columns)),
+            ', '.join(['%s=values(%s)'%(c, c) for c in columns[1:]]))
+        self.sql(sql, tuple(row))
+
+    def sql_drop_index(self, table_name, index_name):
+        self.sql('drop index %s on %s'%(index_name, table_name))
+
     def sql_index_exists(self, table_name, index_name):
         self.sql('show index from %s'%table_name)
         for index in self.cursor.fetchall():
@@ -509,6 +539,29 @@ class Database(Database):
         sql = 'drop index %s on %s'%(index_name, table_name)
         self.sql(sql)
 
+    def create_property_index(self, classname, propname, kind):
+        # mysql has no indexes on expressions and requires sizes on TEXT
+        # indexes, so index a prefix of the column itself; 'nocase'
+        # lookups compare the column itself too (see MysqlClass)
+        table_name = '_%s'%classname
+        index_name = self.property_index_name(classname, propname, kind)
+        if self.sql_index_exists(table_name, index_name):
+            return
+        prop = self.classes[classname].getprops()[propname]
+        if isinstance(prop, String):
+            column = '_%s(255)'%propname
+        else:
+            column = '_%s'%propname
+        self.sql('create index %s on %s(%s)'%(index_name, table_name,
+            column))
+
+    def drop_property_index(self, classname, propname, kind):
+        table_name = '_%s'%classname
+        index_name = self.property_index_name(classname, propname, kind)
+        if not self.sql_index_exists(table_name, index_name):
+            return
+        self.sql('drop index %s on %s'%(index_name, table_name))
+
     # old-skool id generation
     def newid(self, classname):
         ''' Generate a new id for the given class
@@ -526,6 +579,16 @@ class Database(Database):
         # return as string
         return str(newid)
 
+    def newids(self, classname, count):
+        ''' Reserve a block of count ids for the given class
+        '''
+        sql = 'select num from ids where name=%s FOR UPDATE'%self.arg
+        self.sql(sql, (classname, ))
+        first = int(self.cursor.fetchone()[0])
+        sql = 'update ids set num=%s where name=%s'%(self.arg, self.arg)
+        self.sql(sql, (first + count, classname))
+        return [str(id) for id in range(first, first + count)]
+
     def setid(self, classname, setid):
         ''' Set the id counter: used during import of database
 
@@ -573,6 +636,9 @@ class Database(Database):
                 raise
 
 class MysqlClass:
+    # The default collations of MySQL ignore case, and lower() would keep
+    # the lookup from using the index of the column.
+    case_insensitive_equal = '%s=%s'
 
     def supports_subselects(self):
         # TODO: AFAIK its version dependent for MySQL
@@ -16,6 +16,7 @@ try:
     import psycopg
     from psycopg import QuotedString
     from psycopg import ProgrammingError
+    from psycopg import IntegrityError
     TransactionRollbackError = ProgrammingError
     try:
         from psycopg.extensions import ISOLATION_LEVEL_READ_UNCOMMITTED
@@ -32,6 +33,7 @@ except:
     from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
     from psycopg2.extensions import ISOLATION_LEVEL_SERIALIZABLE
     from psycopg2.psycopg1 import ProgrammingError
+    from psycopg2 import IntegrityError
     from psycopg2.extensions import TransactionRollbackError
 import logging
 
@@ -157,7 +159,7 @@ class Database(rdbms_common.Database):
     implements_intersect = 1
 
     def getSessionManager(self):
-        return Sessions(self)
+        return self.open_sessions(Sessions)
 
     def sql_open_connection(self):
         db = connection_dict(self.config, 'database')
@@ -197,13 +199,13 @@ class Database(rdbms_common.Database):
         # OTK store
         self.sql('''CREATE TABLE otks (otk_key VARCHAR(255),
             otk_value TEXT, otk_time REAL)''')
-        self.sql('CREATE INDEX otks_key_idx ON otks(otk_key)')
+        self.sql('CREATE UNIQUE INDEX otks_key_idx ON otks(otk_key)')
 
         # Sessions store
         self.sql('''CREATE TABLE sessions (
             session_key VARCHAR(255), session_time REAL,
             session_value TEXT)''')
-        self.sql('''CREATE INDEX sessions_key_idx ON
+        self.sql('''CREATE UNIQUE INDEX sessions_key_idx ON
             sessions(session_key)''')
 
         # full-text indexing store
@@ -211,12 +213,21 @@ class Database(rdbms_common.Database):
         self.sql('''CREATE TABLE __textids (
             _textid integer primary key, _class VARCHAR(255),
             _itemid VARCHAR(255), _prop VARCHAR(255))''')
-        self.sql('''CREATE TABLE __words (_word VARCHAR(30),
-            _textid integer)''')
-        self.sql('CREATE INDEX words_word_idx ON __words(_word)')
-        self.sql('CREATE INDEX words_by_id ON __words (_textid)')
         self.sql('CREATE UNIQUE INDEX __textids_by_props ON '
                  '__textids (_class, _itemid, _prop)')
+        self.create_word_tables()
+        self.create_schema_fingerprint_table()
+
+    def create_word_tables(self):
+        self.sql('CREATE SEQUENCE ___wordids_ids')
+        self.sql('''CREATE TABLE __wordids (
+            _wordid integer primary key, _word VARCHAR(30))''')
+        self.sql('CREATE UNIQUE INDEX __wordids_by_word ON __wordids(_word)')
+        self.sql('''CREATE TABLE __postings (_wordid integer,
+            _textid integer)''')
+        self.sql('CREATE INDEX postings_by_word ON '
+                 '__postings (_wordid, _textid)')
+        self.sql('CREATE INDEX postings_by_id ON __postings (_textid)')
 
     def fix_version_2_tables(self):
         # Convert journal date column to TIMESTAMP, params column to TEXT
@@ -237,8 +248,10 @@ class Database(rdbms_common.Database):
 
     def fix_version_3_tables(self):
         rdbms_common.Database.fix_version_3_tables(self)
-        self.sql('''CREATE INDEX words_both_idx ON public.__words
-            USING btree (_word, _textid)''')
+        # the __words table is only there if upgrading from version 2+
+        if self.sql_index_exists('__words', 'words_by_id'):
+            self.sql('''CREATE INDEX words_both_idx ON public.__words
+                USING btree (_word, _textid)''')
 
     def add_actor_column(self):
         # update existing tables to have the new actor column
@@ -273,6 +286,23 @@ class Database(rdbms_common.Database):
             single-quotes around it... '''
         return str(QuotedString(str(value)))[1:-1]
 
+    def sql_insert_or_ignore(self, table, columns, rows):
+        # "on conflict do nothing" needs PostgreSQL 9.5, older servers
+        # insert the rows one by one and roll back the ones that fail
+        if getattr(self.conn, 'server_version', 0) >= 90500:
+            return rdbms_common.Database.sql_insert_or_ignore(self, table,
+                columns, rows)
+        sql = 'insert into %s (%s) values (%s)'%(table, ', '.join(columns),
+            ', '.join([self.arg] * len(columns)))
+        for row in rows:
+            self.sql('savepoint insert_or_ignore')
+            try:
+                self.sql(sql, row)
+            except IntegrityError:
+                self.sql('rollback to savepoint insert_or_ignore')
+            else:
+                self.sql('release savepoint insert_or_ignore')
+
     def sql_index_exists(self, table_name, index_name):
         sql = 'select count(*) from pg_indexes where ' \
             'tablename=%s and indexname=%s'%(self.arg, self.arg)
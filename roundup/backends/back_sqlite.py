@@ -43,6 +43,8 @@ class Database(rdbms_common.Database):
     # used by some code to switch styles of query
     implements_intersect = 1
 
+    insert_or_ignore = 'insert or ignore into %s (%s) values (%s)'
+
     hyperdb_to_sql_datatypes = {
         hyperdb.String : 'VARCHAR(255)',
         hyperdb.Date   : 'VARCHAR(30)',
@@ -106,7 +108,9 @@ class Database(rdbms_common.Database):
             conn = sqlite.connect(db=db)
             conn.db.sqlite_busy_handler(self.sqlite_busy_handler)
         else:
-            conn = sqlite.connect(db, timeout=self.config.RDBMS_SQLITE_TIMEOUT)
+            # a pooled connection may be reused by another thread
+            conn = sqlite.connect(db, timeout=self.config.RDBMS_SQLITE_TIMEOUT,
+                check_same_thread=not self.config.RDBMS_CONNECTION_POOL_SIZE)
             conn.row_factory = sqlite.Row
 
         # pysqlite2 / sqlite3 want us to store Unicode in the db but
@@ -114,10 +118,31 @@ class Database(rdbms_common.Database):
         # not what the other backends do, so we'll stick with UTF-8
         if sqlite_version in (2, 3):
             conn.text_factory = str
+            self.sql_set_pragmas(conn)
+            # pysqlite begins the transaction before the first change:
+            # take the write lock right then, waiting for it if needed,
+            # instead of failing later to upgrade a read lock
+            conn.isolation_level = 'IMMEDIATE'
 
         cursor = conn.cursor()
         return (conn, cursor)
 
+    def sql_set_pragmas(self, conn):
+        """Apply the SQLite settings of the [rdbms] config section"""
+        cursor = conn.cursor()
+        for name, value in (
+                ('journal_mode', self.config.RDBMS_SQLITE_JOURNAL_MODE),
+                ('synchronous', self.config.RDBMS_SQLITE_SYNCHRONOUS),
+                ('temp_store', self.config.RDBMS_SQLITE_TEMP_STORE)):
+            if value != 'default':
+                cursor.execute('pragma %s=%s'%(name, value))
+        for name, value in (
+                ('cache_size', self.config.RDBMS_SQLITE_CACHE_SIZE),
+                ('mmap_size', self.config.RDBMS_SQLITE_MMAP_SIZE)):
+            if value:
+                cursor.execute('pragma %s=%d'%(name, value))
+        cursor.close()
+
     def open_connection(self):
         # ensure files are group readable and writable
         os.umask(self.config.UMASK)
@@ -138,23 +163,33 @@ class Database(rdbms_common.Database):
     def create_version_2_tables(self):
         self.sql('create table otks (otk_key varchar, '
             'otk_value varchar, otk_time integer)')
-        self.sql('create index otks_key_idx on otks(otk_key)')
+        self.sql('create unique index otks_key_idx on otks(otk_key)')
         self.sql('create table sessions (session_key varchar, '
             'session_time integer, session_value varchar)')
-        self.sql('create index sessions_key_idx on '
+        self.sql('create unique index sessions_key_idx on '
                 'sessions(session_key)')
 
         # full-text indexing store
         self.sql('CREATE TABLE __textids (_class varchar, '
             '_itemid varchar, _prop varchar, _textid integer primary key) ')
-        self.sql('CREATE TABLE __words (_word varchar, '
-            '_textid integer)')
-        self.sql('CREATE INDEX words_word_ids ON __words(_word)')
-        self.sql('CREATE INDEX words_by_id ON __words (_textid)')
         self.sql('CREATE UNIQUE INDEX __textids_by_props ON '
                  '__textids (_class, _itemid, _prop)')
         sql = 'insert into ids (name, num) values (%s,%s)'%(self.arg, self.arg)
         self.sql(sql, ('__textids', 1))
+        self.create_word_tables()
+        self.create_schema_fingerprint_table()
+
+    def create_word_tables(self):
+        self.sql('CREATE TABLE __wordids (_wordid integer primary key, '
+            '_word varchar)')
+        self.sql('CREATE UNIQUE INDEX __wordids_by_word ON __wordids(_word)')
+        self.sql('CREATE TABLE __postings (_wordid integer, '
+            '_textid integer)')
+        self.sql('CREATE INDEX postings_by_word ON '
+                 '__postings (_wordid, _textid)')
+        self.sql('CREATE INDEX postings_by_id ON __postings (_textid)')
+        sql = 'insert into ids (name, num) values (%s,%s)'%(self.arg, self.arg)
+        self.sql(sql, ('__wordids', 1))
 
     def add_new_columns_v2(self):
         # update existing tables to have the new actor column
@@ -341,6 +376,11 @@ class Database(rdbms_common.Database):
         # open a new cursor for subsequent work
         self.cursor = self.conn.cursor()
 
+    def sql_insert_or_replace(self, table, columns, row):
+        sql = 'insert or replace into %s (%s) values (%s)'%(table,
+            ', '.join(columns), ', '.join([self.arg] * len(columns)))
+        self.sql(sql, tuple(row))
+
     def sql_index_exists(self, table_name, index_name):
         self.sql('pragma index_list(%s)'%table_name)
         for entry in self.cursor.fetchall():
@@ -352,18 +392,25 @@ class Database(rdbms_common.Database):
     def newid(self, classname):
         """ Generate a new id for the given class
         """
-        # get the next ID
+        return self.newids(classname, 1)[0]
+
+    def newids(self, classname, count):
+        """ Reserve a block of count ids for the given class
+
+        The counter is incremented before it's read: the statement
+        opens the transaction and takes the write lock at once, so no
+        other connection can read the same value in between, and there's
+        no read lock to upgrade (which fails while another writer holds
+        one too).
+        """
+        sql = 'update ids set num=num+%s where name=%s'%(self.arg, self.arg)
+        self.sql(sql, (count, classname))
         sql = 'select num from ids where name=%s'%self.arg
         self.sql(sql, (classname, ))
-        newid = int(self.cursor.fetchone()[0])
-
-        # update the counter
-        sql = 'update ids set num=%s where name=%s'%(self.arg, self.arg)
-        vals = (int(newid)+1, classname)
-        self.sql(sql, vals)
+        last = int(self.cursor.fetchone()[0])
 
-        # return as string
-        return str(newid)
+        # return as strings
+        return [str(id) for id in range(last - count, last)]
 
     def setid(self, classname, setid):
         """ Set the id counter: used during import of database
@@ -397,12 +444,20 @@ class Database(rdbms_common.Database):
 
 class sqliteClass:
     def filter(self, search_matches, filterspec, sort=(None,None),
-            group=(None,None)):
+            group=(None,None), limit=None, offset=None):
         """ If there's NO matches to a fetch, sqlite returns NULL
             instead of nothing
         """
         return [f for f in rdbms_common.Class.filter(self, search_matches,
-            filterspec, sort=sort, group=group) if f]
+            filterspec, sort=sort, group=group, limit=limit, offset=offset)
+            if f]
+
+    def filter_with_permissions(self, search_matches, filterspec, sort=[],
+            group=[], permission='View', userid=None, limit=None,
+            offset=None):
+        return [f for f in rdbms_common.Class.filter_with_permissions(self,
+            search_matches, filterspec, sort, group, permission, userid,
+            limit, offset) if f]
 
 class Class(sqliteClass, rdbms_common.Class):
     pass
@@ -1,4 +1,4 @@
-import re
+import re, sys, math, heapq
 
 from roundup import hyperdb
 
@@ -14,6 +14,16 @@ def _isLink(propclass):
     return (isinstance(propclass, hyperdb.Link) or
             isinstance(propclass, hyperdb.Multilink))
 
+# the word splitter of the processes of a pool made by Indexer.get_pool
+_get_words = None
+
+def _init_worker(get_words):
+    global _get_words
+    _get_words = get_words
+
+def _split(job):
+    return _get_words(*job)
+
 class Indexer:
     def __init__(self, db):
         self.stopwords = set(STOPWORDS)
@@ -27,9 +37,186 @@ class Indexer:
     def is_stopword(self, word):
         return word in self.stopwords
 
+    # Indexers splitting the text themselves define get_words(text,
+    # mime_type), returning a {word: count} dict (or None if the text
+    # isn't to be indexed at all), and add_words(entries), storing a list
+    # of (identifier, words) at once
+    get_words = None
+
+    def flush(self):
+        """Write the changes held back by the indexer to the database,
+        before the transaction is committed.
+        """
+        pass
+
+    def get_pool(self, workers):
+        """Return a multiprocessing pool of "workers" processes splitting
+        the texts given to add_texts, or None if they're to be split in
+        this process.
+        """
+        # the pool processes inherit the indexer when they're forked
+        if self.get_words is None or workers < 2 or sys.platform == 'win32':
+            return None
+        try:
+            import multiprocessing
+        except ImportError:
+            return None
+        return multiprocessing.Pool(workers, _init_worker, (self.get_words,))
+
+    def add_texts(self, texts, pool=None):
+        """Add a list of (identifier, text, mime_type) at once, splitting
+        the texts in the pool made by get_pool if there's one.
+        """
+        if self.get_words is None:
+            for identifier, text, mime_type in texts:
+                self.add_text(identifier, text, mime_type)
+            return
+        jobs = [(text, mime_type) for identifier, text, mime_type in texts]
+        if pool is None:
+            words = [self.get_words(*job) for job in jobs]
+        else:
+            words = pool.map(_split, jobs)
+        self.add_words(zip([t[0] for t in texts], words))
+
     def getHits(self, search_terms, klass):
         return self.find(search_terms)
 
+    def text_words(self, text):
+        """Return all the words of the text, in order and in upper case"""
+        if not isinstance(text, unicode):
+            text = unicode(text, "utf-8", "replace")
+        return [w.encode("utf-8") for w in re.findall(r'(?u)\b\w{%d,%d}\b'
+            % (self.minlength, self.maxlength), text.upper())]
+
+    def parse_query(self, text):
+        """Split a search text into a list of (kind, words) terms, kind
+        being 'word' for a single word, 'prefix' for a word followed by
+        "*" (matching all the words starting with it) and 'phrase' for
+        several words between double quotes (matching them in sequence).
+        Stop-words are left out, except in phrases.
+        """
+        if not isinstance(text, unicode):
+            text = unicode(text, "utf-8", "replace")
+        terms = []
+        for phrase, word, star in re.findall(r'(?u)"([^"]*)"?|(\w+)(\*?)',
+                text):
+            if phrase:
+                words = self.text_words(phrase)
+                if len(words) > 1:
+                    terms.append(('phrase', words))
+                    continue
+                word = phrase
+            words = self.text_words(word)
+            if len(words) != 1 or self.is_stopword(words[0]):
+                continue
+            terms.append((star and 'prefix' or 'word', words))
+        return terms
+
+    # the BM25 parameters: term frequency saturation and length weight
+    bm25_k1 = 1.2
+    bm25_b = 0.75
+
+    def bm25(self, tf, df, length, avglength, total):
+        """Return the BM25 score of a term found "tf" times in a text of
+        "length" words, and in "df" of the "total" texts indexed"""
+        idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        if avglength:
+            norm = 1 - self.bm25_b + self.bm25_b * length / avglength
+        else:
+            norm = 1
+        return idf * tf * (self.bm25_k1 + 1) / (tf + self.bm25_k1 * norm)
+
+    def find_ranked(self, terms):
+        """Return the {identifier: score} of the texts matching all the
+        terms of parse_query (phrases are only checked to have all their
+        words).
+
+        This fallback has no prefix matching nor ranking: a prefix is
+        looked up as a whole word and the scores are all 1.
+        """
+        words = []
+        for kind, termwords in terms:
+            words.extend([w for w in termwords if not self.is_stopword(w)])
+        return dict([(tuple([str(x) for x in row[:3]]), 1.0)
+            for row in self.find(words) or []])
+
+    def has_phrase(self, db, identifier, words):
+        """Check that the indexed text has the words in sequence"""
+        classname, itemid, prop = identifier
+        try:
+            text = db.getclass(classname).get(itemid, prop)
+        except (KeyError, IndexError):
+            return False
+        found = self.text_words(text or '')
+        n = len(words)
+        for i in range(len(found) - n + 1):
+            if found[i:i+n] == words:
+                return True
+        return False
+
+    def search_ranked(self, text, klass, limit=None, ignore={}):
+        """Search the items of the hyperdb Class "klass" matching all the
+        terms of the search "text" (see parse_query), directly or through
+        the items they link to.
+
+        Return a list of (nodeid, score) ordered best match first, the
+        score of an item adding up those of its matching texts. With a
+        "limit" only that many items are returned. Hits on the {class:
+        property} of "ignore" are ignored.
+
+        All the matching texts are scored before the best items are
+        picked, the limit doesn't shorten the search. For each phrase
+        the whole text of every match is read again to check that its
+        words are in sequence.
+        """
+        terms = self.parse_query(text)
+        if not terms:
+            return []
+        hits = self.find_ranked(terms)
+        for kind, words in terms:
+            if kind == 'phrase':
+                for identifier in list(hits):
+                    if not self.has_phrase(klass.db, identifier, words):
+                        del hits[identifier]
+
+        designator_propname = {}
+        for nm, propclass in klass.getprops().iteritems():
+            if _isLink(propclass):
+                designator_propname.setdefault(propclass.classname,
+                    []).append(nm)
+
+        # add up the scores of the items and of the items linked to
+        scores = {}
+        linked = {}
+        for (classname, nodeid, property), score in hits.iteritems():
+            if (classname, property) in ignore:
+                continue
+            if classname == klass.classname:
+                scores[nodeid] = scores.get(nodeid, 0) + score
+            elif classname in designator_propname:
+                d = linked.setdefault(classname, {})
+                d[nodeid] = d.get(nodeid, 0) + score
+        propspec = {}
+        for classname, d in linked.iteritems():
+            for propname in designator_propname[classname]:
+                propspec[propname] = d
+        if propspec:
+            propdefs = klass.getprops()
+            for resid in klass.find(**propspec):
+                resid = str(resid)
+                for propname, d in propspec.iteritems():
+                    v = klass.get(resid, propname)
+                    if isinstance(propdefs[propname], hyperdb.Link):
+                        v = v and [v] or []
+                    for nodeid in v:
+                        if nodeid in d:
+                            scores[resid] = scores.get(resid, 0) + d[nodeid]
+
+        key = lambda item: (item[1], -int(item[0]))
+        if limit is None:
+            return sorted(scores.iteritems(), key=key, reverse=True)
+        return heapq.nlargest(limit, scores.iteritems(), key=key)
+
     def search(self, search_terms, klass, ignore={}):
         """Display search results looking for [search, terms] associated
         with the hyperdb Class "klass". Ignore hits on {class: property}.
@@ -76,48 +76,54 @@ class Indexer(IndexerBase):
         '''Add some text associated with the (classname, nodeid, property)
         identifier.
         '''
-        # make sure the index is loaded
-        self.load_index()
-
-        # remove old entries for this identifier
-        if identifier in self.files:
-            self.purge_entry(identifier)
+        self.add_words([(identifier, self.get_words(text, mime_type))])
 
-        # split into words
-        words = self.splitter(text, mime_type)
-
-        # Find new file index, and assign it to identifier
-        # (_TOP uses trick of negative to avoid conflict with file index)
-        self.files['_TOP'] = (self.files['_TOP'][0]-1, None)
-        file_index = abs(self.files['_TOP'][0])
-        self.files[identifier] = (file_index, len(words))
-        self.fileids[file_index] = identifier
-
-        # find the unique words
+    def get_words(self, text, mime_type='text/plain'):
+        '''Return the {word: count} of the words of the text to index.
+        '''
         filedict = {}
-        for word in words:
+        for word in self.splitter(text, mime_type):
             if self.is_stopword(word):
                 continue
             if word in filedict:
                 filedict[word] = filedict[word]+1
             else:
                 filedict[word] = 1
+        return filedict
 
-        # now add to the totals
-        for word in filedict:
-            # each word has a dict of {identifier: count}
-            if word in self.words:
-                entry = self.words[word]
-            else:
-                # new word
-                entry = {}
-                self.words[word] = entry
+    def add_words(self, entries):
+        '''Add the words of a list of (identifier, {word: count}).
+        '''
+        # make sure the index is loaded
+        self.load_index()
 
-            # make a reference to the file for this word
-            entry[file_index] = filedict[word]
+        # remove old entries for these identifiers
+        self.purge_entries([e[0] for e in entries if e[0] in self.files])
+
+        for identifier, filedict in entries:
+            # Find new file index, and assign it to identifier
+            # (_TOP uses trick of negative to avoid conflict with file index)
+            self.files['_TOP'] = (self.files['_TOP'][0]-1, None)
+            file_index = abs(self.files['_TOP'][0])
+            self.files[identifier] = (file_index, sum(filedict.values()))
+            self.fileids[file_index] = identifier
+
+            # now add to the totals
+            for word in filedict:
+                # each word has a dict of {identifier: count}
+                if word in self.words:
+                    entry = self.words[word]
+                else:
+                    # new word
+                    entry = {}
+                    self.words[word] = entry
+
+                # make a reference to the file for this word
+                entry[file_index] = filedict[word]
 
         # save needed
         self.changed = 1
+        self.avglength = None
 
     def splitter(self, text, ftype):
         '''Split the contents of a text string into a list of 'words'
@@ -174,6 +180,49 @@ class Indexer(IndexerBase):
             return {}
         return list(hits.values())
 
+    # the average number of words of the texts, computed when needed
+    avglength = None
+
+    def find_ranked(self, terms):
+        '''Return the BM25 {identifier: score} of the texts matching all
+        the terms of parse_query
+        '''
+        self.load_index()
+        if not self.fileids:
+            return {}
+        if self.avglength is None:
+            lengths = [entry[1] for identifier, entry in self.files.iteritems()
+                if identifier != '_TOP']
+            self.avglength = float(sum(lengths)) / len(lengths)
+
+        # the {fileid: count} of each word or prefix to find
+        groups = []
+        for kind, words in terms:
+            if kind == 'prefix':
+                group = {}
+                for word, entry in self.words.iteritems():
+                    if word.startswith(words[0]):
+                        for fileid, count in entry.iteritems():
+                            group[fileid] = group.get(fileid, 0) + count
+                groups.append(group)
+            else:
+                groups.extend([self.words.get(word, {}) for word in words
+                    if not self.is_stopword(word)])
+        if not groups:
+            return {}
+        hits = set(min(groups, key=len))
+        for group in groups:
+            hits.intersection_update(group)
+
+        total = len(self.fileids)
+        scores = {}
+        for fileid in hits:
+            identifier = self.fileids[fileid]
+            length = self.files[identifier][1]
+            scores[identifier] = sum([self.bm25(group[fileid], len(group),
+                length, self.avglength, total) for group in groups])
+        return scores
+
     segments = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ#_-!"
     def load_index(self, reload=0, wordlist=None):
         # Unless reload is indicated, do not load twice
@@ -217,6 +266,7 @@ class Indexer(IndexerBase):
         self.files = db['FILES']
         self.fileids = db['FILEIDS']
         self.changed = 0
+        self.avglength = None
 
     def save_index(self):
         # only save if the index is loaded and changed
@@ -259,22 +309,36 @@ class Indexer(IndexerBase):
     def purge_entry(self, identifier):
         '''Remove a file from file index and word index
         '''
+        self.purge_entries([identifier])
+
+    def purge_entries(self, identifiers):
+        '''Remove several files from file index and word index
+        '''
         self.load_index()
 
-        if identifier not in self.files:
+        file_indexes = set()
+        for identifier in identifiers:
+            if identifier not in self.files:
+                continue
+            file_index = self.files[identifier][0]
+            del self.files[identifier]
+            del self.fileids[file_index]
+            file_indexes.add(file_index)
+        if not file_indexes:
             return
 
-        file_index = self.files[identifier][0]
-        del self.files[identifier]
-        del self.fileids[file_index]
-
         # The much harder part, cleanup the word index
         for key, occurs in self.words.iteritems():
-            if file_index in occurs:
+            if len(occurs) < len(file_indexes):
+                purged = [k for k in occurs if k in file_indexes]
+            else:
+                purged = [k for k in file_indexes if k in occurs]
+            for file_index in purged:
                 del occurs[file_index]
 
         # save needed
         self.changed = 1
+        self.avglength = None
 
     def index_loaded(self):
         return (hasattr(self,'fileids') and hasattr(self,'files') and
@@ -1,5 +1,6 @@
-""" This implements the full-text indexer over two RDBMS tables. The first
-is a mapping of words to occurance IDs. The second maps the IDs to (Class,
+""" This implements the full-text indexer over three RDBMS tables. The
+first is a dictionary of the words, numbering them. The second is a mapping
+of word numbers to occurance IDs. The third maps the IDs to (Class,
 propname, itemid) instances.
 """
 import re
@@ -7,10 +8,17 @@ import re
 from roundup.backends.indexer_common import Indexer as IndexerBase
 
 class Indexer(IndexerBase):
+    # the number of word ids remembered between transactions
+    wordids_cache_size = 100000
+
     def __init__(self, db):
         IndexerBase.__init__(self, db)
         self.db = db
         self.reindex = 0
+        # the words to store at commit, by identifier
+        self.pending = {}
+        # the ids of the words, by word
+        self.wordids = {}
 
     def close(self):
         """close the indexing database"""
@@ -22,6 +30,11 @@ class Indexer(IndexerBase):
         # not necessary - the RDBMS connection will handle this for us
         pass
 
+    def rollback(self):
+        """Forget the changes and the word ids of the transaction."""
+        self.pending = {}
+        self.wordids = {}
+
     def force_reindex(self):
         """Force a reindexing of the database.  This essentially
         empties the tables ids and index and sets a flag so
@@ -34,31 +47,13 @@ class Indexer(IndexerBase):
 
     def add_text(self, identifier, text, mime_type='text/plain'):
         """ "identifier" is  (classname, itemid, property) """
-        if mime_type != 'text/plain':
-            return
+        self.add_words([(identifier, self.get_words(text, mime_type))])
 
-        # Ensure all elements of the identifier are strings 'cos the itemid
-        # column is varchar even if item ids may be numbers elsewhere in the
-        # code. ugh.
-        identifier = tuple(map(str, identifier))
-
-        # first, find the id of the (classname, itemid, property)
-        a = self.db.arg
-        sql = 'select _textid from __textids where _class=%s and '\
-            '_itemid=%s and _prop=%s'%(a, a, a)
-        self.db.cursor.execute(sql, identifier)
-        r = self.db.cursor.fetchone()
-        if not r:
-            # not previously indexed
-            id = self.db.newid('__textids')
-            sql = 'insert into __textids (_textid, _class, _itemid, _prop)'\
-                ' values (%s, %s, %s, %s)'%(a, a, a, a)
-            self.db.cursor.execute(sql, (id, ) + identifier)
-        else:
-            id = int(r[0])
-            # clear out any existing indexed values
-            sql = 'delete from __words where _textid=%s'%a
-            self.db.cursor.execute(sql, (id, ))
+    def get_words(self, text, mime_type='text/plain'):
+        """Return the unique words of the text (as a {word: 1} dict) or
+        None if it's not to be indexed"""
+        if mime_type != 'text/plain':
+            return None
 
         # ok, find all the unique words in the text
         if not isinstance(text, unicode):
@@ -67,15 +62,202 @@ class Indexer(IndexerBase):
         wordlist = [w.encode("utf-8")
                     for w in re.findall(r'(?u)\b\w{%d,%d}\b'
                                         % (self.minlength, self.maxlength), text)]
-        words = set()
+        words = {}
         for word in wordlist:
             if self.is_stopword(word): continue
-            words.add(word)
+            words[word] = 1
+        return words
+
+    def add_words(self, entries):
+        """ Store the words of a list of (identifier, words) when the
+        transaction is committed """
+        # Ensure all elements of the identifier are strings 'cos the itemid
+        # column is varchar even if item ids may be numbers elsewhere in the
+        # code. ugh.
+        for identifier, words in entries:
+            if words is not None:
+                self.pending[tuple(map(str, identifier))] = words
+
+    def flush(self):
+        """ Write the words added since the last flush in bulk """
+        texts, self.pending = self.pending, {}
+        if not texts:
+            return
+
+        # first, find the ids of the (classname, itemid, property)
+        a = self.db.arg
+        itemids = {}
+        for classname, itemid, prop in texts:
+            itemids.setdefault((classname, prop), []).append(itemid)
+        textids = {}
+        for (classname, prop), ids in itemids.iteritems():
+            for batch in self.batches(ids):
+                sql = 'select _itemid, _textid from __textids where '\
+                    '_class=%s and _prop=%s and _itemid in (%s)'%(a, a,
+                    ','.join([a] * len(batch)))
+                self.db.cursor.execute(sql, [classname, prop] + batch)
+                for itemid, textid in self.db.cursor.fetchall():
+                    textids[classname, str(itemid), prop] = int(textid)
 
-        # for each word, add an entry in the db
-        sql = 'insert into __words (_word, _textid) values (%s, %s)'%(a, a)
-        words = [(word, id) for word in words]
-        self.db.cursor.executemany(sql, words)
+        # clear out any existing indexed values
+        for batch in self.batches(textids.values()):
+            sql = 'delete from __postings where _textid in (%s)'%','.join(
+                [a] * len(batch))
+            self.db.cursor.execute(sql, batch)
+
+        # the texts not previously indexed get a new id
+        new = [identifier for identifier in texts
+            if identifier not in textids]
+        rows = []
+        if new:
+            ids = self.db.newids('__textids', len(new))
+            for identifier, id in zip(new, ids):
+                textids[identifier] = id = int(id)
+                rows.append((id, ) + identifier)
+        if rows:
+            sql = 'insert into __textids (_textid, _class, _itemid, _prop)'\
+                ' values (%s, %s, %s, %s)'%(a, a, a, a)
+            self.db.cursor.executemany(sql, rows)
+
+        # number the words, then add an entry in the db for each of them
+        words = set()
+        for w in texts.itervalues():
+            words.update(w)
+        wordids = self.get_wordids(words, create=True)
+        rows = []
+        for identifier, words in texts.iteritems():
+            id = textids[identifier]
+            rows.extend([(wordids[word], id) for word in words])
+        if rows:
+            sql = 'insert into __postings (_wordid, _textid) '\
+                'values (%s, %s)'%(a, a)
+            self.db.cursor.executemany(sql, rows)
+
+    # the number of ids or words looked up or deleted by a single statement
+    batch_size = 500
+
+    def batches(self, values):
+        """ Split the list of values in lists of at most batch_size """
+        values = list(values)
+        return [values[i:i+self.batch_size]
+            for i in range(0, len(values), self.batch_size)]
+
+    def get_wordids(self, words, create=False):
+        """ Return the {word: id} of the words, numbering the ones not yet
+        in the index if "create" is true """
+        if len(self.wordids) > self.wordids_cache_size:
+            self.wordids = {}
+        missing = [w for w in words if w not in self.wordids]
+        self.load_wordids(missing)
+        if create:
+            new = [word for word in missing if word not in self.wordids]
+            if new:
+                ids = self.db.newids('__wordids', len(new))
+                rows = [(int(id), word) for word, id in zip(new, ids)]
+                self.db.sql_insert_or_ignore('__wordids',
+                    ('_wordid', '_word'), rows)
+                # another transaction may have numbered some of the words
+                # first, look up the ids that made it
+                self.load_wordids(new)
+        return dict([(w, self.wordids[w]) for w in words
+            if w in self.wordids])
+
+    def load_wordids(self, words):
+        """ Remember the ids of the words found in the index """
+        a = self.db.arg
+        for batch in self.batches(words):
+            sql = 'select _word, _wordid from __wordids where _word in '\
+                '(%s)'%','.join([a] * len(batch))
+            self.db.cursor.execute(sql, batch)
+            for word, wordid in self.db.cursor.fetchall():
+                if isinstance(word, unicode):
+                    word = word.encode('utf-8')
+                self.wordids[word] = int(wordid)
+
+    def find_ranked(self, terms):
+        """Return the BM25 {identifier: score} of the texts matching all
+        the terms of parse_query.
+
+        The index doesn't count the occurences of the words, so each one
+        counts once per text, and the average length of the texts is
+        taken over the matching ones.
+        """
+        self.flush()
+        a = self.db.arg
+
+        # the condition on the postings of each word or prefix to find,
+        # the words of a prefix are selected by the database
+        groups = []
+        for kind, words in terms:
+            if kind == 'prefix':
+                prefix = words[0]
+                for c in '!%_':
+                    prefix = prefix.replace(c, '!' + c)
+                groups.append(("_wordid in (select _wordid from __wordids "
+                    "where _word like %s escape '!')"%a, [prefix + '%']))
+            else:
+                words = [w for w in words if not self.is_stopword(w)]
+                wordids = self.get_wordids(words)
+                for w in words:
+                    if w not in wordids:
+                        return {}
+                    groups.append(('_wordid=%s'%a, [wordids[w]]))
+        if not groups:
+            return {}
+
+        # the number of texts each group is found in, then the texts
+        # having them all, rarest first
+        counts = []
+        for condition, args in groups:
+            sql = 'select count(distinct _textid) from __postings where '
+            self.db.cursor.execute(sql + condition, args)
+            df = int(self.db.cursor.fetchone()[0])
+            if not df:
+                return {}
+            counts.append((df, condition, args))
+        counts.sort()
+        hits = None
+        tfs = []
+        for df, condition, args in counts:
+            sql = 'select _textid, count(*) from __postings where '\
+                + condition
+            if hits is not None and len(hits) <= self.batch_size:
+                sql += ' and _textid in (%s)'%','.join([a] * len(hits))
+                args = args + list(hits)
+            self.db.cursor.execute(sql + ' group by _textid', args)
+            tf = dict([(int(row[0]), int(row[1]))
+                for row in self.db.cursor.fetchall()])
+            if hits is None:
+                hits = set(tf)
+            else:
+                hits.intersection_update(tf)
+            if not hits:
+                return {}
+            tfs.append((df, tf))
+
+        # the number of words of the matching texts
+        lengths = {}
+        for batch in self.batches(hits):
+            sql = 'select _textid, count(*) from __postings where _textid '\
+                'in (%s) group by _textid'%','.join([a] * len(batch))
+            self.db.cursor.execute(sql, batch)
+            for textid, count in self.db.cursor.fetchall():
+                lengths[int(textid)] = int(count)
+        avglength = float(sum(lengths.values())) / len(lengths)
+        self.db.cursor.execute('select count(*) from __textids')
+        total = int(self.db.cursor.fetchone()[0])
+
+        scores = {}
+        for batch in self.batches(hits):
+            sql = 'select _textid, _class, _itemid, _prop from __textids '\
+                'where _textid in (%s)'%','.join([a] * len(batch))
+            self.db.cursor.execute(sql, batch)
+            for textid, classname, itemid, prop in self.db.cursor.fetchall():
+                textid = int(textid)
+                scores[str(classname), str(itemid), str(prop)] = sum([
+                    self.bm25(tf[textid], df, lengths[textid], avglength,
+                    total) for df, tf in tfs])
+        return scores
 
     def find(self, wordlist):
         """look up all the words in the wordlist.
@@ -92,9 +274,17 @@ class Indexer(IndexerBase):
         if not l:
             return []
 
+        # all the words must be in the index
+        l = [isinstance(w, unicode) and w.encode('utf-8') or w for w in l]
+        self.flush()
+        wordids = self.get_wordids(set(l))
+        if len(wordids) < len(set(l)):
+            return []
+        l = wordids.values()
+
         if self.db.implements_intersect:
             # simple AND search
-            sql = 'select distinct(_textid) from __words where _word=%s'%self.db.arg
+            sql = 'select _textid from __postings where _wordid=%s'%self.db.arg
             sql = '\nINTERSECT\n'.join([sql]*len(l))
             self.db.cursor.execute(sql, tuple(l))
             r = self.db.cursor.fetchall()
@@ -108,14 +298,14 @@ class Indexer(IndexerBase):
         else:
             # A more complex version for MySQL since it doesn't implement INTERSECT
 
-            # Construct SQL statement to join __words table to itself
+            # Construct SQL statement to join __postings table to itself
             # multiple times.
-            sql = """select distinct(__words1._textid)
-                        from __words as __words1 %s
-                        where __words1._word=%s %s"""
+            sql = """select distinct(__postings1._textid)
+                        from __postings as __postings1 %s
+                        where __postings1._wordid=%s %s"""
 
-            join_tmpl = ' left join __words as __words%d using (_textid) \n'
-            match_tmpl = ' and __words%d._word=%s \n'
+            join_tmpl = ' left join __postings as __postings%d using (_textid) \n'
+            match_tmpl = ' and __postings%d._wordid=%s \n'
 
             join_list = []
             match_list = []
@@ -137,4 +327,3 @@ class Indexer(IndexerBase):
             self.db.cursor.execute(sql, tuple(map(int, r)))
 
         return self.db.cursor.fetchall()
-
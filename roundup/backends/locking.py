@@ -20,7 +20,7 @@
 # SOFTWARE.
 
 '''This module provides a generic interface to acquire and release
-exclusive access to a file.
+exclusive or shared access to a file.
 
 It should work on Unix and Windows.
 '''
@@ -28,16 +28,38 @@ __docformat__ = 'restructuredtext'
 
 from roundup.backends import portalocker
 
-def acquire_lock(path, block=1):
+def acquire_lock(path, block=1, shared=0):
     '''Acquire a lock for the given path
+
+    The lock is exclusive unless 'shared' is set, in which case any
+    number of shared locks may be held on the path at the same time.
+    A shared lock leaves the content of the file alone.
     '''
-    file = open(path, 'w')
-    if block:
-        portalocker.lock(file, portalocker.LOCK_EX)
+    if shared:
+        file = open(path, 'a+')
     else:
-        portalocker.lock(file, portalocker.LOCK_EX|portalocker.LOCK_NB)
+        file = open(path, 'w')
+    lock(file, block, shared)
     return file
 
+def change_lock(file, block=1, shared=0):
+    '''Turn our lock on the file into an exclusive or shared one
+
+    The old lock is released first, so other processes may get hold of
+    the file in between.
+    '''
+    portalocker.unlock(file)
+    lock(file, block, shared)
+
+def lock(file, block=1, shared=0):
+    if shared:
+        flags = portalocker.LOCK_SH
+    else:
+        flags = portalocker.LOCK_EX
+    if not block:
+        flags |= portalocker.LOCK_NB
+    portalocker.lock(file, flags)
+
 def release_lock(file):
     '''Release our lock on the given path
     '''
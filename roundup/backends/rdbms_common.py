@@ -52,7 +52,9 @@ the same name.
 __docformat__ = 'restructuredtext'
 
 # standard python modules
-import sys, os, time, re, errno, weakref, copy, logging, datetime
+import sys, os, time, re, errno, weakref, copy, logging, datetime, threading
+import ast, json
+from hashlib import sha1
 
 # roundup modules
 from roundup import hyperdb, date, password, roundupdb, security, support
@@ -97,6 +99,66 @@ def date_to_hyperdb_value(d):
     return date.Date (str(d).replace(' ', '.'))
 
 
+# Journal params are stored as JSON prefixed with this version tag.
+# Rows without the tag are in the historic repr() format.
+JOURNAL_JSON_TAG = '1:'
+
+def _journal_to_json(value):
+    """ Turn journal params into JSON-serialisable data. Values that JSON
+        can't represent are tagged with a single-key dict, the keys
+        aren't valid property names so they can't clash with params.
+    """
+    if isinstance(value, dict):
+        d = {}
+        for k, v in value.iteritems():
+            d[k] = _journal_to_json(v)
+        return d
+    if isinstance(value, list):
+        return [_journal_to_json(v) for v in value]
+    if isinstance(value, tuple):
+        return {'$t': [_journal_to_json(v) for v in value]}
+    if isinstance(value, date.Date):
+        return {'$d': value.serialise()}
+    if isinstance(value, date.Interval):
+        return {'$i': str(value)}
+    if isinstance(value, (password.Password, password.JournalPassword)):
+        return {'$p': str(value)}
+    return value
+
+_journal_json_tags = {
+    '$t': tuple,
+    '$d': date.Date,
+    '$i': date.Interval,
+    '$p': password.JournalPassword,
+}
+
+def _journal_from_json(value):
+    """ Reverse _journal_to_json, strings are returned UTF-8 encoded """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_journal_from_json(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            tag, v = value.items()[0]
+            if tag in _journal_json_tags:
+                return _journal_json_tags[tag](_journal_from_json(v))
+        d = {}
+        for k, v in value.iteritems():
+            d[k.encode('utf-8')] = _journal_from_json(v)
+        return d
+    return value
+
+def journal_dumps(params):
+    """ Serialise journal params for storage in the journal table """
+    return JOURNAL_JSON_TAG + json.dumps(_journal_to_json(params),
+        separators=(',', ':'))
+
+def journal_loads(params):
+    """ Decode journal params stored by journal_dumps """
+    return _journal_from_json(json.loads(params[len(JOURNAL_JSON_TAG):]))
+
+
 def connection_dict(config, dbnamestr=None):
     """ Used by Postgresql and MySQL to detemine the keyword args for
     opening the database connection."""
@@ -111,6 +173,171 @@ def connection_dict(config, dbnamestr=None):
     return d
 
 
+def _node_size(node):
+    """ Estimate the memory used by a cached node in bytes """
+    size = sys.getsizeof(node)
+    for name, value in node.iteritems():
+        size += sys.getsizeof(name) + sys.getsizeof(value)
+        if isinstance(value, list):
+            size += sum([sys.getsizeof(x) for x in value])
+    return size
+
+def _copy_node(node):
+    """ Copy a node dict so the copy may be modified (multilink values
+        are lists) without affecting the original.
+    """
+    d = {}
+    for name, value in node.iteritems():
+        if isinstance(value, list):
+            value = value[:]
+        d[name] = value
+    return d
+
+
+class SharedNodeCache:
+    """ A node cache shared by all connections of a process to the same
+        database, e.g. the threads of roundup-server.
+
+        Nodes are stored under (classname, nodeid, activity, columns):
+        as every change of a node updates its activity timestamp, an
+        entry is only found while the node is unchanged in the database.
+        Outdated entries are never returned and just age out of the LRU.
+    """
+    def __init__(self, size, maxbytes=0):
+        self.lru = support.LRUCache(size, maxbytes, _node_size)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Return a private copy of the node stored under key or None
+        """
+        self.lock.acquire()
+        try:
+            node = self.lru.get(key)
+        finally:
+            self.lock.release()
+        if node is None:
+            return None
+        return _copy_node(node)
+
+    def put(self, key, node):
+        """ Store a copy of the node, return the number of evicted nodes
+        """
+        node = _copy_node(node)
+        self.lock.acquire()
+        try:
+            return self.lru.put(key, node)
+        finally:
+            self.lock.release()
+
+_shared_node_caches = {}
+"""The process-wide node caches, one per database."""
+
+_shared_node_caches_lock = threading.Lock()
+"""A lock used to guard access to the shared node caches."""
+
+def get_shared_node_cache(key, size, maxbytes=0):
+    """ Return the process-wide SharedNodeCache for the database
+        identified by key, creating it if necessary.
+    """
+    _shared_node_caches_lock.acquire()
+    try:
+        cache = _shared_node_caches.get(key)
+        if cache is None:
+            cache = _shared_node_caches[key] = SharedNodeCache(size, maxbytes)
+        return cache
+    finally:
+        _shared_node_caches_lock.release()
+
+class ConnectionPool:
+    """ The idle connections of a process to one database, kept open for
+        reuse by the next Database instance instead of connecting anew.
+
+        Connections are handed out most recently used first and are
+        dropped once they're older than max_age seconds or were opened
+        by another process (before a fork). The schema the database
+        implements is remembered with the pool, so it's only read once
+        per process.
+    """
+    def __init__(self, size, max_age):
+        self.size = size
+        self.max_age = max_age
+        self.idle = []
+        self.schema = None
+        self.lock = threading.Lock()
+
+    def usable(self, created, pid):
+        return pid == os.getpid() and time.time() - created < self.max_age
+
+    def get(self):
+        """ Return an idle (connection, creation time) or None, and the
+            list of the expired connections that should be closed.
+        """
+        expired = []
+        self.lock.acquire()
+        try:
+            while self.idle:
+                conn, created, pid = self.idle.pop()
+                if self.usable(created, pid):
+                    return (conn, created), expired
+                if pid == os.getpid():
+                    expired.append(conn)
+            return None, expired
+        finally:
+            self.lock.release()
+
+    def put(self, conn, created):
+        """ Keep the connection for reuse, return False if it should be
+            closed instead.
+        """
+        pid = os.getpid()
+        if not self.usable(created, pid):
+            return False
+        self.lock.acquire()
+        try:
+            if len(self.idle) >= self.size:
+                return False
+            self.idle.append((conn, created, pid))
+            return True
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """ Close the idle connections and forget the schema, e.g. before
+            the database is dropped.
+        """
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, []
+            self.schema = None
+        finally:
+            self.lock.release()
+        for conn, created, pid in idle:
+            if pid == os.getpid():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+_connection_pools = {}
+"""The process-wide connection pools, one per database."""
+
+_connection_pools_lock = threading.Lock()
+"""A lock used to guard access to the connection pools."""
+
+def get_connection_pool(key, size, max_age):
+    """ Return the process-wide ConnectionPool for the database
+        identified by key, creating it if necessary.
+    """
+    _connection_pools_lock.acquire()
+    try:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            pool = _connection_pools[key] = ConnectionPool(size, max_age)
+        return pool
+    finally:
+        _connection_pools_lock.release()
+
+
 class IdListOptimizer:
     """ To prevent flooding the SQL parser of the underlaying
         db engine with "x IN (1, 2, 3, ..., <large number>)" collapses
@@ -164,7 +391,21 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         - some functionality is specific to the actual SQL database, hence
           the sql_* methods that are NotImplemented
         - we keep a cache of the latest N row fetches (where N is configurable).
+        - optionally nodes are also kept in a process-wide cache that is
+          shared between connections and survives commit() and rollback()
+          (unless the backend sets supports_shared_cache to false).
+        - optionally connections are returned to a process-wide pool on
+          close() and reused by the next instance.
     """
+    # whether the activity timestamp changes with every change of a node,
+    # which the process-wide node cache relies on to validate its nodes
+    supports_shared_cache = True
+
+    # insert a row unless it violates a unique index, formatted with the
+    # table, its columns and the placeholders of the values by
+    # sql_insert_or_ignore()
+    insert_or_ignore = 'insert into %s (%s) values (%s) on conflict do nothing'
+
     def __init__(self, config, journaltag=None):
         """ Open the database and load the schema from it.
         """
@@ -181,24 +422,52 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         # keep a cache of the N most recently retrieved rows of any kind
         # (classname, nodeid) = row
         self.cache_size = config.RDBMS_CACHE_SIZE
+        self.cache = support.LRUCache(self.cache_size,
+            config.RDBMS_CACHE_MAX_BYTES, _node_size)
         self.clearCache()
         self.stats = {'cache_hits': 0, 'cache_misses': 0, 'get_items': 0,
-            'filtering': 0}
+            'filtering': 0, 'cache_evictions': 0, 'shared_cache_hits': 0,
+            'shared_cache_misses': 0}
+
+        # the process-wide cache of nodes validated by their activity,
+        # nodes changed in the current transaction are never put there
+        self.shared_cache = None
+        if config.RDBMS_SHARED_CACHE_SIZE and self.supports_shared_cache:
+            self.shared_cache = get_shared_node_cache(
+                self.shared_cache_key(), config.RDBMS_SHARED_CACHE_SIZE,
+                config.RDBMS_CACHE_MAX_BYTES)
+        self.dirty_nodes = set()
+
+        # the process-wide pool of idle connections
+        self.pool = None
+        if config.RDBMS_CONNECTION_POOL_SIZE:
+            self.pool = get_connection_pool(self.shared_cache_key(),
+                config.RDBMS_CONNECTION_POOL_SIZE,
+                config.RDBMS_CONNECTION_MAX_AGE)
+        self.conn_created = time.time()
+        self.schema_pooled = False
 
         # database lock
         self.lockfile = None
 
         # open a connection to the database, creating the "conn" attribute
-        self.open_connection()
+        if not self.open_pooled_connection():
+            self.open_connection()
 
     def clearCache(self):
-        self.cache = {}
-        self.cache_lru = []
+        self.cache.clear()
         # upcall is necessary!
         roundupdb.Database.clearCache(self)
 
+    def shared_cache_key(self):
+        """ Identify the database for the process-wide node cache.
+        """
+        return (self.__class__.__module__, self.config.DATABASE,
+            self.config.RDBMS_NAME, self.config.RDBMS_HOST,
+            self.config.RDBMS_PORT)
+
     def getSessionManager(self):
-        return Sessions(self)
+        return self.open_sessions(Sessions)
 
     def getOTKManager(self):
         return OneTimeKeys(self)
@@ -210,6 +479,48 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         """
         raise NotImplemented
 
+    def open_pooled_connection(self):
+        """ Take a healthy connection from the pool, if there's one.
+
+            Return True if "conn", "cursor" and "database_schema" are set.
+        """
+        if self.pool is None:
+            return False
+        while 1:
+            entry, expired = self.pool.get()
+            for conn in expired:
+                self.close_pooled_connection(conn)
+            if entry is None:
+                return False
+            conn, created = entry
+            try:
+                cursor = conn.cursor()
+                cursor.execute('select 1')
+                cursor.fetchall()
+                conn.rollback()
+            except Exception:
+                # the server went away or the connection is broken,
+                # whatever the DB-API module's exception is
+                self.close_pooled_connection(conn)
+                continue
+            self.log_info('reuse pooled connection')
+            self.conn, self.cursor, self.conn_created = conn, cursor, created
+            schema = self.pool.schema
+            if schema is None:
+                self.load_dbschema()
+            else:
+                self.database_schema = copy.deepcopy(schema)
+                self.schema_pooled = True
+            return True
+
+    def close_pooled_connection(self, conn):
+        """ Close a connection dropped from the pool, ignoring errors.
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
     def sql(self, sql, args=None, cursor=None):
         """ Execute the sql with the optional args.
         """
@@ -239,6 +550,29 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             if not row: break
             yield row
 
+    def sql_insert_or_ignore(self, table, columns, rows):
+        """ Insert the rows, skipping those that violate a unique index
+        """
+        sql = self.insert_or_ignore%(table, ', '.join(columns),
+            ', '.join([self.arg] * len(columns)))
+        self.cursor.executemany(sql, rows)
+
+    def sql_insert_or_replace(self, table, columns, row):
+        """ Insert the row, or update the row having the same value in
+            the first column (which has a unique index)
+        """
+        a = self.arg
+        sql = 'update %s set %s where %s=%s'%(table, ', '.join(['%s=%s'%(
+            column, a) for column in columns[1:]]), columns[0], a)
+        self.sql(sql, tuple(row[1:]) + (row[0], ))
+        if self.cursor.rowcount == 0:
+            sql = 'insert into %s (%s) values (%s)'%(table,
+                ', '.join(columns), ', '.join([a] * len(columns)))
+            self.sql(sql, tuple(row))
+
+    def sql_drop_index(self, table_name, index_name):
+        self.sql('drop index %s'%index_name)
+
     def search_stringquote(self, value):
         """ Quote a search string to escape magic search characters
             '%' and '_', also need to quote '\' (first)
@@ -273,12 +607,66 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         self.sql('delete from schema')
         self.sql('insert into schema values (%s)'%self.arg, (s,))
 
+    def schema_fingerprint(self):
+        """ Hash the schema defined by our "classes" attribute, together
+            with the version of the database layout.
+        """
+        specs = []
+        for classname, spec in sorted(self.classes.iteritems()):
+            key, properties = spec.schema()
+            specs.append((classname, key, sorted(properties),
+                sorted(spec.getindexes().iteritems())))
+        return sha1(repr((self.current_db_version, specs))).hexdigest()
+
+    def load_schema_fingerprint(self):
+        """ Load the fingerprint of the schema the database implements
+        """
+        self.sql('select fingerprint from schema_fingerprint')
+        row = self.cursor.fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def save_schema_fingerprint(self, fingerprint):
+        self.sql('delete from schema_fingerprint')
+        self.sql('insert into schema_fingerprint values (%s)'%self.arg,
+            (fingerprint,))
+
+    def create_schema_fingerprint_table(self):
+        self.sql('create table schema_fingerprint (fingerprint varchar(40))')
+
     def post_init(self):
         """ Called once the schema initialisation has finished.
 
             We should now confirm that the schema defined by our "classes"
-            attribute actually matches the schema in the database.
+            attribute actually matches the schema in the database. This
+            is only done when the schema fingerprint stored in the
+            database differs from ours.
+        """
+        fingerprint = self.schema_fingerprint()
+        if (self.database_schema.get('version') != self.current_db_version
+                or self.load_schema_fingerprint() != fingerprint):
+            self.update_dbschema(fingerprint)
+
+        # reindex the db if necessary
+        if self.indexer.should_reindex():
+            self.reindex()
+
+        # commit
+        self.sql_commit()
+
+        # the schema is now verified, the pool doesn't need to read it
+        if self.pool is not None:
+            self.pool.schema = copy.deepcopy(self.database_schema)
+
+    def update_dbschema(self, fingerprint):
+        """ Bring the database up to date with our "classes" attribute
+            and store the new schema and its fingerprint.
         """
+        # the pooled schema may be outdated by another process
+        if self.schema_pooled:
+            self.load_dbschema()
+            self.schema_pooled = False
 
         # upgrade the database for column type changes, new internal
         # tables, etc.
@@ -286,15 +674,18 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
         # handle changes in the schema
         tables = self.database_schema['tables']
+        changed = {}
         for classname, spec in self.classes.iteritems():
             if classname in tables:
                 dbspec = tables[classname]
                 if self.update_class(spec, dbspec):
                     tables[classname] = spec.schema()
+                    changed[classname] = 1
                     save = 1
             else:
                 self.create_class(spec)
                 tables[classname] = spec.schema()
+                changed[classname] = 1
                 save = 1
 
         for classname, spec in list(tables.items()):
@@ -303,20 +694,73 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
                 del tables[classname]
                 save = 1
 
+        # handle changes in the property indexes
+        if self.update_property_indexes(changed):
+            save = 1
+
         # update the database version of the schema
         if save:
             self.save_dbschema()
+        self.save_schema_fingerprint(fingerprint)
 
-        # reindex the db if necessary
-        if self.indexer.should_reindex():
-            self.reindex()
+    def update_property_indexes(self, changed):
+        """ Create the indexes declared on the class properties and drop
+            the ones no longer declared. The tables of the classes in
+            'changed' were just created or altered, which may have lost
+            their indexes.
 
-        # commit
-        self.sql_commit()
+            Return boolean whether we need to save the schema.
+        """
+        old = self.database_schema.get('indexes', {})
+        new = {}
+        for classname, spec in self.classes.iteritems():
+            for propname, kind in spec.getindexes().iteritems():
+                new['%s.%s'%(classname, propname)] = kind
+
+        for name, kind in old.iteritems():
+            if new.get(name) != kind:
+                classname, propname = name.split('.')
+                if classname in self.classes:
+                    self.drop_property_index(classname, propname, kind)
+        for name, kind in new.iteritems():
+            classname, propname = name.split('.')
+            if old.get(name) != kind or classname in changed:
+                self.create_property_index(classname, propname, kind)
+
+        if old == new:
+            return 0
+        self.database_schema['indexes'] = new
+        return 1
+
+    def property_index_name(self, classname, propname, kind):
+        if kind == 'nocase':
+            return '_%s_%s_nidx'%(classname, propname)
+        return '_%s_%s_pidx'%(classname, propname)
+
+    def create_property_index(self, classname, propname, kind):
+        """ Index the column of the property, on its lowercased value for
+            caseless lookups
+        """
+        table_name = '_%s'%classname
+        index_name = self.property_index_name(classname, propname, kind)
+        if self.sql_index_exists(table_name, index_name):
+            return
+        column = '_%s'%propname
+        if kind == 'nocase':
+            column = 'lower(%s)'%column
+        self.sql('create index %s on %s(%s)'%(index_name, table_name,
+            column))
+
+    def drop_property_index(self, classname, propname, kind):
+        table_name = '_%s'%classname
+        index_name = self.property_index_name(classname, propname, kind)
+        if not self.sql_index_exists(table_name, index_name):
+            return
+        self.sql('drop index %s'%index_name)
 
     # update this number when we need to make changes to the SQL structure
     # of the backen database
-    current_db_version = 5
+    current_db_version = 9
     db_version_updated = False
     def upgrade_db(self):
         """ Update the SQL database to reflect changes in the backend code.
@@ -356,6 +800,25 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             self.log_info('upgrade to version 5')
             self.fix_version_4_tables()
 
+        if version < 6:
+            self.log_info('upgrade to version 6')
+            self.fix_version_5_tables()
+
+        if version < 7:
+            self.log_info('upgrade to version 7')
+            if version >= 2:
+                # version 1 got the current word tables above
+                self.fix_version_6_tables()
+
+        if version < 8:
+            self.log_info('upgrade to version 8')
+            if version >= 2:
+                self.fix_version_7_tables()
+
+        if version < 9:
+            self.log_info('upgrade to version 9')
+            self.fix_version_8_tables()
+
         self.database_schema['version'] = self.current_db_version
         self.db_version_updated = True
         return 1
@@ -383,6 +846,79 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             if klass.key:
                 self.add_class_key_required_unique_constraint(cn, klass.key)
 
+    def fix_version_5_tables(self):
+        # convert the journal params from repr() to JSON
+        tables = self.database_schema['tables']
+        for cn, klass in self.classes.iteritems():
+            if cn not in tables:
+                # new class, the journal table doesn't exist yet
+                continue
+            self.convert_journal_params(klass)
+
+    # number of words numbered per statement when upgrading to version 7
+    wordids_batch = 500
+
+    def fix_version_6_tables(self):
+        # the full-text index stores each word once in __wordids, the
+        # postings refer to it by number
+        self.create_word_tables()
+        select = ('select distinct _word from __words where _word > %s '
+            'order by _word limit %s'%(self.arg, self.wordids_batch))
+        insert = 'insert into __wordids (_wordid, _word) values (%s, %s)'%(
+            self.arg, self.arg)
+        count, last = 0, ''
+        while 1:
+            self.sql(select, (last, ))
+            words = [row[0] for row in self.cursor.fetchall()]
+            if not words:
+                break
+            self.cursor.executemany(insert, [(count+n+1, word)
+                for n, word in enumerate(words)])
+            count += len(words)
+            last = words[-1]
+        if count:
+            self.setid('__wordids', count)
+        self.sql('insert into __postings (_wordid, _textid) '
+            'select __wordids._wordid, __words._textid from __words, '
+            '__wordids where __wordids._word = __words._word')
+        self.sql('drop table __words')
+
+    def fix_version_7_tables(self):
+        # the fingerprint of the schema saves comparing it on every open
+        self.create_schema_fingerprint_table()
+
+    def fix_version_8_tables(self):
+        # the session and OTK keys are unique, so that a record is stored
+        # with a single statement; the records are dropped (as for version
+        # 4) in case a key was stored twice
+        for name in ('otk', 'session'):
+            table_name, index_name = '%ss'%name, '%ss_key_idx'%name
+            self.sql('delete from %s'%table_name)
+            if self.sql_index_exists(table_name, index_name):
+                self.sql_drop_index(table_name, index_name)
+            self.sql('create unique index %s on %s(%s_key)'%(index_name,
+                table_name, name))
+
+    def convert_journal_params(self, klass):
+        """Re-encode all journal params of the class that are still in
+        the historic repr() format."""
+        cn = klass.classname
+        properties = klass.getprops()
+        a = self.arg
+        self.sql('select distinct params from %s__journal'%cn)
+        rows = self.cursor.fetchall()
+        sql = 'update %s__journal set params=%s where params=%s'%(cn, a, a)
+        for (params,) in rows:
+            if params is None or params.startswith(JOURNAL_JSON_TAG):
+                continue
+            try:
+                value = journal_dumps(self._journal_unmarshal(params,
+                    properties))
+            except (UnicodeError, ValueError, SyntaxError):
+                self.log_info('keeping %s journal params %r'%(cn, params))
+                continue
+            self.sql(sql, (value, params))
+
     def _convert_journal_tables(self):
         """Get current journal table contents, drop the table and re-create"""
         c = self.cursor
@@ -437,21 +973,6 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         self.post_init()
 
 
-    def reindex(self, classname=None, show_progress=False):
-        if classname:
-            classes = [self.getclass(classname)]
-        else:
-            classes = list(self.classes.itervalues())
-        for klass in classes:
-            if show_progress:
-                for nodeid in support.Progress('Reindex %s'%klass.classname,
-                        klass.list()):
-                    klass.index(nodeid)
-            else:
-                for nodeid in klass.list():
-                    klass.index(nodeid)
-        self.indexer.save_index()
-
     hyperdb_to_sql_datatypes = {
         hyperdb.String : 'TEXT',
         hyperdb.Date   : 'TIMESTAMP',
@@ -854,6 +1375,13 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             sql = 'delete from _%s'%cn
             self.sql(sql)
 
+    def newids(self, classname, count):
+        """ Generate count new ids for the given class, in ascending order
+
+            Backends that can reserve a block of ids at once override this.
+        """
+        return [self.newid(classname) for i in range(count)]
+
     #
     # Nodes
     #
@@ -884,18 +1412,14 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
     def _cache_del(self, key):
         del self.cache[key]
-        self.cache_lru.remove(key)
 
     def _cache_refresh(self, key):
-        self.cache_lru.remove(key)
-        self.cache_lru.insert(0, key)
+        self.cache.refresh(key)
 
     def _cache_save(self, key, node):
-        self.cache[key] = node
-        # update the LRU
-        self.cache_lru.insert(0, key)
-        if len(self.cache_lru) > self.cache_size:
-            del self.cache[self.cache_lru.pop()]
+        evicted = self.cache.put(key, node)
+        if __debug__:
+            self.stats['cache_evictions'] += evicted
 
     def addnode(self, classname, nodeid, node):
         """ Add the specified node to its class's db.
@@ -931,6 +1455,7 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         key = (classname, nodeid)
         if key in self.cache:
             self._cache_del(key)
+        self.dirty_nodes.add(key)
 
         # figure the values to insert
         vals = []
@@ -980,6 +1505,7 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         key = (classname, nodeid)
         if key in self.cache:
             self._cache_del(key)
+        self.dirty_nodes.add(key)
 
         cl = self.classes[classname]
         props = cl.getprops()
@@ -1128,13 +1654,13 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         key = (classname, nodeid)
         if key in self.cache:
             # push us back to the top of the LRU
-            self._cache_refresh(key)
+            node = self.cache[key]
             if __debug__:
                 self.stats['cache_hits'] += 1
             # return the cached information
             if fetch_multilinks:
-                self._materialize_multilinks(classname, nodeid, self.cache[key])
-            return self.cache[key]
+                self._materialize_multilinks(classname, nodeid, node)
+            return node
 
         if __debug__:
             self.stats['cache_misses'] += 1
@@ -1145,6 +1671,30 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         cols, mls = self.determine_columns(list(cl.properties.iteritems()))
         scols = ','.join([col for col,dt in cols])
 
+        # try the process-wide cache, valid while the activity is unchanged
+        use_shared = self.shared_cache is not None and \
+            key not in self.dirty_nodes
+        if use_shared:
+            sql = 'select _activity from _%s where id=%s'%(classname,
+                self.arg)
+            self.sql(sql, (nodeid,))
+            values = self.sql_fetchone()
+            if values is None:
+                raise IndexError('no such %s node %s'%(classname, nodeid))
+            shared_key = (classname, nodeid, str(values[0]), scols)
+            node = self.shared_cache.get(shared_key)
+            if node is not None:
+                if __debug__:
+                    self.stats['shared_cache_hits'] += 1
+                if fetch_multilinks and mls:
+                    self._materialize_multilinks(classname, nodeid, node, mls)
+                self._cache_save(key, node)
+                if __debug__:
+                    self.stats['get_items'] += (time.time() - start_t)
+                return node
+            if __debug__:
+                self.stats['shared_cache_misses'] += 1
+
         # perform the basic property fetch
         sql = 'select %s from _%s where id=%s'%(scols, classname, self.arg)
         self.sql(sql, (nodeid,))
@@ -1154,6 +1704,27 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             raise IndexError('no such %s node %s'%(classname, nodeid))
 
         # make up the node
+        node = self._row_to_node(cl, cols, values)
+
+        if fetch_multilinks and mls:
+            self._materialize_multilinks(classname, nodeid, node, mls)
+
+        # save off in the cache
+        key = (classname, nodeid)
+        self._cache_save(key, node)
+        if use_shared:
+            # the activity may have changed since we looked it up above
+            activity = values[[c for c, dt in cols].index('_activity')]
+            shared_key = (classname, nodeid, str(activity), scols)
+            self.shared_cache.put(shared_key, node)
+
+        if __debug__:
+            self.stats['get_items'] += (time.time() - start_t)
+
+        return node
+
+    def _row_to_node(self, cl, cols, values):
+        """ Make up a node dict from a row of the class table """
         node = {}
         props = cl.getprops(protected=1)
         for col in range(len(cols)):
@@ -1166,18 +1737,82 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
             if value is not None:
                 value = self.to_hyperdb_value(props[name].__class__)(value)
             node[name] = value
+        return node
 
-        if fetch_multilinks and mls:
-            self._materialize_multilinks(classname, nodeid, node, mls)
+    # number of ids passed in one "in (...)" list when prefetching, kept
+    # well below the host variable limits of the databases
+    prefetch_chunk_size = 250
 
-        # save off in the cache
-        key = (classname, nodeid)
-        self._cache_save(key, node)
+    def supports_prefetch(self):
+        """See hyperdb.Database.supports_prefetch."""
+        return True
+
+    def prefetch(self, classname, nodeids, propnames=None):
+        """ Load the given nodes into the node cache using one query per
+            chunk of ids rather than one per node. Multilinks named in
+            'propnames' are loaded with one query per Multilink table.
+        """
+        if __debug__:
+            start_t = time.time()
+        cl = self.classes[classname]
+        mls = []
+        for name in propnames or []:
+            if isinstance(cl.properties.get(name), Multilink):
+                mls.append(name)
+
+        # find the nodes we have to fetch, no more than the cache holds
+        nodes = {}
+        missing = []
+        for nodeid in nodeids:
+            nodeid = str(nodeid)
+            if nodeid in nodes or not nodeid.isdigit():
+                continue
+            node = self.cache.peek((classname, nodeid))
+            nodes[nodeid] = node
+            if node is None:
+                missing.append(nodeid)
+        if len(missing) > self.cache.maxsize:
+            for nodeid in missing[self.cache.maxsize:]:
+                del nodes[nodeid]
+            missing = missing[:self.cache.maxsize]
+
+        if missing:
+            cols, x = self.determine_columns(list(cl.properties.iteritems()))
+            scols = ','.join([col for col,dt in cols] + ['id'])
+            for ids in self._chunks(missing):
+                sql = 'select %s from _%s where id in (%s)'%(scols,
+                    classname, ','.join([self.arg]*len(ids)))
+                self.sql(sql, ids)
+                for values in self.cursor.fetchall():
+                    # XXX numeric ids
+                    nodeid = str(values[len(cols)])
+                    node = self._row_to_node(cl, cols, values)
+                    self._cache_save((classname, nodeid), node)
+                    nodes[nodeid] = node
+
+        for propname in mls:
+            todo = [nodeid for nodeid, node in nodes.iteritems()
+                if node is not None and propname not in node]
+            for ids in self._chunks(todo):
+                sql = 'select nodeid,linkid from %s_%s where nodeid in (%s)'%(
+                    classname, propname, ','.join([self.arg]*len(ids)))
+                self.sql(sql, ids)
+                links = {}
+                for nodeid, linkid in self.cursor.fetchall():
+                    # XXX numeric ids
+                    links.setdefault(str(nodeid), []).append(int(linkid))
+                for nodeid in ids:
+                    items = links.get(nodeid, [])
+                    items.sort()
+                    nodes[nodeid][propname] = [str(x) for x in items]
 
         if __debug__:
             self.stats['get_items'] += (time.time() - start_t)
 
-        return node
+    def _chunks(self, ids):
+        """ Split a list of ids into prefetch_chunk_size sized lists """
+        size = self.prefetch_chunk_size
+        return [ids[i:i+size] for i in range(0, len(ids), size)]
 
     def destroynode(self, classname, nodeid):
         """Remove a node from the database. Called exclusively by the
@@ -1193,6 +1828,7 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         # see if we have this node cached
         if (classname, nodeid) in self.cache:
             del self.cache[(classname, nodeid)]
+        self.dirty_nodes.add((classname, nodeid))
 
         # see if there's any obvious commit actions that we should get rid of
         for entry in self.transactions[:]:
@@ -1264,11 +1900,7 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         self.log_debug('addjournal %s%s %r %s %s %r'%(classname,
             nodeid, journaldate, journaltag, action, params))
 
-        # make the journalled data marshallable
-        if isinstance(params, type({})):
-            self._journal_marshal(params, classname)
-
-        params = repr(params)
+        params = self._journal_dumps(params, classname)
 
         dc = self.to_sql_value(hyperdb.Date)
         journaldate = dc(journaldate)
@@ -1291,14 +1923,22 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
                 classname, nodeid, journaldate, journaltag, action,
                 params))
 
-            # make the journalled data marshallable
-            if isinstance(params, type({})):
-                self._journal_marshal(params, classname)
-            params = repr(params)
+            params = self._journal_dumps(params, classname)
 
             self.save_journal(classname, cols, nodeid, dc(journaldate),
                 journaltag, action, params)
 
+    def _journal_dumps(self, params, classname):
+        """Serialise the journal params. Strings that aren't valid UTF-8
+        can't be stored as JSON, these params use the historic format."""
+        try:
+            return journal_dumps(params)
+        except UnicodeError:
+            if isinstance(params, type({})):
+                params = params.copy()
+                self._journal_marshal(params, classname)
+            return repr(params)
+
     def _journal_marshal(self, params, classname):
         """Convert the journal params values into safely repr'able and
         eval'able values."""
@@ -1332,28 +1972,36 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         res = []
         properties = self.getclass(classname).getprops()
         for nodeid, date_stamp, user, action, params in journal:
-            params = eval(params)
-            if isinstance(params, type({})):
-                for param, value in params.iteritems():
-                    if not value:
-                        continue
-                    property = properties.get(param, None)
-                    if property is None:
-                        # deleted property
-                        continue
-                    cvt = self.to_hyperdb_value(property.__class__)
-                    if isinstance(property, Password):
-                        params[param] = password.JournalPassword(value)
-                    elif isinstance(property, Date):
-                        params[param] = cvt(value)
-                    elif isinstance(property, Interval):
-                        params[param] = cvt(value)
-                    elif isinstance(property, Boolean):
-                        params[param] = cvt(value)
+            if params.startswith(JOURNAL_JSON_TAG):
+                params = journal_loads(params)
+            else:
+                params = self._journal_unmarshal(params, properties)
             # XXX numeric ids
             res.append((str(nodeid), dc(date_stamp), user, action, params))
         return res
 
+    def _journal_unmarshal(self, params, properties):
+        """Decode journal params stored in the historic repr() format."""
+        params = ast.literal_eval(params)
+        if isinstance(params, type({})):
+            for param, value in params.iteritems():
+                if not value:
+                    continue
+                property = properties.get(param, None)
+                if property is None:
+                    # deleted property
+                    continue
+                cvt = self.to_hyperdb_value(property.__class__)
+                if isinstance(property, Password):
+                    params[param] = password.JournalPassword(value)
+                elif isinstance(property, Date):
+                    params[param] = cvt(value)
+                elif isinstance(property, Interval):
+                    params[param] = cvt(value)
+                elif isinstance(property, Boolean):
+                    params[param] = cvt(value)
+        return params
+
     def save_journal(self, classname, cols, nodeid, journaldate,
             journaltag, action, params):
         """ Save the journal entry to the database
@@ -1408,6 +2056,9 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
         The only backend this seems to affect is postgres.
         """
+        # write the full-text index changes held back by the indexer
+        self.indexer.flush()
+
         # commit the database
         self.sql_commit(fail_ok)
 
@@ -1423,8 +2074,9 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
         # clear the cache: Don't carry over cached values from one
         # transaction to the next (there may be other changes from other
-        # transactions)
+        # transactions). The shared cache is validated on each use.
         self.clearCache()
+        self.dirty_nodes = set()
 
     def sql_rollback(self):
         self.conn.rollback()
@@ -1438,6 +2090,7 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
         logging.getLogger('roundup.hyperdb').info('rollback')
 
         self.sql_rollback()
+        self.indexer.rollback()
 
         # roll back "other" transaction stuff
         for method, args in self.transactions:
@@ -1448,16 +2101,34 @@ class Database(FileStorage, hyperdb.Database, roundupdb.Database):
 
         # clear the cache
         self.clearCache()
+        self.dirty_nodes = set()
 
     def sql_close(self):
         logging.getLogger('roundup.hyperdb').info('close')
         self.conn.close()
 
     def close(self):
-        """ Close off the connection.
+        """ Close off the connection, or give it back to the pool.
+
+            Uncommitted changes are rolled back either way. Closing the
+            database again does nothing.
         """
+        if self.conn is None:
+            return
         self.indexer.close()
-        self.sql_close()
+        pooled = False
+        if self.pool is not None:
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+            else:
+                pooled = self.pool.put(self.conn, self.conn_created)
+        if pooled:
+            self.log_info('return connection to the pool')
+        else:
+            self.sql_close()
+        self.conn = self.cursor = None
 
 #
 # The base Class class
@@ -1473,6 +2144,10 @@ class Class(hyperdb.Class):
     # We define the default here, can be changed in derivative class
     case_insensitive_like = 'LIKE'
 
+    # How stringFind compares a column with a lowercased value, written so
+    # that a 'nocase' index of the property is used.
+    case_insensitive_equal = 'lower(%s)=%s'
+
     def schema(self):
         """ A dumpable version of the schema that we can store in the
             database
@@ -2189,7 +2864,8 @@ class Class(hyperdb.Class):
             args.append(requirements[propname].lower())
 
         # generate the where clause
-        s = ' and '.join(['lower(_%s)=%s'%(col, self.db.arg) for col in where])
+        s = ' and '.join([self.case_insensitive_equal%('_'+col, self.db.arg)
+            for col in where])
         sql = 'select id from _%s where %s and __retired__=%s'%(
             self.classname, s, self.db.arg)
         args.append(0)
@@ -2332,13 +3008,20 @@ class Class(hyperdb.Class):
                 multilink_table, ','.join([self.db.arg] * len(v)))
             return where, v, True # True to indicate original
 
-    def _filter_sql (self, search_matches, filterspec, srt=[], grp=[], retr=0):
+    def _filter_sql (self, search_matches, filterspec, srt=[], grp=[], retr=0,
+            permfilters=None, subselect=False, limit=None, offset=None,
+            count=False):
         """ Compute the proptree and the SQL/ARGS for a filter.
         For argument description see filter below.
         We return a 3-tuple, the proptree, the sql and the sql-args
         or None if no SQL is necessary.
         The flag retr serves to retrieve *all* non-Multilink properties
         (for filling the cache during a filter_iter)
+        If permfilters is a list of filterspecs, only nodes matching
+        any of them are returned (see Security.permissionFilters).
+        With subselect set the SQL selects just the ids, unordered,
+        with count set it just counts them.
+        The limit and offset are only applied if _sql_limit says so.
         """
         # we can't match anything if search_matches is empty
         if not search_matches and search_matches is not None:
@@ -2609,6 +3292,18 @@ class Class(hyperdb.Class):
             where.append('_%s.id in (%s)'%(icn, s))
             args = args + [x for x in search_matches]
 
+        # restrict to the nodes matching any of the permission filters
+        if permfilters is not None and {} not in permfilters:
+            subs = []
+            for fs in permfilters:
+                sq = self._filter_sql(None, fs, subselect=True)
+                if sq is not None:
+                    subs.append('_%s.id in (%s)'%(icn, sq[1]))
+                    args = args + list(sq[2])
+            if not subs:
+                return None
+            where.append('(%s)'%' or '.join(subs))
+
         # construct the SQL
         frum.append('_'+icn)
         frum = ','.join(frum)
@@ -2621,6 +3316,13 @@ class Class(hyperdb.Class):
             # don't distinct()
             cols[0] = 'distinct(_%s.id)'%icn
 
+        if subselect or count:
+            col = cols[0]
+            if count:
+                col = 'count(%s)'%col
+            sql = 'select %s from %s %s%s'%(col, frum, ' '.join(loj), where)
+            return proptree, sql, tuple(args)
+
         order = []
         # keep correct sequence of order attributes.
         for sa in proptree.sortattr:
@@ -2631,6 +3333,8 @@ class Class(hyperdb.Class):
             order = ' order by %s'%(','.join(order))
         else:
             order = ''
+        if self._sql_limit(proptree, limit):
+            order += ' limit %d offset %d'%(limit, offset or 0)
 
         cols = ','.join(cols)
         loj = ' '.join(loj)
@@ -2639,7 +3343,14 @@ class Class(hyperdb.Class):
         __traceback_info__ = (sql, args)
         return proptree, sql, args
 
-    def filter(self, search_matches, filterspec, sort=[], group=[]):
+    def _sql_limit(self, proptree, limit):
+        """Return True if the limit and offset of a filter can be left
+        to the database: the SQL must produce the final order.
+        """
+        return limit is not None and proptree.sort_done()
+
+    def filter(self, search_matches, filterspec, sort=[], group=[],
+            limit=None, offset=None):
         """Return a list of the ids of the active nodes in this class that
         match the 'filter' spec, sorted by the group spec and then the
         sort spec
@@ -2653,6 +3364,11 @@ class Class(hyperdb.Class):
 
         "search_matches" is a container type or None
 
+        "limit" and "offset" select a part of the sorted result: at most
+        "limit" ids are returned, skipping the first "offset" ones.
+        They are passed on to the database unless we have to sort the
+        result ourselves.
+
         The filter must match all properties specificed. If the property
         value to match is a list:
 
@@ -2662,7 +3378,82 @@ class Class(hyperdb.Class):
         if __debug__:
             start_t = time.time()
 
-        sq = self._filter_sql (search_matches, filterspec, sort, group)
+        sq = self._filter_sql (search_matches, filterspec, sort, group,
+            limit=limit, offset=offset)
+        l = self._filter_ids(sq, limit, offset)
+
+        if __debug__:
+            self.db.stats['filtering'] += (time.time() - start_t)
+        return l
+
+    def filter_with_permissions(self, search_matches, filterspec, sort=[],
+            group=[], permission='View', userid=None, limit=None,
+            offset=None):
+        """See hyperdb.Class.filter_with_permissions.
+
+        The filter functions of the Permissions are ANDed into the
+        query, so only permitted nodes are read from the database.
+        If some Permission has a check but no filter function we check
+        each node found instead.
+        """
+        filters = None
+        if self.supports_subselects():
+            filters = self.db.security.permissionFilters(permission, userid,
+                self.classname)
+        if filters is None:
+            return hyperdb.Class.filter_with_permissions(self,
+                search_matches, filterspec, sort, group, permission, userid,
+                limit, offset)
+
+        if __debug__:
+            start_t = time.time()
+
+        sq = self._filter_sql(search_matches, filterspec, sort, group,
+            permfilters=filters, limit=limit, offset=offset)
+        l = self._filter_ids(sq, limit, offset)
+
+        if __debug__:
+            self.db.stats['filtering'] += (time.time() - start_t)
+        return l
+
+    def filter_count(self, search_matches, filterspec, permission=None,
+            userid=None):
+        """See hyperdb.Class.filter_count.
+
+        The nodes are counted by the database.
+        """
+        filters = None
+        if permission is not None:
+            if self.supports_subselects():
+                filters = self.db.security.permissionFilters(permission,
+                    userid, self.classname)
+            if filters is None:
+                return hyperdb.Class.filter_count(self, search_matches,
+                    filterspec, permission, userid)
+
+        sq = self._filter_sql(search_matches, filterspec,
+            permfilters=filters, count=True)
+        if sq is None:
+            return 0
+        proptree, sql, args = sq
+        self.db.sql(sql, args)
+        return int(self.db.cursor.fetchone()[0])
+
+    def supports_limit(self):
+        """See hyperdb.Class.supports_limit."""
+        return True
+
+    def supports_permission_filters(self, permission, userid):
+        """See hyperdb.Class.supports_permission_filters."""
+        return self.supports_subselects() and \
+            self.db.security.permissionFilters(permission, userid,
+                self.classname) is not None
+
+    def _filter_ids(self, sq, limit=None, offset=None):
+        """Run the query computed by _filter_sql and return the sorted
+        list of ids found, limited as requested unless the query
+        already was.
+        """
         # nothing to match?
         if sq is None:
             return []
@@ -2680,12 +3471,12 @@ class Class(hyperdb.Class):
         # XXX numeric ids
         l = [str(row[0]) for row in l]
         l = proptree.sort (l)
-
-        if __debug__:
-            self.db.stats['filtering'] += (time.time() - start_t)
+        if not self._sql_limit(proptree, limit):
+            l = self._limit_ids(l, limit, offset)
         return l
 
-    def filter_iter(self, search_matches, filterspec, sort=[], group=[]):
+    def filter_iter(self, search_matches, filterspec, sort=[], group=[],
+            limit=None, offset=None):
         """Iterator similar to filter above with same args.
         Limitation: We don't sort on multilinks.
         This uses an optimisation: We put all nodes that are in the
@@ -2694,11 +3485,18 @@ class Class(hyperdb.Class):
         a join) from the database because the nodes are already in the
         cache. We're using our own temporary cursor.
         """
-        sq = self._filter_sql(search_matches, filterspec, sort, group, retr=1)
+        sq = self._filter_sql(search_matches, filterspec, sort, group, retr=1,
+            limit=limit, offset=offset)
         # nothing to match?
         if sq is None:
             return
         proptree, sql, args = sq
+        if not self._sql_limit(proptree, limit):
+            # we don't sort, so the SQL order is what we return anyway
+            skip = offset or 0
+        else:
+            skip = 0
+            limit = None
         cursor = self.db.conn.cursor()
         self.db.sql(sql, args, cursor)
         classes = {}
@@ -2713,9 +3511,14 @@ class Class(hyperdb.Class):
                 assert (name)
                 classes[key][name] = p
                 p.to_hyperdb = self.db.to_hyperdb_value(p.propclass.__class__)
-        while True:
+        while limit is None or limit > 0:
             row = cursor.fetchone()
             if not row: break
+            if skip:
+                skip -= 1
+                continue
+            if limit is not None:
+                limit -= 1
             # populate cache with current items
             for (classname, ptid), pt in classes.iteritems():
                 nodeid = str(row[pt['id'].sql_idx])
@@ -2788,14 +3591,21 @@ class Class(hyperdb.Class):
                 raise ValueError(key)
         self.properties.update(properties)
 
-    def index(self, nodeid):
-        """Add (or refresh) the node to search indexes
-        """
+    def index_texts(self, nodeid):
+        """ Return the texts of the node to add to the search indexes """
+        texts = []
         # find all the String properties that have indexme
         for prop, propclass in self.getprops().iteritems():
-            if isinstance(propclass, String) and propclass.indexme:
-                self.db.indexer.add_text((self.classname, nodeid, prop),
-                    str(self.get(nodeid, prop)))
+            if isinstance(propclass, hyperdb.String) and propclass.indexme:
+                # index them under (classname, nodeid, property)
+                try:
+                    value = str(self.get(nodeid, prop))
+                except IndexError:
+                    # node has been destroyed
+                    continue
+                texts.append(((self.classname, nodeid, prop), value,
+                    'text/plain'))
+        return texts
 
     #
     # import / export support
@@ -3035,17 +3845,18 @@ class FileClass(hyperdb.FileClass, Class):
         self.fireReactors('set', itemid, oldvalues)
         return propvalues
 
-    def index(self, nodeid):
-        """ Add (or refresh) the node to search indexes.
+    def index_texts(self, nodeid):
+        """ Return the texts of the node to add to the search indexes.
 
         Use the content-type property for the content property.
         """
+        texts = []
         # find all the String properties that have indexme
         for prop, propclass in self.getprops().iteritems():
             if prop == 'content' and propclass.indexme:
                 mime_type = self.get(nodeid, 'type', self.default_mime_type)
-                self.db.indexer.add_text((self.classname, nodeid, 'content'),
-                    str(self.get(nodeid, 'content')), mime_type)
+                texts.append(((self.classname, nodeid, 'content'),
+                    str(self.get(nodeid, 'content')), mime_type))
             elif isinstance(propclass, hyperdb.String) and propclass.indexme:
                 # index them under (classname, nodeid, property)
                 try:
@@ -3053,7 +3864,9 @@ class FileClass(hyperdb.FileClass, Class):
                 except IndexError:
                     # node has been destroyed
                     continue
-                self.db.indexer.add_text((self.classname, nodeid, prop), value)
+                texts.append(((self.classname, nodeid, prop), value,
+                    'text/plain'))
+        return texts
 
 # XXX deviation from spec - was called ItemClass
 class IssueClass(Class, roundupdb.IssueClass):
@@ -3066,7 +3879,8 @@ class IssueClass(Class, roundupdb.IssueClass):
         is raised.
         """
         if 'title' not in properties:
-            properties['title'] = hyperdb.String(indexme='yes')
+            properties['title'] = hyperdb.String(indexme='yes',
+                index='nocase')
         if 'messages' not in properties:
             properties['messages'] = hyperdb.Multilink("msg")
         if 'files' not in properties:
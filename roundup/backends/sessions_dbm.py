@@ -12,6 +12,7 @@ from cgi import escape
 from roundup import hyperdb
 from roundup.i18n import _
 from roundup.anypy.dbm_ import anydbm, whichdb, key_in
+from roundup.backends import locking
 
 class BasicDatabase:
     ''' Provide a nice encapsulation of an anydbm store.
@@ -23,6 +24,9 @@ class BasicDatabase:
     def __init__(self, db):
         self.config = db.config
         self.dir = db.config.DATABASE
+        self.refresh_interval = db.config.WEB_SESSION_REFRESH_INTERVAL
+        # the lock file of each open handle, by id of the handle
+        self.lockfiles = {}
         os.umask(db.config.UMASK)
 
     def exists(self, infoid):
@@ -30,7 +34,7 @@ class BasicDatabase:
         try:
             return key_in(db, infoid)
         finally:
-            db.close()
+            self.closedb(db)
 
     def clear(self):
         path = os.path.join(self.dir, self.name)
@@ -68,7 +72,7 @@ class BasicDatabase:
                 raise KeyError('No such %s "%s"'%(self.name, escape(infoid)))
             return values.get(value, None)
         finally:
-            db.close()
+            self.closedb(db)
 
     def getall(self, infoid):
         db = self.opendb('c')
@@ -80,7 +84,7 @@ class BasicDatabase:
             except KeyError:
                 raise KeyError('No such %s "%s"'%(self.name, escape(infoid)))
         finally:
-            db.close()
+            self.closedb(db)
 
     def set(self, infoid, **newvalues):
         db = self.opendb('c')
@@ -92,14 +96,14 @@ class BasicDatabase:
             values.update(newvalues)
             db[infoid] = marshal.dumps(values)
         finally:
-            db.close()
+            self.closedb(db)
 
     def list(self):
         db = self.opendb('r')
         try:
             return list(db.keys())
         finally:
-            db.close()
+            self.closedb(db)
 
     def destroy(self, infoid):
         db = self.opendb('c')
@@ -107,26 +111,45 @@ class BasicDatabase:
             if key_in(db, infoid):
                 del db[infoid]
         finally:
-            db.close()
+            self.closedb(db)
 
     def opendb(self, mode):
         '''Low-level database opener that gets around anydbm/dbm
            eccentricities.
+
+           The store stays locked until the handle is passed to closedb(),
+           as several tracker databases may use it at the same time.
         '''
         # figure the class db type
         path = os.path.join(os.getcwd(), self.dir, self.name)
-        if self._db_type is None:
-            self.cache_db_type(path)
-
-        db_type = self._db_type
+        lockfile = locking.acquire_lock(path + '.lock', shared=(mode == 'r'))
+        try:
+            if self._db_type is None:
+                self.cache_db_type(path)
 
-        # new database? let anydbm pick the best dbm
-        if not db_type:
-            return anydbm.open(path, 'c')
+            db_type = self._db_type
 
-        # open the database with the correct module
-        dbm = __import__(db_type)
-        return dbm.open(path, mode)
+            # new database? let anydbm pick the best dbm
+            if not db_type:
+                db = anydbm.open(path, 'c')
+            else:
+                # open the database with the correct module
+                dbm = __import__(db_type)
+                db = dbm.open(path, mode)
+        except:
+            self.unlock(lockfile)
+            raise
+        self.lockfiles[id(db)] = lockfile
+        return db
+
+    def closedb(self, db):
+        lockfile = self.lockfiles.pop(id(db))
+        db.close()
+        self.unlock(lockfile)
+
+    def unlock(self, lockfile):
+        locking.release_lock(lockfile)
+        lockfile.close()
 
     def commit(self):
         pass
@@ -135,11 +158,17 @@ class BasicDatabase:
         pass
 
     def updateTimestamp(self, sessid):
-        ''' don't update every hit - once a minute should be OK '''
+        ''' Mark the record as used. The timestamp isn't updated on every
+            hit, only when it's older than the refresh interval.
+
+            Return whether the database was changed.
+        '''
         sess = self.get(sessid, '__timestamp', None)
         now = time.time()
-        if sess is None or now > sess + 60:
+        if sess is None or now > sess + self.refresh_interval:
             self.set(sessid, __timestamp=now)
+            return True
+        return False
 
     def clean(self):
         ''' Remove session records that haven't been used for a week. '''
@@ -0,0 +1,142 @@
+"""This module defines a session store kept in the memory of the process.
+
+It's much faster than storing the sessions in the tracker database, but
+the sessions are lost when the process exits and aren't seen by the
+other processes: only use it with a server running the trackers in a
+single process (roundup-server in "thread" or "debug" mode, a
+multi-threaded WSGI server...). At most "session_cache_size" sessions
+are kept, the least recently used ones are forgotten first.
+"""
+__docformat__ = 'restructuredtext'
+
+import threading, time
+
+from cgi import escape
+from roundup.support import LRUCache
+
+# the stores, by name and database directory
+_stores = {}
+_lock = threading.Lock()
+
+class BasicDatabase:
+    ''' Provide a nice encapsulation of an in-memory LRU store.
+
+        Keys are id strings, values are dicts, copied in and out.
+    '''
+    def __init__(self, db):
+        self.refresh_interval = db.config.WEB_SESSION_REFRESH_INTERVAL
+        key = (self.name, db.config.DATABASE)
+        _lock.acquire()
+        try:
+            if key not in _stores:
+                _stores[key] = LRUCache(db.config.WEB_SESSION_CACHE_SIZE)
+            self.store = _stores[key]
+        finally:
+            _lock.release()
+
+    def clear(self):
+        _lock.acquire()
+        try:
+            self.store.clear()
+        finally:
+            _lock.release()
+
+    def exists(self, infoid):
+        _lock.acquire()
+        try:
+            return infoid in self.store
+        finally:
+            _lock.release()
+
+    _marker = []
+    def get(self, infoid, value, default=_marker):
+        _lock.acquire()
+        try:
+            values = self.store.get(infoid)
+        finally:
+            _lock.release()
+        if values is None:
+            if default != self._marker:
+                return default
+            raise KeyError('No such %s "%s"'%(self.name, escape(infoid)))
+        return values.get(value, None)
+
+    def getall(self, infoid):
+        _lock.acquire()
+        try:
+            values = self.store.get(infoid)
+        finally:
+            _lock.release()
+        if values is None:
+            raise KeyError('No such %s "%s"'%(self.name, escape(infoid)))
+        d = values.copy()
+        del d['__timestamp']
+        return d
+
+    def set(self, infoid, **newvalues):
+        _lock.acquire()
+        try:
+            values = self.store.get(infoid)
+            if values is None:
+                values = {'__timestamp': time.time()}
+            else:
+                values = values.copy()
+            values.update(newvalues)
+            self.store[infoid] = values
+        finally:
+            _lock.release()
+
+    def list(self):
+        _lock.acquire()
+        try:
+            return self.store.keys()
+        finally:
+            _lock.release()
+
+    def destroy(self, infoid):
+        _lock.acquire()
+        try:
+            self.store.pop(infoid)
+        finally:
+            _lock.release()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def updateTimestamp(self, sessid):
+        ''' Mark the record as used. The timestamp isn't updated on every
+            hit, only when it's older than the refresh interval.
+
+            The tracker database is never changed, so return False.
+        '''
+        now = time.time()
+        _lock.acquire()
+        try:
+            values = self.store.get(sessid)
+            if values is not None and \
+                    now > values['__timestamp'] + self.refresh_interval:
+                values = values.copy()
+                values['__timestamp'] = now
+                self.store[sessid] = values
+        finally:
+            _lock.release()
+        return False
+
+    def clean(self):
+        ''' Remove session records that haven't been used for a week. '''
+        old = time.time() - 60*60*24*7
+        _lock.acquire()
+        try:
+            for sessid in self.store.keys():
+                if self.store.peek(sessid)['__timestamp'] < old:
+                    del self.store[sessid]
+        finally:
+            _lock.release()
+
+class Sessions(BasicDatabase):
+    name = 'sessions'
+
+# vim: set sts ts=4 sw=4 et si :
@@ -7,70 +7,78 @@ class. It's now also used for One Time Key handling too.
 __docformat__ = 'restructuredtext'
 
 import os, time
+from ast import literal_eval
 from cgi import escape
 
 class BasicDatabase:
     ''' Provide a nice encapsulation of an RDBMS table.
 
-        Keys are id strings, values are automatically marshalled data.
+        Keys are id strings, values are dicts of plain Python values
+        (strings, numbers, lists, dicts...) stored as their repr. They're
+        read back with literal_eval(), never eval().
+
+        The records read are remembered, so that updateTimestamp() is a
+        single statement and the timestamp is only written once every
+        "session_refresh_interval" seconds. set() stores a record with a
+        single insert-or-replace, without reading it first.
     '''
     def __init__(self, db):
         self.db = db
         self.cursor = self.db.cursor
+        self.refresh_interval = db.config.WEB_SESSION_REFRESH_INTERVAL
+        self.cache = {}
 
     def clear(self):
         self.cursor.execute('delete from %ss'%self.name)
+        self.cache = {}
 
-    def exists(self, infoid):
+    def load(self, infoid):
+        ''' Return the (values, timestamp) of the record or None '''
+        if infoid in self.cache:
+            return self.cache[infoid]
         n = self.name
-        self.cursor.execute('select count(*) from %ss where %s_key=%s'%(n,
-            n, self.db.arg), (infoid,))
-        return int(self.cursor.fetchone()[0])
+        self.cursor.execute('select %s_value, %s_time from %ss '
+            'where %s_key=%s'%(n, n, n, n, self.db.arg), (infoid,))
+        res = self.cursor.fetchone()
+        if res:
+            res = (literal_eval(res[0]), res[1])
+        self.cache[infoid] = res
+        return res
+
+    def exists(self, infoid):
+        return self.load(infoid) is not None
 
     _marker = []
     def get(self, infoid, value, default=_marker):
-        n = self.name
-        self.cursor.execute('select %s_value from %ss where %s_key=%s'%(n,
-            n, n, self.db.arg), (infoid,))
-        res = self.cursor.fetchone()
+        res = self.load(infoid)
         if not res:
             if default != self._marker:
                 return default
             raise KeyError('No such %s "%s"'%(self.name, escape(infoid)))
-        values = eval(res[0])
-        return values.get(value, None)
+        return res[0].get(value, None)
 
     def getall(self, infoid):
-        n = self.name
-        self.cursor.execute('select %s_value from %ss where %s_key=%s'%(n,
-            n, n, self.db.arg), (infoid,))
-        res = self.cursor.fetchone()
+        res = self.load(infoid)
         if not res:
             raise KeyError('No such %s "%s"'%(self.name, escape (infoid)))
-        return eval(res[0])
+        return res[0].copy()
 
     def set(self, infoid, **newvalues):
-        c = self.cursor
+        ''' Store the values of the record. They're added to the values
+            read before; a record that wasn't read is replaced.
+        '''
         n = self.name
-        a = self.db.arg
-        c.execute('select %s_value from %ss where %s_key=%s'%(n, n, n, a),
-            (infoid,))
-        res = c.fetchone()
+        res = self.cache.get(infoid)
+        values = {}
         if res:
-            values = eval(res[0])
+            values.update(res[0])
+            timestamp = res[1]
         else:
-            values = {}
+            timestamp = time.time()
         values.update(newvalues)
-
-        if res:
-            sql = 'update %ss set %s_value=%s where %s_key=%s'%(n, n,
-                a, n, a)
-            args = (repr(values), infoid)
-        else:
-            sql = 'insert into %ss (%s_key, %s_time, %s_value) '\
-                'values (%s, %s, %s)'%(n, n, n, n, a, a, a)
-            args = (infoid, time.time(), repr(values))
-        c.execute(sql, args)
+        self.db.sql_insert_or_replace('%ss'%n, ('%s_key'%n, '%s_time'%n,
+            '%s_value'%n), (infoid, timestamp, repr(values)))
+        self.cache[infoid] = (values, timestamp)
 
     def list(self):
         c = self.cursor
@@ -81,14 +89,23 @@ class BasicDatabase:
     def destroy(self, infoid):
         self.cursor.execute('delete from %ss where %s_key=%s'%(self.name,
             self.name, self.db.arg), (infoid,))
+        self.cache[infoid] = None
 
     def updateTimestamp(self, infoid):
-        """ don't update every hit - once a minute should be OK """
+        """ Mark the record as used. The timestamp isn't updated on every
+            hit, only when it's older than the refresh interval.
+
+            Return whether the database was changed.
+        """
+        res = self.load(infoid)
         now = time.time()
-        self.cursor.execute('''update %ss set %s_time=%s where %s_key=%s
-            and %s_time < %s'''%(self.name, self.name, self.db.arg,
-            self.name, self.db.arg, self.name, self.db.arg),
-            (now, infoid, now-60))
+        if res is None or now - res[1] < self.refresh_interval:
+            return False
+        self.cursor.execute('update %ss set %s_time=%s where %s_key=%s'%(
+            self.name, self.name, self.db.arg, self.name, self.db.arg),
+            (now, infoid))
+        self.cache[infoid] = (res[0], now)
+        return True
 
     def clean(self):
         ''' Remove session records that haven't been used for a week. '''
@@ -97,6 +114,7 @@ class BasicDatabase:
         old = now - week
         self.cursor.execute('delete from %ss where %s_time < %s'%(self.name,
             self.name, self.db.arg), (old, ))
+        self.cache = {}
 
 class Sessions(BasicDatabase):
     name = 'session'
@@ -27,6 +27,9 @@ Some use samples:
 
 import re
 import heapq
+import threading
+
+from roundup.support import LRUCache
 
 # regexp for languange-range search
 nqlre = "([A-Za-z]+[-[A-Za-z]+]*)$"
@@ -38,11 +41,31 @@ lre   = re.compile(nqlre + "|" + qlre)
 ascii = ''.join([chr(x) for x in range(256)])
 whitespace = ' \t\n\r\v\f'
 
+# the results for the most frequent headers
+_parsed = LRUCache(100)
+_parsed_lock = threading.Lock()
+
 def parse(language_header):
     """parse(string_with_accept_header_content) -> languages list"""
 
     if language_header is None: return []
 
+    _parsed_lock.acquire()
+    try:
+        languages = _parsed.get(language_header)
+    finally:
+        _parsed_lock.release()
+    if languages is None:
+        languages = _parse(language_header)
+        _parsed_lock.acquire()
+        try:
+            _parsed[language_header] = languages
+        finally:
+            _parsed_lock.release()
+    return list(languages)
+
+def _parse(language_header):
+
     # strip whitespaces.
     lh = language_header.translate(ascii, whitespace)
 
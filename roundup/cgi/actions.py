@@ -1028,6 +1028,10 @@ class ExportCSVAction(Action):
     name = 'export'
     permissionType = 'View'
 
+    # number of items whose properties are fetched from the database in
+    # one go
+    chunksize = 100
+
     def handle(self):
         ''' Export the specified search query as CSV. '''
         # figure the request
@@ -1052,8 +1056,8 @@ class ExportCSVAction(Action):
 
         # full-text search
         if request.search_text:
-            matches = self.db.indexer.search(
-                re.findall(r'\b\w{2,25}\b', request.search_text), klass)
+            matches = dict([(nodeid, {}) for nodeid, score in
+                self.db.indexer.search_ranked(request.search_text, klass)])
         else:
             matches = None
 
@@ -1076,21 +1080,95 @@ class ExportCSVAction(Action):
         writer = csv.writer(wfile)
         self.client._socket_op(writer.writerow, columns)
 
-        # and search
-        for itemid in klass.filter(matches, filterspec, sort, group):
-            row = []
-            for name in columns:
-                # check permission to view this property on this item
-                if not self.hasPermission('View', itemid=itemid,
-                        classname=request.classname, property=name):
-                    raise exceptions.Unauthorised(self._(
-                        'You do not have permission to view %(class)s'
-                    ) % {'class': request.classname})
-                row.append(str(klass.get(itemid, name)))
-            self.client._socket_op(writer.writerow, row)
+        # the columns the user may view on every item don't need to be
+        # checked item by item
+        security = self.db.security
+        checked = [name for name in columns
+            if not security.hasUnconditionalPermission('View', self.userid,
+                request.classname, name)]
+
+        # Link and Multilink values are exported as labels
+        represent = {}
+        for name in columns:
+            prop = props[name]
+            if isinstance(prop, (hyperdb.Link, hyperdb.Multilink)):
+                linkcl = self.db.getclass(prop.classname)
+                represent[name] = self.repr_link(linkcl, linkcl.labelprop())
+
+        # and search, writing the rows as we go
+        if self.sorts_multilink(klass, sort + group):
+            # filter_iter can't sort these
+            itemids = klass.filter(matches, filterspec, sort, group)
+        else:
+            itemids = klass.filter_iter(matches, filterspec, sort, group)
+        for chunk in self.chunks(itemids):
+            templating.prefetchItems(self.db, request.classname, chunk,
+                columns)
+            for itemid in chunk:
+                for name in checked:
+                    # check permission to view this property on this item
+                    if not self.hasPermission('View', itemid=itemid,
+                            classname=request.classname, property=name):
+                        raise exceptions.Unauthorised(self._(
+                            'You do not have permission to view %(class)s'
+                        ) % {'class': request.classname})
+                row = []
+                for name in columns:
+                    value = klass.get(itemid, name)
+                    if name in represent:
+                        row.append(represent[name](value))
+                    else:
+                        row.append(str(value))
+                self.client._socket_op(writer.writerow, row)
 
         return '\n'
 
+    def chunks(self, itemids):
+        """Yield lists of up to chunksize ids taken from the iterable
+        itemids."""
+        chunk = []
+        for itemid in itemids:
+            chunk.append(itemid)
+            if len(chunk) == self.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def repr_link(self, linkcl, labelprop):
+        """Return a function turning a Link or Multilink value into the
+        labels of the linked items, joined with ';' for a Multilink.
+        Items whose label the user may not view are given by their id."""
+        def label(linkid):
+            if not self.hasPermission('View', classname=linkcl.classname,
+                    property=labelprop, itemid=linkid):
+                return linkid
+            return str(linkcl.get(linkid, labelprop))
+        def represent(value):
+            if value is None:
+                return ''
+            if isinstance(value, type([])):
+                return ';'.join([label(v) for v in value])
+            return label(value)
+        return represent
+
+    def sorts_multilink(self, klass, sortspec):
+        """Check whether a property of a sort or group spec crosses a
+        Multilink."""
+        if isinstance(sortspec, tuple):
+            sortspec = [sortspec]
+        for direction, propname in sortspec:
+            cl = klass
+            for name in (propname or '').split('.'):
+                prop = cl.getprops().get(name)
+                if prop is None:
+                    break
+                if isinstance(prop, hyperdb.Multilink):
+                    return True
+                if isinstance(prop, hyperdb.Link):
+                    cl = self.db.getclass(prop.classname)
+        return False
+
 
 class Bridge(BaseAction):
     """Make roundup.actions.Action executable via CGI request.
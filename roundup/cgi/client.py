@@ -177,6 +177,9 @@ class Session:
         if not self._sid:
             self._sid = self._gen_sid()
             self.session_db.set(self._sid, **self._data)
+            # the new session must outlive the request, even though
+            # update() doesn't commit a fresh timestamp
+            self.client.db.commit()
             # add session cookie
             self.update(set_cookie=True)
 
@@ -196,8 +199,10 @@ class Session:
             XXX the session can be purged within a week even if a cookie
                 lifetime is longer
         """
-        self.session_db.updateTimestamp(self._sid)
-        self.client.db.commit()
+        # the timestamp is only written once in a while, don't commit
+        # on every request
+        if self.session_db.updateTimestamp(self._sid):
+            self.client.db.commit()
 
         if set_cookie:
             self.client.add_cookie(self.cookie_name, self._sid, expire=expire)
@@ -285,6 +290,9 @@ class Client:
         errno.ETIMEDOUT,
     )
 
+    # size of the reads when sending a file without request.sendfile
+    FILE_CHUNK_SIZE = 64 * 1024
+
     def __init__(self, instance, request, env, form=None, translator=None):
         # re-seed the random number generator
         random.seed()
@@ -595,18 +603,27 @@ class Client:
         """
         self.clean_up()
 
+    # time of the last clean up done by this process, by tracker home
+    last_clean = {}
+
     def clean_up(self):
         """Remove expired sessions and One Time Keys.
 
-           Do it only once an hour.
+           Do it only once every WEB_SESSION_CLEAN_INTERVAL seconds.
         """
-        hour = 60*60
+        interval = self.instance.config.WEB_SESSION_CLEAN_INTERVAL
         now = time.time()
 
+        # don't even look at the database if this process did it lately
+        home = self.instance.tracker_home
+        if now - self.last_clean.get(home, 0) < interval:
+            return
+        self.last_clean[home] = now
+
         # XXX: hack - use OTK table to store last_clean time information
         #      'last_clean' string is used instead of otk key
         last_clean = self.db.getOTKManager().get('last_clean', 'last_use', 0)
-        if now - last_clean < hour:
+        if now - last_clean < interval:
             return
 
         self.session_api.clean_up()
@@ -1558,15 +1575,20 @@ class Client:
         if hasattr(self.request, "sendfile"):
             self._socket_op(self.request.sendfile, filename, offset, length)
             return
-        # Fallback to the "write" operation.
+        # Fallback to the "write" operation, a chunk at a time so that
+        # big files aren't loaded in memory.
         f = open(filename, 'rb')
         try:
             if offset:
                 f.seek(offset)
-            content = f.read(length)
+            while length > 0:
+                content = f.read(min(length, self.FILE_CHUNK_SIZE))
+                if not content:
+                    break
+                length -= len(content)
+                self.write(content)
         finally:
             f.close()
-        self.write(content)
 
     def setHeader(self, header, value):
         """Override a header to be returned to the user's browser.
@@ -355,6 +355,38 @@ def lookupIds(db, prop, ids, fail_ok=0, num_re=num_re, do_lookup=True):
             l.append(entry)
     return l
 
+def prefetchItems(db, classname, ids, propnames=[]):
+    """ Load the items "ids" of "classname" into the database's node
+        cache, together with the items their Link and Multilink
+        properties named in "propnames" point to. This turns the
+        per-item queries of a rendered page into a few batched ones.
+        Backends that fetch items one at a time are left alone.
+    """
+    if not db.supports_prefetch():
+        return
+    cl = db.getclass(classname)
+    props = cl.getprops()
+    linkprops = [name for name in propnames
+        if isinstance(props.get(name), (hyperdb.Link, hyperdb.Multilink))]
+    db.prefetch(classname, ids, linkprops)
+
+    # now the items they link to, grouped by class
+    targets = {}
+    for name in linkprops:
+        l = targets.setdefault(props[name].classname, [])
+        for id in ids:
+            try:
+                value = cl.get(id, name)
+            except IndexError:
+                continue
+            if isinstance(value, type([])):
+                l.extend(value)
+            elif value is not None:
+                l.append(value)
+    for linkcn, linkids in targets.iteritems():
+        if linkids:
+            db.prefetch(linkcn, linkids)
+
 def lookupKeys(linkcl, key, ids, num_re=num_re):
     """ Look up the "key" values for "ids" list - though some may already
     be key values, not ids.
@@ -558,6 +590,7 @@ class HTMLClass(HTMLInputMixin, HTMLPermissions):
         """
         # get the list and sort it nicely
         l = self._klass.list()
+        self._db.prefetch(self._classname, l)
         sortfunc = make_sort_function(self._db, self._classname, sort_on)
         l.sort(sortfunc)
 
@@ -583,7 +616,12 @@ class HTMLClass(HTMLInputMixin, HTMLPermissions):
         userid = self._client.userid
         if not check('Web Access', userid):
             return ''
-        for nodeid in self._klass.list():
+        nodeids = self._klass.list()
+        chunk = 100
+        for index, nodeid in enumerate(nodeids):
+            if index % chunk == 0:
+                self._db.prefetch(self._classname,
+                    nodeids[index:index + chunk], props)
             l = []
             for name in props:
                 # check permission to view this property on this item
@@ -633,8 +671,8 @@ class HTMLClass(HTMLInputMixin, HTMLPermissions):
             return []
 
         l = [HTMLItem(self._client, self.classname, id)
-             for id in self._klass.filter(None, filterspec, sort, group)
-             if check('View', userid, self.classname, itemid=id)]
+             for id in self._klass.filter_with_permissions(None, filterspec,
+                sort, group, 'View', userid)]
         return l
 
     def classhelp(self, properties=None, label=''"(list)", width='500',
@@ -2123,6 +2161,7 @@ class MultilinkHTMLProperty(HTMLProperty):
     def __init__(self, *args, **kwargs):
         HTMLProperty.__init__(self, *args, **kwargs)
         if self._value:
+            self._db.prefetch(self._prop.classname, self._value)
             display_value = lookupIds(self._db, self._prop, self._value,
                 fail_ok=1, do_lookup=False)
             sortfun = make_sort_function(self._db, self._prop.classname)
@@ -2777,22 +2816,143 @@ function help_window(helpurl, width, height) {
 
         # get the list of ids we're batching over
         klass = self.client.db.getclass(self.classname)
-        if self.search_text:
-            matches = self.client.db.indexer.search(
-                [w.upper().encode("utf-8", "replace") for w in re.findall(
-                    r'(?u)\b\w{2,25}\b',
-                    unicode(self.search_text, "utf-8", "replace")
-                )], klass)
+        if self.search_text and not (sort or group):
+            # an unsorted full-text search lists the best matches first
+            ranked = self.client.db.indexer.search_ranked(self.search_text,
+                klass)
+            l = RankedResult(klass, ranked, filterspec, permission, userid,
+                max(self.pagesize, 1))
         else:
-            matches = None
-
-        # filter for visibility
-        l = [id for id in klass.filter(matches, filterspec, sort, group)
-            if check(permission, userid, self.classname, itemid=id)]
+            if self.search_text:
+                matches = dict([(nodeid, {}) for nodeid, score in
+                    self.client.db.indexer.search_ranked(self.search_text,
+                    klass)])
+            else:
+                matches = None
+
+            # filter for visibility
+            if klass.supports_limit() and self.pagesize > 0 and \
+                    klass.supports_permission_filters(permission, userid):
+                # only fetch the ids of the page shown (and one more so we
+                # know whether there's a next page); otherwise every
+                # item found would be checked for each of the queries
+                l = FilterResult(klass, matches, filterspec, sort, group,
+                    permission, userid, self.pagesize + 1)
+            else:
+                l = klass.filter_with_permissions(matches, filterspec, sort,
+                    group, permission, userid)
 
         # return the batch object, using IDs only
+        propnames = list(self.columns)
+        for direction, name in self.sort + self.group:
+            propnames.append(name)
         return Batch(self.client, l, self.pagesize, self.startwith,
-            classname=self.classname)
+            classname=self.classname, propnames=propnames)
+
+class FilterResult:
+    """ The ids found by klass.filter_with_permissions, read as they
+        are accessed. Each read covers "chunksize" ids before and two
+        chunks after the accessed one so a Batch and its previous and
+        next Batches need just one. The length is found by
+        klass.filter_count.
+    """
+    def __init__(self, klass, search_matches, filterspec, sort, group,
+            permission, userid, chunksize):
+        self.klass = klass
+        self.search_matches = search_matches
+        self.filterspec = filterspec
+        self.sort = sort
+        self.group = group
+        self.permission = permission
+        self.userid = userid
+        self.chunksize = chunksize
+        self.ids = {}
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            self.length = self.klass.filter_count(self.search_matches,
+                self.filterspec, self.permission, self.userid)
+        return self.length
+
+    def fetch(self, index):
+        offset = max(0, index - self.chunksize)
+        limit = 3 * self.chunksize
+        ids = self.klass.filter_with_permissions(self.search_matches,
+            self.filterspec, self.sort, self.group, self.permission,
+            self.userid, limit=limit, offset=offset)
+        for i in range(len(ids)):
+            self.ids[offset + i] = ids[i]
+        if ids and len(ids) < limit:
+            # we've hit the end
+            self.length = offset + len(ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError, index
+        if not self.ids.has_key(index):
+            if self.length is not None and index >= self.length:
+                raise IndexError, index
+            self.fetch(index)
+            if not self.ids.has_key(index):
+                raise IndexError, index
+        return self.ids[index]
+
+class RankedResult:
+    """ The ids of a ranked full-text search (see Indexer.search_ranked),
+        best match first, keeping those matching the filterspec and
+        allowed by the permission. They're checked as they are accessed,
+        three chunks at a time; the length is found by klass.filter_count.
+    """
+    def __init__(self, klass, ranked, filterspec, permission, userid,
+            chunksize):
+        self.klass = klass
+        self.ranked = [nodeid for nodeid, score in ranked]
+        self.filterspec = filterspec
+        self.permission = permission
+        self.userid = userid
+        self.chunksize = chunksize
+        self.checked = 0
+        self.ids = []
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            if self.ranked:
+                self.length = self.klass.filter_count(
+                    dict.fromkeys(self.ranked), self.filterspec,
+                    self.permission, self.userid)
+            else:
+                self.length = 0
+        return self.length
+
+    def fetch(self, index):
+        while len(self.ids) <= index and self.checked < len(self.ranked):
+            chunk = self.ranked[self.checked:self.checked+3*self.chunksize]
+            self.checked += len(chunk)
+            allowed = set(self.klass.filter_with_permissions(
+                dict.fromkeys(chunk), self.filterspec, [], [],
+                self.permission, self.userid))
+            self.ids.extend([nodeid for nodeid in chunk if nodeid in allowed])
+        if self.checked == len(self.ranked):
+            self.length = len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError, index
+        if index >= len(self.ids):
+            self.fetch(index)
+            if index >= len(self.ids):
+                raise IndexError, index
+        return self.ids[index]
 
 # extend the standard ZTUtils Batch object to remove dependency on
 # Acquisition and add a couple of useful methods
@@ -2811,6 +2971,9 @@ class Batch(ZTUtils.Batch):
         orphan    if the next batch would contain less items than this
                   value, then it is combined with this batch
         overlap   the number of items shared between adjacent batches
+        propnames if sequence is a list of ids, the properties that will
+                  be displayed; the items they link to are prefetched
+                  along with the items of the batch
         ========= ========================================================
 
         Attributes: Note that the "start" attribute, unlike the
@@ -2821,7 +2984,7 @@ class Batch(ZTUtils.Batch):
         "sequence_length" is the length of the original, unbatched, sequence.
     """
     def __init__(self, client, sequence, size, start, end=0, orphan=0,
-            overlap=0, classname=None):
+            overlap=0, classname=None, propnames=[]):
         self.client = client
         self.last_index = self.last_item = None
         self.current_item = None
@@ -2829,6 +2992,10 @@ class Batch(ZTUtils.Batch):
         self.sequence_length = len(sequence)
         ZTUtils.Batch.__init__(self, sequence, size, start, end, orphan,
             overlap)
+        if classname:
+            # fetch the items of this batch in one go
+            prefetchItems(client.db, classname,
+                sequence[self.first:self.first + self.length], propnames)
 
     # overwrite so we can late-instantiate the HTMLItem instance
     def __getitem__(self, index):
@@ -22,7 +22,35 @@ class Writer(object):
         self.write = f
         return f(data)
 
+class FileRange(object):
+    '''Read at most 'length' bytes of a file.'''
+    def __init__(self, f, length):
+        self.f = f
+        self.length = length
+    def read(self, size=-1):
+        if size < 0 or size > self.length:
+            size = self.length
+        data = self.f.read(size)
+        self.length -= len(data)
+        return data
+    def close(self):
+        self.f.close()
+
+def iter_file(f, blocksize):
+    '''Generate the content of the file-like 'f' in blocks.'''
+    try:
+        while 1:
+            data = f.read(blocksize)
+            if not data:
+                break
+            yield data
+    finally:
+        f.close()
+
 class RequestDispatcher(object):
+    # size of the blocks of file content handed to the server
+    blocksize = 64 * 1024
+
     def __init__(self, home, debug=False, timing=False, lang=None):
         assert os.path.isdir(home), '%r is not a directory'%(home,)
         self.home = home
@@ -42,6 +70,8 @@ class RequestDispatcher(object):
 
         request.wfile = Writer(request)
         request.__wfile = None
+        request.__file_wrapper = environ.get('wsgi.file_wrapper')
+        request.__body = []
 
         if environ ['REQUEST_METHOD'] == 'OPTIONS':
             code = 501
@@ -68,8 +98,9 @@ class RequestDispatcher(object):
             request.start_response([('Content-Type', 'text/html')], 404)
             request.wfile.write('Not found: %s'%client.path)
 
-        # all body data has been written using wfile
-        return []
+        # all body data has been written using wfile, but for the file
+        # passed to sendfile()
+        return request.__body
 
     def start_response(self, headers, response_code):
         """Set HTTP response code"""
@@ -77,6 +108,22 @@ class RequestDispatcher(object):
         self.__wfile = self.__start_response('%d %s'%(response_code,
             message), headers)
 
+    def sendfile(self, filename, offset=0, length=-1):
+        """Have the server send the file as the body of the response,
+        with the wsgi.file_wrapper if it has one"""
+        f = open(filename, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        if length < 0:
+            length = size - offset
+        if offset:
+            f.seek(offset)
+        if offset or length < size:
+            f = FileRange(f, length)
+        if self.__file_wrapper is not None:
+            self.__body = self.__file_wrapper(f, self.blocksize)
+        else:
+            self.__body = iter_file(f, self.blocksize)
+
     def get_wfile(self):
         if self.__wfile is None:
             raise ValueError, 'start_response() not called'
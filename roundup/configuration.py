@@ -307,6 +307,47 @@ class IsolationOption(Option):
             return _val
         raise OptionValueError(self, value, self.class_description)
 
+class SqlitePragmaOption(Option):
+    """Values of an SQLite pragma, 'default' leaves it alone"""
+
+    allowed = ['default']
+
+    def str2value(self, value):
+        _val = value.lower()
+        if _val in self.allowed:
+            return _val
+        raise OptionValueError(self, value, self.class_description)
+
+class SqliteJournalModeOption(SqlitePragmaOption):
+    """SQLite journal modes"""
+
+    allowed = ['default', 'delete', 'truncate', 'persist', 'wal']
+    class_description = "Allowed values: %s" % ', '.join(allowed)
+
+class SqliteSynchronousOption(SqlitePragmaOption):
+    """SQLite synchronous levels"""
+
+    allowed = ['default', 'off', 'normal', 'full']
+    class_description = "Allowed values: %s" % ', '.join(allowed)
+
+class SqliteTempStoreOption(SqlitePragmaOption):
+    """SQLite storage of temporary tables and indices"""
+
+    allowed = ['default', 'file', 'memory']
+    class_description = "Allowed values: %s" % ', '.join(allowed)
+
+class SessionBackendOption(Option):
+    """Where the web sessions are stored"""
+
+    allowed = ['database', 'dbm', 'memory']
+    class_description = "Allowed values: %s" % ', '.join(allowed)
+
+    def str2value(self, value):
+        _val = value.lower()
+        if _val in self.allowed:
+            return _val
+        raise OptionValueError(self, value, self.class_description)
+
 class MailAddressOption(Option):
 
     """Email address
@@ -540,10 +581,27 @@ SETTINGS = (
             "email?"),
         (BooleanOption, "email_registration_confirmation", "yes",
             "Offer registration confirmation by email or only through the web?"),
+        (BooleanOption, "cache_schema", "yes",
+            "When the tracker is opened with optimisation enabled (as done\n"
+            "by roundup-server and the web interfaces) run schema.py and\n"
+            "the detectors only once per process and give each newly\n"
+            "opened database a copy of the resulting classes, detectors,\n"
+            "permissions and roles.\n"
+            "Set this to 'no' if schema.py or the detectors have side\n"
+            "effects that must happen every time the database is opened."),
         (WordListOption, "indexer_stopwords", "",
             "Additional stop-words for the full-text indexer specific to\n"
             "your tracker. See the indexer source for the default list of\n"
             "stop-words (eg. A,AND,ARE,AS,AT,BE,BUT,BY, ...)"),
+        (IntegerNumberOption, "indexer_reindex_chunk_size", "1000",
+            "Number of items read and added to the full-text index\n"
+            "at once when the index is rebuilt (by the \"reindex\"\n"
+            "command of roundup-admin or after a change of indexer)."),
+        (IntegerNumberOption, "indexer_reindex_workers", "0",
+            "Number of processes splitting the texts into words when\n"
+            "the full-text index is rebuilt. With 0 or 1 they're split\n"
+            "by the reindexing process itself. Not used by the xapian\n"
+            "indexer, nor on Windows."),
         (OctalNumberOption, "umask", "02",
             "Defines the file creation mode mask."),
         (IntegerNumberOption, 'csv_field_size', '131072',
@@ -615,6 +673,24 @@ SETTINGS = (
             "Setting this option makes Roundup migrate passwords with\n"
             "an insecure password-scheme to a more secure scheme\n"
             "when the user logs in via the web-interface."),
+        (SessionBackendOption, "session_backend", "database",
+            "Where the web sessions are stored: 'database' keeps them\n"
+            "in the tracker database, 'dbm' in a dbm file in the\n"
+            "database directory (the sql backends then don't write to\n"
+            "the database for them) and 'memory' in the memory of the\n"
+            "server process. 'memory' is the fastest, but only works\n"
+            "when all the requests are handled by the same process\n"
+            "and logs everybody out when it's restarted."),
+        (IntegerNumberOption, "session_cache_size", "10000",
+            "The number of sessions kept by the 'memory' session\n"
+            "backend. The least recently used ones are dropped first."),
+        (IntegerNumberOption, "session_refresh_interval", "60",
+            "Seconds between the updates of the last use time of a\n"
+            "session. Requests coming sooner than that don't write\n"
+            "to the session store."),
+        (IntegerNumberOption, "session_clean_interval", "3600",
+            "Seconds between the removals of the expired sessions and\n"
+            "one-time keys, done by the web interface."),
     )),
     ("rdbms", (
         (Option, 'name', 'roundup',
@@ -644,8 +720,54 @@ SETTINGS = (
             "Number of seconds to wait when the SQLite database is locked\n"
             "Default: use a 30 second timeout (extraordinarily generous)\n"
             "Only used in SQLite connections."),
+        (SqliteJournalModeOption, 'sqlite_journal_mode', 'default',
+            "Journal mode of the SQLite database. In 'wal' mode,\n"
+            "readers don't block the writer and the writer doesn't\n"
+            "block readers; the database then needs a local file system.\n"
+            "'default' leaves the mode of the database file unchanged.\n"
+            "Only used in SQLite connections."),
+        (SqliteSynchronousOption, 'sqlite_synchronous', 'default',
+            "How often SQLite waits for data to reach the disk.\n"
+            "'normal' is safe with the 'wal' journal mode, a power\n"
+            "failure may lose the last commits but doesn't corrupt\n"
+            "the database. 'default' uses the SQLite default (full).\n"
+            "Only used in SQLite connections."),
+        (IntegerNumberOption, 'sqlite_cache_size', '0',
+            "Size of the page cache of each SQLite connection, in pages,\n"
+            "or in KiB if negative. 0 uses the SQLite default.\n"
+            "Only used in SQLite connections."),
+        (IntegerNumberOption, 'sqlite_mmap_size', '0',
+            "Number of bytes of the SQLite database file read through\n"
+            "memory mapping instead of read calls. 0 disables it.\n"
+            "Only used in SQLite connections."),
+        (SqliteTempStoreOption, 'sqlite_temp_store', 'default',
+            "Where SQLite keeps temporary tables and indices, e.g. for\n"
+            "sorting: 'file', 'memory' or the SQLite 'default'.\n"
+            "Only used in SQLite connections."),
         (IntegerNumberOption, 'cache_size', '100',
             "Size of the node cache (in elements)"),
+        (IntegerNumberOption, 'cache_max_bytes', '0',
+            "Upper limit for the memory used by the node caches\n"
+            "(approximately, in bytes). 0 means no limit, only\n"
+            "cache_size and shared_cache_size apply."),
+        (IntegerNumberOption, 'shared_cache_size', '0',
+            "Size of the process-wide node cache (in elements).\n"
+            "This cache is shared by all database connections of a\n"
+            "process (e.g. the threads of roundup-server) and is kept\n"
+            "across transactions. Cached items are checked against\n"
+            "their activity timestamp in the database before use.\n"
+            "0 disables the shared cache. Not used with MySQL, whose\n"
+            "timestamps are too coarse for that check."),
+        (IntegerNumberOption, 'connection_pool_size', '0',
+            "Number of idle database connections kept open by a\n"
+            "process (e.g. roundup-server) for reuse by the next\n"
+            "request, saving the cost of connecting and of reading\n"
+            "the schema from the database. Pooled connections are\n"
+            "checked with a trivial query before use.\n"
+            "0 disables the pool: every request opens a connection."),
+        (IntegerNumberOption, 'connection_max_age', '3600',
+            "Number of seconds after which a pooled connection is\n"
+            "closed instead of being reused."),
         (BooleanOption, "allow_create", "yes",
             "Setting this option to 'no' protects the database against table creations."),
         (BooleanOption, "allow_alter", "yes",
@@ -707,6 +829,13 @@ SETTINGS = (
         (NullableOption, "local_hostname", '',
             "The local hostname to use during SMTP transmission.\n"
             "Set this if your mail server requires something specific."),
+        (IntegerNumberOption, "pool_size", "2",
+            "How many idle SMTP connections to keep open for reuse\n"
+            "by later messages sent from the same process.\n"
+            "Set to 0 to close the connection after every message."),
+        (IntegerNumberOption, "pool_timeout", "60",
+            "Seconds an idle SMTP connection is kept for reuse.\n"
+            "Keep this below the idle timeout of your mail host."),
         (BooleanOption, "tls", "no",
             "If your SMTP mail host provides or requires TLS\n"
             "(Transport Layer Security) then set this option to 'yes'."),
@@ -728,6 +857,20 @@ SETTINGS = (
             "messages to this file *instead* of sending them.\n"
             "This option has the same effect as environment variable"
             " SENDMAILDEBUG.\nEnvironment variable takes precedence."),
+        (NullableFilePathOption, "spool", "",
+            "Directory to queue outgoing email in.\n"
+            "If set, messages are written to this directory when the\n"
+            "transaction producing them is committed, and are sent by\n"
+            "the roundup-mailer script instead of during the web or\n"
+            "email request."),
+        (IntegerNumberOption, "spool_retries", "10",
+            "How many times roundup-mailer retries sending a spooled\n"
+            "message before moving it to the \"failed\" subdirectory\n"
+            "of the spool."),
+        (IntegerNumberOption, "spool_retry_delay", "60",
+            "Seconds roundup-mailer waits before retrying a spooled\n"
+            "message that couldn't be sent. The delay is doubled on\n"
+            "every further retry."),
         (BooleanOption, "add_authorinfo", "yes",
             "Add a line with author information at top of all messages\n"
             "sent by roundup"),
@@ -21,7 +21,7 @@
 __docformat__ = 'restructuredtext'
 
 # standard python modules
-import os, re, shutil, weakref
+import os, re, shutil, weakref, copy
 
 # roundup modules
 import date, password
@@ -33,6 +33,9 @@ from roundup.i18n import _
 #
 class _Type(object):
     """A roundup property type."""
+    # kind of secondary index kept on the property: None, 'yes' or
+    # 'nocase' (for caseless lookups)
+    index = None
     def __init__(self, required=False, default_value = None):
         self.required = required
         self.__default_value = default_value
@@ -52,9 +55,18 @@ class _Type(object):
 
 class String(_Type):
     """An object designating a String property."""
-    def __init__(self, indexme='no', required=False, default_value = ""):
+    def __init__(self, indexme='no', required=False, default_value = "",
+            index='no'):
+        """ 'indexme' adds the property to the full-text index, 'index'
+            keeps a database index on it: 'yes' for exact and 'nocase' for
+            caseless lookups (as done by stringFind).
+        """
         super(String, self).__init__(required, default_value)
         self.indexme = indexme == 'yes'
+        if index not in ('no', 'yes', 'nocase'):
+            raise ValueError, _("index must be 'no', 'yes' or 'nocase'")
+        if index != 'no':
+            self.index = index
     def from_raw(self, value, propname='', **kw):
         """fix the CRLF/CR -> LF stuff"""
         if propname == 'content':
@@ -150,6 +162,17 @@ class _Pointer(_Type):
 class Link(_Pointer):
     """An object designating a Link property that links to a
        node in a specified class."""
+    def __init__(self, classname, do_journal='yes', try_id_parsing='yes',
+                 required=False, default_value=None, index='no'):
+        """ 'index' set to 'yes' keeps a database index on the property,
+            making find() on it fast.
+        """
+        super(Link, self).__init__(classname, do_journal, try_id_parsing,
+            required, default_value)
+        if index not in ('no', 'yes'):
+            raise ValueError, _("index must be 'no' or 'yes'")
+        if index == 'yes':
+            self.index = index
     def from_raw(self, value, db, propname, **kw):
         if (self.try_id_parsing and value == '-1') or not value:
             value = None
@@ -426,10 +449,16 @@ class Proptree(object):
         """
         if ids is None:
             ids = self.val
-        if self.sortattr and [s for s in self.sortattr if not s.attr_sort_done]:
+        if not self.sort_done():
             return self._searchsort(ids, True, True)
         return ids
 
+    def sort_done(self):
+        """ Return True if the ids are already in the requested order,
+        ie. sort() has nothing left to do.
+        """
+        return not [s for s in self.sortattr if not s.attr_sort_done]
+
     def sortable_children(self, intermediate=False):
         """ All children needed for sorting. If intermediate is True,
         intermediate nodes (not being a sort attribute) are returned,
@@ -651,6 +680,14 @@ All methods except __repr__ must be implemented by a concrete backend Database.
            and structures. Not called in normal usage."""
         raise NotImplementedError
 
+    def rebuild_indexes(self, classname=None):
+        """Rebuild the property indexes of the class, or of all classes.
+
+        Only backends maintaining the indexes themselves have anything to
+        do, the SQL databases keep theirs up to date.
+        """
+        pass
+
     def __getattr__(self, classname):
         """A convenient way of calling self.getclass(classname)."""
         raise NotImplementedError
@@ -710,6 +747,22 @@ All methods except __repr__ must be implemented by a concrete backend Database.
         """
         raise NotImplementedError
 
+    def prefetch(self, classname, nodeids, propnames=None):
+        """Load the given nodes into the node cache ahead of their use.
+
+        The Multilink properties listed in 'propnames' are loaded too.
+        This is purely an optimisation hint: backends that can't fetch
+        several nodes at once just ignore it, and ids that don't exist
+        are silently skipped.
+        """
+        pass
+
+    def supports_prefetch(self):
+        """Return True if prefetch actually loads several nodes at once,
+        ie. if it's worth finding the ids to hand to it.
+        """
+        return False
+
     def hasnode(self, classname, nodeid):
         """Determine if the database has a given node.
         """
@@ -834,6 +887,23 @@ class Class:
         """
         return '<hyperdb.Class "%s">'%self.classname
 
+    def bind(self, db):
+        """Add a copy of this class, including its registered detectors,
+        to another database with the same schema and return it.
+
+        Used to avoid re-running the schema for every database opened.
+        """
+        cl = copy.copy(self)
+        cl.db = weakref.proxy(db)
+        for detectors in 'auditors', 'reactors':
+            d = {}
+            for event, l in getattr(self, detectors).iteritems():
+                d[event] = copy.copy(l)
+                d[event].list = l.list[:]
+            setattr(cl, detectors, d)
+        db.classes[cl.classname] = cl
+        return cl
+
     # Editing nodes:
 
     def create(self, **propvalues):
@@ -878,6 +948,16 @@ class Class:
         """
         return Node(self, nodeid)
 
+    def getnodes(self, nodeids, propnames=None):
+        """ Return convenience wrappers for several nodes at once.
+
+        The nodes (and the Multilink properties named in 'propnames')
+        are fetched in as few requests as the backend allows, so this
+        is cheaper than calling getnode() in a loop.
+        """
+        self.db.prefetch(self.classname, nodeids, propnames)
+        return [Node(self, nodeid) for nodeid in nodeids]
+
     def getnodeids(self, retired=None):
         """Retrieve all the ids of the nodes for a particular Class.
         """
@@ -1164,7 +1244,8 @@ class Class:
             sortattr.append(('+', 'id'))
         return sortattr
 
-    def filter(self, search_matches, filterspec, sort=[], group=[]):
+    def filter(self, search_matches, filterspec, sort=[], group=[],
+            limit=None, offset=None):
         """Return a list of the ids of the active nodes in this class that
         match the 'filter' spec, sorted by the group spec and then the
         sort spec.
@@ -1178,6 +1259,9 @@ class Class:
 
         "search_matches" is a container type
 
+        "limit" and "offset" select a part of the sorted result: at most
+        "limit" ids are returned, skipping the first "offset" ones.
+
         The filter must match all properties specificed. If the property
         value to match is a list:
 
@@ -1201,7 +1285,58 @@ class Class:
         sortattr = self._sortattr(sort = sort, group = group)
         proptree = self._proptree(filterspec, sortattr)
         proptree.search(search_matches)
-        return proptree.sort()
+        return self._limit_ids(proptree.sort(), limit, offset)
+
+    def supports_limit(self):
+        """Return True if filter usually passes its limit and offset on
+        to the database instead of computing the complete result first.
+        """
+        return False
+
+    def supports_permission_filters(self, permission, userid):
+        """Return True if filter_with_permissions and filter_count check
+        'permission' for 'userid' in the database query instead of
+        calling hasPermission for every node found.
+        """
+        return False
+
+    def _limit_ids(self, ids, limit=None, offset=None):
+        """Return the part of the list of ids selected by the limit and
+        offset arguments of filter.
+        """
+        if offset:
+            ids = ids[offset:]
+        if limit is not None:
+            ids = ids[:limit]
+        return ids
+
+    def filter_with_permissions(self, search_matches, filterspec, sort=[],
+            group=[], permission='View', userid=None, limit=None,
+            offset=None):
+        """Like filter but only return the ids of the nodes that
+        'userid' has 'permission' for (as determined by the
+        hasPermission method of the security object).
+
+        This checks every node found, backends able to express the
+        filter functions of the Permissions in their queries may do
+        better.
+        """
+        check = self.db.security.hasPermission
+        l = [id for id in self.filter(search_matches, filterspec, sort,
+            group) if check(permission, userid, self.classname, itemid=id)]
+        return self._limit_ids(l, limit, offset)
+
+    def filter_count(self, search_matches, filterspec, permission=None,
+            userid=None):
+        """Return the number of ids filter would return for the given
+        search_matches and filterspec. If "permission" is given only
+        the nodes "userid" has that permission for are counted, see
+        filter_with_permissions.
+        """
+        if permission is None:
+            return len(self.filter(search_matches, filterspec))
+        return len(self.filter_with_permissions(search_matches, filterspec,
+            permission=permission, userid=userid))
 
     # non-optimized filter_iter, a backend may chose to implement a
     # better version that provides a real iterator that pre-fills the
@@ -1238,6 +1373,13 @@ class Class:
         pdict.update([(k, v) for k, v in props.iteritems() if v.required])
         return pdict
 
+    def getindexes(self):
+        """Return a dict mapping the names of the properties that have a
+        database index to the kind of index, 'yes' or 'nocase'.
+        """
+        props = self.getprops(protected = False)
+        return dict([(k, v.index) for k, v in props.iteritems() if v.index])
+
     def addprop(self, **properties):
         """Add properties to this class.
 
@@ -1250,6 +1392,12 @@ class Class:
 
     def index(self, nodeid):
         """Add (or refresh) the node to search indexes"""
+        self.db.indexer.add_texts(self.index_texts(nodeid))
+
+    def index_texts(self, nodeid):
+        """Return the list of (identifier, text, mime_type) of the node
+        to add to the search indexes, identifier being (classname,
+        nodeid, property)"""
         raise NotImplementedError
 
     #
@@ -38,8 +38,10 @@ __docformat__ = 'restructuredtext'
 import errno
 import gettext as gettext_module
 import os
+import threading
 
 from roundup import msgfmt
+from roundup.support import LRUCache
 
 # List of directories for mo file search (see SF bug 1219689)
 LOCALE_DIRS = [
@@ -64,6 +66,12 @@ DOMAIN = "roundup"
 RoundupNullTranslations = gettext_module.NullTranslations
 RoundupTranslations = gettext_module.GNUTranslations
 
+# translation objects made by get_translation(), with the message
+# catalogs they were read from and the state of these files; the
+# languages come from the browsers, so only keep the recently used ones
+_translations = LRUCache(100)
+_translations_lock = threading.Lock()
+
 def find_locales(language=None):
     """Return normalized list of locale names to try for given language
 
@@ -144,6 +152,24 @@ def get_mofile(languages, localedir, domain=None):
         return mofile
     return None
 
+def catalog_stamps(mofiles):
+    """Return the state of the .mo files and their .po sources
+
+    A translation object made from the files is still valid
+    as long as this doesn't change.
+
+    """
+    stamps = []
+    for mofile in mofiles:
+        for path in (mofile, os.path.splitext(mofile)[0] + ".po"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((st.st_mtime, st.st_size, st.st_ino))
+    return stamps
+
 def get_translation(language=None, tracker_home=None,
     translation_class=RoundupTranslations,
     null_translation_class=RoundupNullTranslations
@@ -157,6 +183,40 @@ def get_translation(language=None, tracker_home=None,
     specify the classes that are instantiated for existing
     and non-existing translations, respectively.
 
+    Translation objects are cached for the process and shared by all
+    callers asking for the same languages: they must not be changed.
+    A cached object is used as long as the message catalogs it was
+    made from are unchanged; catalogs added later for a language are
+    found after a restart.
+
+    """
+    if language is not None and not isinstance(language, basestring):
+        language = tuple(language)
+    key = (language, tracker_home, tuple(LOCALE_DIRS), translation_class,
+        null_translation_class)
+    _translations_lock.acquire()
+    try:
+        cached = _translations.get(key)
+    finally:
+        _translations_lock.release()
+    if cached is not None:
+        mofiles, stamps, translator = cached
+        if catalog_stamps(mofiles) == stamps:
+            return translator
+    mofiles, translator = make_translation(language, tracker_home,
+        translation_class, null_translation_class)
+    _translations_lock.acquire()
+    try:
+        _translations[key] = (mofiles, catalog_stamps(mofiles), translator)
+    finally:
+        _translations_lock.release()
+    return translator
+
+def make_translation(language, tracker_home, translation_class,
+    null_translation_class
+):
+    """Return the .mo files found for language and a new Translation
+    object made from them
     """
     mofiles = []
     # locale directory paths
@@ -196,7 +256,7 @@ def get_translation(language=None, tracker_home=None,
             pass
     if translator is None:
         translator = null_translation_class()
-    return translator
+    return mofiles, translator
 
 # static translations object
 translation = get_translation()
@@ -76,6 +76,8 @@ class Tracker:
             self.detectors = self.get_extensions('detectors')
             # db_open is set to True after first open()
             self.db_open = 0
+        # classes and security built by the first open(), see open()
+        self.db_schema = None
 
     def get_backend_name(self):
         f = file(os.path.join(self.config.DATABASE, 'backend_name'))
@@ -84,11 +86,22 @@ class Tracker:
         return name
 
     def open(self, name=None):
-        # load the database schema
-        # we cannot skip this part even if self.optimize is set
-        # because the schema has security settings that must be
-        # applied to each database instance
         backend = self.backend
+        if self.db_schema is not None:
+            # the schema was run by an earlier open(), just bind a copy
+            # of its classes and security settings to the new database
+            db = backend.Database(self.config, name)
+            classes, security = self.db_schema
+            for cl in classes:
+                cl.bind(db)
+            db.security = security.bind(db)
+            db.tx_Source = None
+            return db
+
+        # load the database schema
+        # unless CACHE_SCHEMA is enabled we cannot skip this part even
+        # if self.optimize is set because the schema has security
+        # settings that must be applied to each database instance
         env = {
             'Class': backend.Class,
             'FileClass': backend.FileClass,
@@ -153,6 +166,10 @@ class Tracker:
 
             db.post_init()
             self.db_open = 1
+
+        if self.optimize and self.config.CACHE_SCHEMA and \
+                not callable(self.schema_hook):
+            self.db_schema = (db.classes.values(), db.security)
         return db
 
     def load_interfaces(self):
@@ -2,7 +2,8 @@
 """
 __docformat__ = 'restructuredtext'
 
-import time, quopri, os, socket, smtplib, re, sys, traceback, email
+import time, quopri, os, socket, smtplib, re, sys, traceback, email, errno
+import logging, threading
 
 from cStringIO import StringIO
 
@@ -54,15 +55,26 @@ def nice_sender_header(name, address, charset):
     return '%s <%s>'%(encname, address)
 
 class Mailer:
-    """Roundup-specific mail sending."""
-    def __init__(self, config):
+    """Roundup-specific mail sending.
+
+    If the tracker has a mail spool configured, messages are written to
+    the spool instead of being sent, and the roundup-mailer script
+    delivers them. When a database is passed in, this only happens when
+    its current transaction is committed.
+    """
+    def __init__(self, config, db=None):
         self.config = config
+        self.db = db
 
         # set to indicate to roundup not to actually _send_ email
         # this var must contain a file to write the mail to
         self.debug = os.environ.get('SENDMAILDEBUG', '') \
             or config["MAIL_DEBUG"]
 
+        self.spool = None
+        if config["MAIL_SPOOL"]:
+            self.spool = get_mail_spool(config["MAIL_SPOOL"])
+
         # set timezone so that things like formatdate(localtime=True)
         # use the configured timezone
         # apparently tzset doesn't exist in python under Windows, my bad.
@@ -267,6 +279,16 @@ class Mailer:
 
         if not sender:
             sender = self.config.ADMIN_EMAIL
+        if self.spool is not None:
+            if self.db is not None:
+                self.db.queue_mail(self.spool, sender, to, message)
+            else:
+                self.spool.put(sender, to, message)
+        else:
+            self.deliver(sender, to, message)
+
+    def deliver(self, sender, to, message):
+        """Send a message right away, bypassing the spool."""
         if self.debug:
             # don't send - just write to a file, use unix from line so
             # that resulting file can be openened in a mailer
@@ -280,13 +302,139 @@ class Mailer:
             try:
                 # send the message as admin so bounces are sent there
                 # instead of to roundup
-                smtp = SMTPConnection(self.config)
-                smtp.sendmail(sender, to, message)
+                refused = self.sendmail(sender, to, message)
             except socket.error, value:
                 raise MessageSendError("Error: couldn't send email: "
                                        "mailhost %s"%value)
             except smtplib.SMTPException, msg:
                 raise MessageSendError("Error: couldn't send email: %s"%msg)
+            for address, (code, response) in sorted(refused.items()):
+                logging.getLogger('roundup.mailer').error(
+                    'mail to %s refused: %s %s', address, code, response)
+
+    def sendmail(self, sender, to, message):
+        """Send a message over a pooled SMTP connection.
+
+        Return the {address: (code, response)} of the recipients the
+        mail host refused, the message was sent to the others. Socket
+        and SMTP errors are passed on. A pooled connection the mail host
+        has closed in the meantime is replaced by a new one, once.
+        """
+        smtp, reused = smtp_pool.get(self.config)
+        start = time.time()
+        try:
+            try:
+                refused = smtp.sendmail(sender, to, message)
+            except (socket.error, smtplib.SMTPServerDisconnected):
+                if not reused:
+                    raise
+                smtp_pool.discard(smtp)
+                smtp, reused = smtp_pool.get(self.config, reuse=False)
+                refused = smtp.sendmail(sender, to, message)
+        except:
+            smtp_pool.discard(smtp)
+            raise
+        smtp_pool.sent(len(to), time.time() - start)
+        smtp_pool.put(self.config, smtp)
+        return refused or {}
+
+class SMTPPool:
+    """Authenticated SMTP connections kept open for reuse within the
+    process.
+
+    Connections are kept per mail host and login. Up to MAIL_POOL_SIZE
+    idle connections are kept, for at most MAIL_POOL_TIMEOUT seconds; a
+    pool size of 0 closes every connection after use. The "stats" dict
+    counts the connections opened and reused, the messages and
+    recipients sent and the seconds spent sending them.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.stats = dict(connections=0, reused=0, messages=0,
+            recipients=0, seconds=0.0)
+        self.logger = logging.getLogger('roundup.mailer')
+
+    def key(self, config):
+        return (config.MAILHOST, config['MAIL_PORT'],
+            config['MAIL_LOCAL_HOSTNAME'], config['MAIL_TLS'],
+            config['MAIL_USERNAME'])
+
+    def get(self, config, reuse=True):
+        """Return (connection, reused) with a connection to the mail
+        host of the config."""
+        now = time.time()
+        expired = []
+        smtp = None
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(self.key(config), [])
+            while idle:
+                conn, since = idle.pop()
+                if not reuse or now - since > config['MAIL_POOL_TIMEOUT']:
+                    expired.append(conn)
+                else:
+                    smtp = conn
+                    self.stats['reused'] += 1
+                    break
+            if smtp is None:
+                self.stats['connections'] += 1
+        finally:
+            self.lock.release()
+        for conn in expired:
+            self.discard(conn)
+        if smtp is not None:
+            return smtp, True
+        return SMTPConnection(config), False
+
+    def put(self, config, smtp):
+        """Return a connection after use."""
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(self.key(config), [])
+            if len(idle) < config['MAIL_POOL_SIZE']:
+                idle.append((smtp, time.time()))
+                return
+        finally:
+            self.lock.release()
+        try:
+            smtp.quit()
+        except (socket.error, smtplib.SMTPException):
+            smtp.close()
+
+    def discard(self, smtp):
+        """Close a connection that's broken or not needed any more."""
+        try:
+            smtp.close()
+        except socket.error:
+            pass
+
+    def sent(self, recipients, seconds):
+        self.lock.acquire()
+        try:
+            self.stats['messages'] += 1
+            self.stats['recipients'] += recipients
+            self.stats['seconds'] += seconds
+        finally:
+            self.lock.release()
+        self.logger.debug('sent mail to %d recipients in %.3fs', recipients,
+            seconds)
+
+    def clear(self):
+        """Close all idle connections."""
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, {}
+        finally:
+            self.lock.release()
+        for conns in idle.itervalues():
+            for smtp, since in conns:
+                try:
+                    smtp.quit()
+                except (socket.error, smtplib.SMTPException):
+                    smtp.close()
+
+smtp_pool = SMTPPool()
 
 class SMTPConnection(smtplib.SMTP):
     ''' Open an SMTP connection to the mailhost specified in the config
@@ -306,4 +454,210 @@ class SMTPConnection(smtplib.SMTP):
         if mailuser:
             self.login(mailuser, config["MAIL_PASSWORD"])
 
+class MailSpool:
+    """A directory of outgoing messages waiting to be delivered.
+
+    Every message is a file in the "new" subdirectory holding the
+    envelope (sender, recipients, the number of failed delivery attempts
+    and the time of the next one) as header lines, an empty line and the
+    message itself. Files are written to "tmp" and renamed into place, so
+    readers never see a partial message. Messages that can't be
+    delivered are moved to "failed".
+    """
+    counter = 0
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.tmp = os.path.join(dirname, 'tmp')
+        self.new = os.path.join(dirname, 'new')
+        self.failed = os.path.join(dirname, 'failed')
+        for d in self.tmp, self.new, self.failed:
+            try:
+                os.makedirs(d)
+            except OSError, error:
+                if error.errno != errno.EEXIST:
+                    raise
+
+    def newname(self):
+        """Return a file name unique to this process, in the order the
+        messages were queued."""
+        MailSpool.counter += 1
+        return '%.6f.%d_%d.%s'%(time.time(), os.getpid(), MailSpool.counter,
+            socket.gethostname().replace('/', '_'))
+
+    def put(self, sender, to, message, attempts=0, due=0, name=None):
+        """Queue the message for delivery to the addresses in the list
+        'to', or requeue the message 'name'."""
+        if name is None:
+            name = self.newname()
+        tmp = os.path.join(self.tmp, name)
+        f = open(tmp, 'wb')
+        try:
+            f.write('Sender: %s\n'%sender)
+            f.write('Recipients: %s\n'%', '.join(to))
+            f.write('Attempts: %d\n'%attempts)
+            f.write('Due: %d\n\n'%due)
+            f.write(message)
+        finally:
+            f.close()
+        dest = os.path.join(self.new, name)
+        if os.name == 'nt' and os.path.exists(dest):
+            os.remove(dest)
+        os.rename(tmp, dest)
+
+    def names(self):
+        """Return the names of the queued messages, oldest first."""
+        return sorted([n for n in os.listdir(self.new)
+            if not n.startswith('.')])
+
+    def get(self, name):
+        """Return (sender, to, message, attempts, due) for the message
+        'name', or None if it isn't queued any more."""
+        try:
+            f = open(os.path.join(self.new, name), 'rb')
+        except IOError, error:
+            if error.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        envelope, message = data.split('\n\n', 1)
+        headers = {}
+        for line in envelope.split('\n'):
+            key, value = line.split(': ', 1)
+            headers[key] = value
+        to = [a for a in headers['Recipients'].split(', ') if a]
+        return (headers['Sender'], to, message, int(headers['Attempts']),
+            int(headers['Due']))
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.new, name))
+        except OSError, error:
+            if error.errno != errno.ENOENT:
+                raise
+
+    def fail(self, name):
+        """Give up delivering the message 'name'."""
+        os.rename(os.path.join(self.new, name), os.path.join(self.failed,
+            name))
+
+_mail_spools = {}
+_mail_spools_lock = threading.Lock()
+
+def get_mail_spool(dirname):
+    """Return the MailSpool of the directory, shared by the Mailers of
+    the process so that its subdirectories are only created once."""
+    _mail_spools_lock.acquire()
+    try:
+        spool = _mail_spools.get(dirname)
+        if spool is None:
+            spool = _mail_spools[dirname] = MailSpool(dirname)
+        return spool
+    finally:
+        _mail_spools_lock.release()
+
+class SpoolSender:
+    """Deliver the messages queued in a tracker's mail spool.
+
+    The messages due are sent in batches over pooled SMTP connections,
+    one transaction per message. Failed deliveries are retried up to
+    MAIL_SPOOL_RETRIES times, the delay before the next try doubling
+    every time, and then given up. Messages and recipients refused
+    permanently by the mail host are given up at once; the recipients
+    refused temporarily are retried on their own.
+    """
+    def __init__(self, config, batchsize=100):
+        self.config = config
+        self.batchsize = batchsize
+        self.mailer = Mailer(config)
+        self.spool = self.mailer.spool
+        if self.spool is None:
+            raise ValueError('The tracker has no mail spool configured')
+        self.logger = logging.getLogger('roundup.mailer')
+
+    def run_once(self, now=None):
+        """Try to deliver all the messages due, return the number of
+        messages sent."""
+        if now is None:
+            now = time.time()
+        sent = 0
+        batch = []
+        for name in self.spool.names():
+            entry = self.spool.get(name)
+            if entry is None or entry[4] > now:
+                continue
+            batch.append((name, entry))
+            if len(batch) == self.batchsize:
+                sent += self.send_batch(batch, now)
+                batch = []
+        if batch:
+            sent += self.send_batch(batch, now)
+        return sent
+
+    def send_batch(self, batch, now):
+        sent = 0
+        for name, entry in batch:
+            sender, to, message, attempts, due = entry
+            try:
+                if self.mailer.debug:
+                    self.mailer.deliver(sender, to, message)
+                    refused = {}
+                else:
+                    refused = self.mailer.sendmail(sender, to, message)
+            except smtplib.SMTPRecipientsRefused, error:
+                refused = error.recipients
+            except (socket.error, smtplib.SMTPException), error:
+                self.failed(name, sender, to, message, attempts, now, error)
+                continue
+            if len(refused) < len(to):
+                sent += 1
+            if refused:
+                self.refused(name, sender, message, attempts, now, refused)
+            else:
+                self.spool.remove(name)
+        return sent
+
+    def refused(self, name, sender, message, attempts, now, refused):
+        """Give up on the recipients of the message 'name' the mail host
+        refused permanently and retry those refused temporarily."""
+        permanent, temporary = {}, {}
+        for address, (code, response) in refused.items():
+            if code >= 500:
+                permanent[address] = (code, response)
+            else:
+                temporary[address] = (code, response)
+        if permanent:
+            # the spool keeps the message with the recipients given up
+            if temporary:
+                failed = self.spool.newname()
+            else:
+                failed = name
+            self.spool.put(sender, sorted(permanent), message, attempts,
+                0, failed)
+            self.logger.error('giving up on mail %s to %s: %s', failed,
+                ', '.join(sorted(permanent)), permanent)
+            self.spool.fail(failed)
+        if temporary:
+            self.failed(name, sender, sorted(temporary), message, attempts,
+                now, smtplib.SMTPRecipientsRefused(temporary))
+
+    def failed(self, name, sender, to, message, attempts, now, error):
+        attempts += 1
+        # only refusals of this message are permanent, not those of the
+        # connection or login; refused recipients are sorted by refused()
+        permanent = isinstance(error, (smtplib.SMTPSenderRefused,
+            smtplib.SMTPDataError)) and error.smtp_code >= 500
+        if permanent or attempts > self.config.MAIL_SPOOL_RETRIES:
+            self.logger.error('giving up on mail %s to %s: %s', name,
+                ', '.join(to), error)
+            self.spool.fail(name)
+            return
+        delay = self.config.MAIL_SPOOL_RETRY_DELAY * 2 ** (attempts - 1)
+        self.logger.warning('sending mail %s to %s failed, retrying in '
+            '%d seconds: %s', name, ', '.join(to), delay, error)
+        self.spool.put(sender, to, message, attempts, int(now + delay), name)
+
 # vim: set et sts=4 sw=4 :
@@ -79,7 +79,7 @@ explanatory message given in the exception.
 __docformat__ = 'restructuredtext'
 
 import string, re, os, mimetools, cStringIO, smtplib, socket, binascii, quopri
-import time, random, sys, logging
+import time, random, sys, logging, copy, threading, Queue
 import traceback
 import email.utils
 
@@ -1322,11 +1322,14 @@ class MailGW:
         fcntl.flock(f.fileno(), FCNTL.LOCK_UN)
         return 0
 
+    # number of messages fetched from an IMAP server in one command
+    imap_batch = 50
+
     def do_imap(self, server, user='', password='', mailbox='', ssl=0,
             cram=0):
         ''' Do an IMAP connection
         '''
-        import getpass, imaplib, socket
+        import getpass
         try:
             if not user:
                 user = raw_input('User: ')
@@ -1337,6 +1340,79 @@ class MailGW:
             print "\nAborted by user."
             return 1
         # open a connection to the server and retrieve all messages
+        server = self.imap_login(server, user, password, ssl, cram)
+        if server is None:
+            return 1
+
+        try:
+            numMessages = self.imap_select(server, mailbox)
+            if numMessages is None:
+                return 1
+            if numMessages:
+                self.imap_handle(server, MessageDispatcher(self))
+            server.close()
+        finally:
+            try:
+                server.expunge()
+            except:
+                pass
+            server.logout()
+
+        return 0
+
+    def serve_imap(self, server, user='', password='', mailbox='', ssl=0,
+            cram=0, interval=60, workers=1):
+        ''' Keep handling the messages arriving in an IMAP mailbox
+
+        New messages are waited for with IDLE if the server supports it,
+        otherwise the mailbox is checked every 'interval' seconds. The
+        messages are handled by a pool of 'workers' threads, see
+        MessageDispatcher. Runs until interrupted.
+        '''
+        import getpass, imaplib
+        try:
+            if not user:
+                user = raw_input('User: ')
+            if not password:
+                password = getpass.getpass()
+        except (KeyboardInterrupt, EOFError):
+            print "\nAborted by user."
+            return 1
+
+        dispatcher = MessageDispatcher(self, workers)
+        try:
+            while 1:
+                conn = self.imap_login(server, user, password, ssl, cram)
+                if conn is not None:
+                    try:
+                        self._serve_imap(conn, mailbox, dispatcher, interval)
+                    except (imaplib.IMAP4.error, socket.error):
+                        self.logger.exception('IMAP connection lost')
+                    try:
+                        conn.logout()
+                    except (imaplib.IMAP4.error, socket.error):
+                        pass
+                # wait a bit before connecting again
+                time.sleep(interval)
+        finally:
+            dispatcher.stop()
+
+    def _serve_imap(self, server, mailbox, dispatcher, interval):
+        numMessages = self.imap_select(server, mailbox)
+        while numMessages is not None:
+            if numMessages:
+                self.imap_handle(server, dispatcher)
+                server.expunge()
+            if self.imap_can_idle(server):
+                self.imap_idle(server, interval)
+            else:
+                time.sleep(interval)
+            numMessages = self.imap_select(server, mailbox)
+
+    def imap_login(self, server, user, password, ssl=0, cram=0):
+        ''' Return a logged in connection to the IMAP server, or None
+        '''
+        import imaplib
         try:
             if ssl:
                 self.logger.debug('Trying server %r with ssl'%server)
@@ -1346,7 +1422,7 @@ class MailGW:
                 server = imaplib.IMAP4(server)
         except (imaplib.IMAP4.error, socket.error, socket.sslerror):
             self.logger.exception('IMAP server error')
-            return 1
+            return None
 
         try:
             if cram:
@@ -1355,43 +1431,126 @@ class MailGW:
                 server.login(user, password)
         except imaplib.IMAP4.error, e:
             self.logger.exception('IMAP login failure')
-            return 1
+            return None
+        return server
 
+    def imap_select(self, server, mailbox=''):
+        ''' Select the mailbox, return the number of messages in it or
+            None if that failed
+        '''
+        if not mailbox:
+            (typ, data) = server.select()
+        else:
+            (typ, data) = server.select(mailbox=mailbox)
+        if typ != 'OK':
+            self.logger.error('Failed to get mailbox %r: %s'%(mailbox,
+                data))
+            return None
         try:
-            if not mailbox:
-                (typ, data) = server.select()
-            else:
-                (typ, data) = server.select(mailbox=mailbox)
-            if typ != 'OK':
-                self.logger.error('Failed to get mailbox %r: %s'%(mailbox,
-                    data))
-                return 1
-            try:
-                numMessages = int(data[0])
-            except ValueError, value:
-                self.logger.error('Invalid message count from mailbox %r'%
-                    data[0])
-                return 1
-            for i in range(1, numMessages+1):
-                (typ, data) = server.fetch(str(i), '(RFC822)')
-
-                # mark the message as deleted.
-                server.store(str(i), '+FLAGS', r'(\Deleted)')
+            return int(data[0])
+        except ValueError, value:
+            self.logger.error('Invalid message count from mailbox %r'%
+                data[0])
+            return None
 
-                # process the message
-                s = cStringIO.StringIO(data[0][1])
-                s.seek(0)
-                self.handle_Message(Message(s))
-            server.close()
+    def imap_handle(self, server, dispatcher):
+        ''' Hand the messages of the selected mailbox to the dispatcher
+            and mark each of them as deleted once it has been handled
+            without an error. The other messages stay in the mailbox and
+            are fetched again the next time.
+        '''
+        handled = []
+        def flag_handled():
+            uids = handled[:]
+            del handled[:len(uids)]
+            if uids:
+                server.uid('store', ','.join(uids), '+FLAGS',
+                    r'(\Deleted)')
+        def put(uid, message):
+            dispatcher.put(message, lambda: handled.append(uid))
+            flag_handled()
+        try:
+            self.imap_fetch(server, put)
         finally:
-            try:
-                server.expunge()
-            except:
-                pass
-            server.logout()
+            dispatcher.join()
+            flag_handled()
 
-        return 0
+    imap_uid_re = re.compile(r'\bUID (\d+)')
+
+    def imap_fetch(self, server, handle):
+        ''' Pass the messages of the selected mailbox that are not marked
+            as deleted to handle(uid, message), fetching imap_batch of
+            them per command.
+        '''
+        (typ, data) = server.uid('search', None, 'UNDELETED')
+        if typ != 'OK':
+            self.logger.error('Failed to search messages: %s'%data)
+            return
+        uids = data[0].split()
+        for first in range(0, len(uids), self.imap_batch):
+            messages = ','.join(uids[first:first + self.imap_batch])
+            (typ, data) = server.uid('fetch', messages, '(RFC822)')
+            if typ != 'OK':
+                self.logger.error('Failed to fetch messages %s: %s'%(
+                    messages, data))
+                return
 
+            # process the messages, the responses are tuples of the
+            # envelope and the message, separated by closing parens
+            for item in data:
+                if isinstance(item, tuple):
+                    m = self.imap_uid_re.search(item[0])
+                    if m is None:
+                        self.logger.error('No UID in fetch response %r'%
+                            item[0])
+                        continue
+                    s = cStringIO.StringIO(item[1])
+                    s.seek(0)
+                    handle(m.group(1), Message(s))
+
+    def imap_can_idle(self, server):
+        ''' Return whether imap_idle() may be used on the connection: the
+            server must support IDLE, and as imaplib has no IDLE command
+            it's sent with the tag of its private _new_tag() method.
+        '''
+        return 'IDLE' in server.capabilities and \
+            callable(getattr(server, '_new_tag', None))
+
+    def imap_idle(self, server, timeout):
+        ''' Wait up to timeout seconds for the server to announce new
+            messages using the IDLE command (RFC 2177), see imap_can_idle().
+        '''
+        import imaplib
+        tag = server._new_tag()
+        server.send('%s IDLE\r\n'%tag)
+        line = server.readline()
+        if not line.startswith('+'):
+            raise imaplib.IMAP4.error('IDLE failed: %s'%line.strip())
+        sock = server.socket()
+        old_timeout = sock.gettimeout()
+        sock.settimeout(timeout)
+        try:
+            try:
+                while 1:
+                    line = server.readline()
+                    if not line:
+                        raise imaplib.IMAP4.abort('connection closed')
+                    if line.startswith('*') and 'EXISTS' in line.upper():
+                        break
+            except socket.error, error:
+                # SSL sockets don't raise socket.timeout
+                if not (isinstance(error, socket.timeout) or
+                        'timed out' in str(error)):
+                    raise
+        finally:
+            sock.settimeout(old_timeout)
+        server.send('DONE\r\n')
+        while 1:
+            line = server.readline()
+            if not line:
+                raise imaplib.IMAP4.abort('connection closed')
+            if line.startswith(tag):
+                break
 
     def do_apop(self, server, user='', password='', ssl=False):
         ''' Do authentication POP
@@ -1655,6 +1814,87 @@ The mail gateway is not properly set up. Please contact
         return allprops
 
 
+class MessageDispatcher:
+    """Hand messages to a bounded pool of worker threads
+
+    Every worker has a copy of the MailGW handler, so it opens its own
+    database for each message. Messages with the same ordering key (the
+    designator in the subject, or else the subject without "Re:" and
+    "Fwd:" prefixes) always go to the same worker, so the messages of an
+    issue are handled in the order they arrived. A worker queues at most
+    'queuesize' messages, put() blocks while its queue is full. The
+    'done' function passed to put() is called once the message has been
+    handled without an error, by the worker that handled it.
+
+    With a single worker the messages are handled right away in the
+    calling thread.
+    """
+    designator_re = re.compile(r'\[([^\d\s\]]+\d+)\]')
+
+    def __init__(self, handler, workers=1, queuesize=10):
+        self.handler = handler
+        self.queues = []
+        self.threads = []
+        if workers > 1:
+            for i in range(workers):
+                q = Queue.Queue(queuesize)
+                t = threading.Thread(target=self.work,
+                    args=(copy.copy(handler), q))
+                t.setDaemon(True)
+                t.start()
+                self.queues.append(q)
+                self.threads.append(t)
+
+    def key(self, message):
+        subject = (message.getheader('subject') or '').lower()
+        m = self.designator_re.search(subject)
+        if m:
+            return m.group(1)
+        refwd_re = self.handler.instance.config['MAILGW_REFWD_RE']
+        m = refwd_re.match(subject)
+        if m:
+            subject = subject[m.end():]
+        return subject.strip()
+
+    def put(self, message, done=None):
+        if not self.queues:
+            self.handler.handle_Message(message)
+            if done is not None:
+                done()
+            return
+        index = hash(self.key(message)) % len(self.queues)
+        self.queues[index].put((message, done))
+
+    def work(self, handler, q):
+        while 1:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                message, done = item
+                try:
+                    handler.handle_Message(message)
+                except:
+                    handler.logger.exception('Exception handling message')
+                    continue
+                if done is not None:
+                    done()
+            finally:
+                q.task_done()
+
+    def join(self):
+        """Wait until all the messages put are handled."""
+        for q in self.queues:
+            q.join()
+
+    def stop(self):
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join()
+        self.queues = []
+        self.threads = []
+
 def setPropArrayFromString(self, cl, propString, nodeid=None):
     ''' takes string of form prop=value,value;prop2=value
         and returns (error, prop[..])
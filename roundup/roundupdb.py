@@ -20,7 +20,7 @@
 """
 __docformat__ = 'restructuredtext'
 
-import re, os, smtplib, socket, time, random
+import re, os, smtplib, socket, time, random, itertools
 import cStringIO, base64, mimetypes
 import os.path
 import logging
@@ -32,7 +32,7 @@ from email.MIMEText import MIMEText
 from email.MIMEBase import MIMEBase
 from email.MIMEMultipart import MIMEMultipart
 
-from roundup import password, date, hyperdb
+from roundup import password, date, hyperdb, support
 from roundup.i18n import _
 from roundup.hyperdb import iter_roles
 
@@ -75,6 +75,108 @@ class Database:
                 self.journal_uid = (self.journaltag, uid)
             return self.journal_uid[1]
 
+    def queue_mail(self, spool, sender, to, message):
+        """Write the message to the mail spool when the current
+        transaction is committed; it's dropped on rollback."""
+        self.transactions.append((spool.put, (sender, to, message)))
+
+    # how often (in seconds) a reindex with "checkpoint" commits its work
+    reindex_checkpoint_interval = 60
+
+    def reindex(self, classname=None, show_progress=False, checkpoint=False):
+        """Rebuild the full-text index of the items of the class (or of
+        all the classes).
+
+        The items are read in chunks of [main] indexer_reindex_chunk_size
+        items, their texts are split into words by [main]
+        indexer_reindex_workers processes and added to the index at once.
+
+        With "checkpoint" the work done is committed regularly and its
+        progress recorded in the "reindex-checkpoint" file of the database
+        directory, so that an interrupted reindex of the same classes
+        resumes where it stopped.
+        """
+        if classname:
+            classnames = [classname]
+        else:
+            classnames = sorted(self.classes)
+        requested = classnames
+        path = os.path.join(self.config.DATABASE, 'reindex-checkpoint')
+
+        # pick up an interrupted reindex of the same classes
+        resume = None
+        if checkpoint and os.path.exists(path):
+            f = open(path)
+            try:
+                lines = f.read().splitlines()
+            finally:
+                f.close()
+            if len(lines) == 2 and lines[0].split() == requested:
+                resume = lines[1].split()
+                classnames = classnames[classnames.index(resume[0]):]
+
+        chunk_size = max(self.config.INDEXER_REINDEX_CHUNK_SIZE, 1)
+        pool = self.indexer.get_pool(self.config.INDEXER_REINDEX_WORKERS)
+        saved = time.time()
+        try:
+            for cn in classnames:
+                klass = self.getclass(cn)
+                ids = [int(nodeid) for nodeid in klass.list()]
+                if resume and resume[0] == cn:
+                    ids = [i for i in ids if i > int(resume[1])]
+                ids = [str(i) for i in sorted(ids)]
+                if show_progress:
+                    ids = support.Progress('Reindex %s'%cn, ids)
+                ids = iter(ids)
+                while 1:
+                    chunk = list(itertools.islice(ids, chunk_size))
+                    if not chunk:
+                        break
+                    texts = []
+                    for nodeid in chunk:
+                        texts.extend(klass.index_texts(nodeid))
+                    self.indexer.add_texts(texts, pool)
+                    if (checkpoint and time.time() - saved >
+                            self.reindex_checkpoint_interval):
+                        self.commit()
+                        self.save_reindex_checkpoint(path, requested, cn,
+                            chunk[-1])
+                        saved = time.time()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.indexer.save_index()
+        if checkpoint:
+            self.commit()
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_reindex_checkpoint(self, path, classnames, classname, nodeid):
+        """Record that the reindex of "classnames" has been done up to
+        the item "nodeid" of "classname".
+        """
+        f = open(path + '.tmp', 'w')
+        try:
+            f.write('%s\n%s %s\n'%(' '.join(classnames), classname, nodeid))
+        finally:
+            f.close()
+        if os.path.exists(path):
+            # can't rename over an existing file on Windows
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    def open_sessions(self, klass):
+        """Return the web session store configured by the [web]
+        session_backend option, 'klass' being the one of the backend
+        storing the sessions in the database."""
+        backend = self.config.WEB_SESSION_BACKEND
+        if backend == 'dbm':
+            from roundup.backends.sessions_dbm import Sessions as klass
+        elif backend == 'memory':
+            from roundup.backends.sessions_memory import Sessions as klass
+        return klass(self)
+
     def setCurrentUser(self, username):
         """Set the user that is responsible for current database
         activities.
@@ -519,7 +621,7 @@ class IssueClass:
         first = True
         for sendto in sendto:
             # create the message
-            mailer = Mailer(self.db.config)
+            mailer = Mailer(self.db.config, self.db)
 
             message = mailer.get_standard_message(multipart=message_files)
 
@@ -628,7 +730,12 @@ class IssueClass:
                 if message.get ('In-Reply-To'):
                     send_msg ['In-Reply-To'] = message ['In-Reply-To']
 
-            mailer.smtp_send(sendto, send_msg.as_string())
+            if first and bcc_sendto and not crypt:
+                # the bcc copy is the same message, send it along in
+                # the same SMTP transaction
+                mailer.smtp_send(sendto + bcc_sendto, send_msg.as_string())
+            else:
+                mailer.smtp_send(sendto, send_msg.as_string())
             if first:
                 if crypt:
                     # send individual bcc mails, otherwise receivers can
@@ -640,8 +747,6 @@ class IssueClass:
                         if message.get ('In-Reply-To'):
                             send_msg ['In-Reply-To'] = message ['In-Reply-To']
                         mailer.smtp_send([bcc], send_msg.as_string())
-                elif bcc_sendto:
-                    mailer.smtp_send(bcc_sendto, send_msg.as_string())
             first = False
 
     def email_signature(self, issueid, msgid):
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+"""Command-line script delivering the mail queued in a tracker's spool.
+"""
+__docformat__ = 'restructuredtext'
+
+
+# --- patch sys.path to make sure 'import roundup' finds correct version
+import sys
+import os.path as osp
+
+thisdir = osp.dirname(osp.abspath(__file__))
+rootdir = osp.dirname(osp.dirname(thisdir))
+if (osp.exists(thisdir + '/__init__.py') and
+        osp.exists(rootdir + '/roundup/__init__.py')):
+    # the script is located inside roundup source code
+    sys.path.insert(0, rootdir)
+# --/
+
+
+# python version check
+from roundup import version_check
+from roundup import __version__ as roundup_version
+
+import os, time, getopt, socket
+
+from roundup import mailer
+from roundup.i18n import _
+
+def usage(args, message=None):
+    if message is not None:
+        print message
+    print _(
+"""Usage: %(program)s [-v] [-1] [-i interval] [instance home]
+
+Options:
+ -v: print version and exit
+ -1: send the messages due once and exit
+ -i: seconds to wait between looking for new messages (default 10)
+
+Delivers the email queued in the mail spool of the tracker (the "spool"
+option of the [mail] section of config.ini). Messages that can't be
+sent are retried later, as configured by the "spool_retries" and
+"spool_retry_delay" options. Run a single roundup-mailer per tracker.
+
+If no instance home is given, the env var ROUNDUP_INSTANCE is tried.
+""")%{'program': args[0]}
+    return 1
+
+def main(argv):
+    '''Handle the arguments to the program and deliver the spool.
+    '''
+    try:
+        optionsList, args = getopt.getopt(argv[1:], 'v1i:')
+    except getopt.GetoptError:
+        return usage(argv)
+
+    once = False
+    interval = 10
+    for (opt, arg) in optionsList:
+        if opt == '-v':
+            print '%s (python %s)'%(roundup_version, sys.version.split()[0])
+            return
+        elif opt == '-1':
+            once = True
+        elif opt == '-i':
+            try:
+                interval = float(arg)
+            except ValueError:
+                return usage(argv, _('Error: the interval must be a number'))
+
+    # figure the instance home
+    if len(args) > 0:
+        instance_home = args[0]
+    else:
+        instance_home = os.environ.get('ROUNDUP_INSTANCE', '')
+    if not (instance_home and os.path.isdir(instance_home)):
+        return usage(argv)
+
+    import roundup.instance
+    instance = roundup.instance.open(instance_home)
+    try:
+        sender = mailer.SpoolSender(instance.config)
+    except ValueError, message:
+        return usage(argv, _('Error: %s') % message)
+
+    # don't hang on an unresponsive mail host
+    if hasattr(socket, 'setdefaulttimeout'):
+        socket.setdefaulttimeout(60)
+
+    while 1:
+        sender.run_once()
+        if once:
+            return 0
+        time.sleep(interval)
+
+def run():
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+# call main
+if __name__ == '__main__':
+    run()
+
+# vim: set filetype=python ts=4 sw=4 et si
@@ -45,12 +45,17 @@ def usage(args, message=None):
     if message is not None:
         print message
     print _(
-"""Usage: %(program)s [-v] [-c class] [[-C class] -S field=value]* [instance home] [mail source [specification]]
+"""Usage: %(program)s [-v] [-c class] [[-C class] -S field=value]* [--daemon [--interval=seconds] [--workers=number]] [instance home] [mail source [specification]]
 
 Options:
  -v: print version and exit
  -c: default class of item to create (else the tracker's MAIL_DEFAULT_CLASS)
  -C / -S: see below
+ --daemon: keep running, handling new messages as they arrive (IMAP only)
+ --interval: seconds between checks for new mail in daemon mode when the
+   server doesn't support IDLE, and before reconnecting (default 60)
+ --workers: number of threads handling messages in daemon mode
+   (default 1); messages about the same issue are still handled in order
 
 The roundup mail gateway may be called in one of the following ways:
  . without arguments. Then the env var ROUNDUP_INSTANCE will be tried.
@@ -123,6 +128,13 @@ IMAPS_CRAM:
  This supports the same notation as IMAP.
     imaps_cram username:password@server [mailbox]
 
+DAEMON:
+ With --daemon, the gateway keeps the tracker loaded and stays connected
+ to the IMAP server, waiting for new messages with IDLE (or checking for
+ them every --interval seconds). Messages are fetched in batches and
+ handled by --workers threads.
+    roundup-mailgw --daemon --workers=4 /path/to/tracker imaps server
+
 """)%{'program': args[0]}
     return 1
 
@@ -133,16 +145,30 @@ def main(argv):
     # arguments in the args array.
     try:
         optionsList, args = getopt.getopt(argv[1:], 'vc:C:S:', ['set=',
-            'class='])
+            'class=', 'daemon', 'interval=', 'workers='])
     except getopt.GetoptError:
         # print help information and exit:
         usage(argv)
         sys.exit(2)
 
+    daemon = False
+    interval = 60
+    workers = 1
     for (opt, arg) in optionsList:
         if opt == '-v':
             print '%s (python %s)'%(roundup_version, sys.version.split()[0])
             return
+        elif opt == '--daemon':
+            daemon = True
+        elif opt in ('--interval', '--workers'):
+            try:
+                value = int(arg)
+            except ValueError:
+                return usage(argv, _('Error: %s must be a number') % opt)
+            if opt == '--interval':
+                interval = value
+            else:
+                workers = value
 
     # figure the instance home
     if len(args) > 0:
@@ -152,9 +178,13 @@ def main(argv):
     if not (instance_home and os.path.isdir(instance_home)):
         return usage(argv)
 
-    # get the instance
+    # stdin and mailboxes are read once
+    if daemon and not (len(args) > 1 and args[1].startswith('imap')):
+        return usage(argv, _('Error: --daemon needs an IMAP mail source'))
+
+    # get the instance, a daemon keeps its schema loaded
     import roundup.instance
-    instance = roundup.instance.open(instance_home)
+    instance = roundup.instance.open(instance_home, optimize=daemon)
 
     if hasattr(instance, 'MailGW'):
         handler = instance.MailGW(instance, optionsList)
@@ -215,6 +245,9 @@ def main(argv):
         mailbox = ''
         if len(args) > 3:
             mailbox = args[3]
+        if daemon:
+            return handler.serve_imap(server, username, password, mailbox,
+                ssl, cram, interval, workers)
         return handler.do_imap(server, username, password, mailbox, ssl,
             cram)
 
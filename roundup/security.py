@@ -2,7 +2,7 @@
 """
 __docformat__ = 'restructuredtext'
 
-import weakref
+import weakref, copy
 
 from roundup import hyperdb, support
 
@@ -13,6 +13,7 @@ class Permission:
         - klass (optional)
         - properties (optional)
         - check function (optional)
+        - filter function (optional)
 
         The klass may be unset, indicating that this permission is not
         locked to a particular class. That means there may be multiple
@@ -24,15 +25,33 @@ class Permission:
         If check function is set, permission is granted only when
         the function returns value interpreted as boolean true.
         The function is called with arguments db, userid, itemid.
+        A check function whose result only depends on its arguments
+        (and not on data that may change during a transaction) may set
+        its "cacheable" attribute to a true value; its result is then
+        remembered by Security.hasPermission until the next commit or
+        rollback.
+
+        A filter function allows the database to find the items the
+        check function would accept without calling it for each item.
+        It is called with arguments db, userid, klass and returns a
+        list of filterspecs; an item passes the check exactly when it
+        matches any of them.
     '''
     def __init__(self, name='', description='', klass=None,
-            properties=None, check=None):
+            properties=None, check=None, filter=None):
         self.name = name
         self.description = description
         self.klass = klass
         self.properties = properties
         self._properties_dict = support.TruthDict(properties)
         self.check = check
+        self.filter = filter
+
+    def cacheable(self):
+        ''' Return true if the result of test() may be cached for the
+            rest of the transaction.
+        '''
+        return self.check is None or getattr(self.check, 'cacheable', False)
 
     def test(self, db, permission, classname, property, userid, itemid):
         if permission != self.name:
@@ -108,11 +127,19 @@ class Role:
         return '<Role 0x%x %r,%r>'%(id(self), self.name, self.permissions)
 
 class Security:
+    # maximum number of hasPermission decisions remembered per transaction
+    decision_cache_size = 10000
+
     def __init__(self, db):
         ''' Initialise the permission and role classes, and add in the
             base roles (for admin user).
         '''
         self.db = weakref.proxy(db)       # use a weak ref to avoid circularity
+        self.decisions = {}
+        self.registerCache(db)
+
+        # candidate Permissions mapped by (rolename, permission, classname)
+        self.role_index = {}
 
         # permssions are mapped by name to a list of Permissions by class
         self.permission = {}
@@ -137,6 +164,58 @@ class Security:
         from roundup import mailgw
         mailgw.initialiseSecurity(self)
 
+    def bind(self, db):
+        ''' Return a copy of these security settings for use by the
+            database 'db', which must have the same schema.
+
+            The Permissions and Roles are shared with the copy.
+        '''
+        security = copy.copy(self)
+        security.db = weakref.proxy(db)
+        security.decisions = {}
+        security.registerCache(db)
+        return security
+
+    def registerCache(self, db):
+        ''' Have the hasPermission decisions forgotten whenever 'db'
+            clears its cache, ie. at the end of each transaction.
+        '''
+        register = getattr(db, 'registerClearCacheCallback', None)
+        if register is not None:
+            register(self.clearCache)
+
+    def clearCache(self, dummy=None):
+        ''' Forget all the remembered hasPermission decisions.
+        '''
+        self.decisions = {}
+
+    def rolePermissions(self, rolename, permission, classname):
+        ''' Return the Permissions of the Role 'rolename' named
+            'permission' which apply to 'classname'.
+        '''
+        key = (rolename, permission, classname)
+        permissions = self.role[rolename].permissions
+        stamp = (id(permissions), len(permissions))
+        cached = self.role_index.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        perms = [perm for perm in permissions
+            if perm.name == permission and perm.klass in (None, classname)]
+        self.role_index[key] = (stamp, perms)
+        return perms
+
+    def roleStamp(self, rolenames):
+        ''' Return a value that changes whenever the Permissions of
+            the Roles 'rolenames' are replaced or added to, even when
+            that's done by assigning to Role.permissions directly.
+        '''
+        stamp = []
+        for rolename in rolenames:
+            role = self.role.get(rolename)
+            if role is not None:
+                stamp.append((id(role.permissions), len(role.permissions)))
+        return tuple(stamp)
+
     def getPermission(self, permission, classname=None, properties=None,
             check=None):
         ''' Find the Permission matching the name and for the class, if the
@@ -183,20 +262,89 @@ class Security:
 
            Note that this functionality is actually implemented by the
            Permission.test() method.
+
+           Decisions are remembered until the end of the transaction
+           unless they depend on a check function that isn't marked
+           cacheable.
         '''
         if itemid and classname is None:
             raise ValueError, 'classname must accompany itemid'
-        for rolename in self.db.user.get_roles(userid):
+        roles = tuple(self.db.user.get_roles(userid))
+        stamp = self.roleStamp(roles)
+        key = (permission, userid, classname, property, itemid)
+        cached = self.decisions.get(key)
+        if cached is not None and cached[0] == (roles, stamp):
+            return cached[1]
+
+        result = 0
+        cacheable = True
+        for rolename in roles:
             if not rolename or not self.role.has_key(rolename):
                 continue
             # for each of the user's Roles, check the permissions
-            for perm in self.role[rolename].permissions:
+            for perm in self.rolePermissions(rolename, permission,
+                    classname):
+                if itemid is not None and not perm.cacheable():
+                    cacheable = False
                 # permission match?
                 if perm.test(self.db, permission, classname, property,
                         userid, itemid):
+                    result = 1
+                    break
+            if result:
+                break
+
+        if cacheable or result and perm.cacheable():
+            if len(self.decisions) >= self.decision_cache_size:
+                self.decisions = {}
+            self.decisions[key] = ((roles, stamp), result)
+        return result
+
+    def hasUnconditionalPermission(self, permission, userid, classname,
+            property=None):
+        ''' Return true if "userid" has "permission" on all items of
+            "classname" (and on "property" if given), ie. through a
+            Permission without check function. hasPermission doesn't
+            need to be asked for each item then.
+        '''
+        for rolename in self.db.user.get_roles(userid):
+            if not rolename or not self.role.has_key(rolename):
+                continue
+            for perm in self.rolePermissions(rolename, permission,
+                    classname):
+                if perm.check is None and perm.test(self.db, permission,
+                        classname, property, userid, None):
                     return 1
         return 0
 
+    def permissionFilters(self, permission, userid, classname):
+        ''' Return a list of filterspecs selecting the items of
+            'classname' for which 'userid' has 'permission': an item
+            is permitted if it matches any of them. An empty filterspec
+            in the list means that all items are permitted.
+
+            Return None if that can't be expressed as filterspecs
+            because a check function applies that has no filter
+            function; hasPermission must be called for each item then.
+        '''
+        filters = []
+        unfiltered = False
+        for rolename in self.db.user.get_roles(userid):
+            if not rolename or not self.role.has_key(rolename):
+                continue
+            for perm in self.rolePermissions(rolename, permission,
+                    classname):
+                if perm.check is None:
+                    return [{}]
+                if perm.filter is None:
+                    unfiltered = True
+                else:
+                    filters.extend(perm.filter(self.db, userid,
+                        self.db.getclass(classname)))
+        if unfiltered:
+            return None
+        return filters
+
     def roleHasSearchPermission(self, classname, property, *rolenames):
         """ For each of the given roles, check the permissions.
             Property can be a transitive property.
@@ -286,6 +434,8 @@ class Security:
         '''
         role = Role(**propspec)
         self.role[role.name] = role
+        self.role_index = {}
+        self.decisions = {}
         return role
 
     def addPermissionToRole(self, rolename, permission, classname=None,
@@ -304,6 +454,8 @@ class Security:
                 properties, check)
         role = self.role[rolename.lower()]
         role.permissions.append(permission)
+        self.role_index = {}
+        self.decisions = {}
 
     # Convenience methods for removing non-allowed properties from a
     # filterspec or sort/group list
@@ -58,6 +58,128 @@ class PrioList:
             self.sorted = True
         return iter(self.list)
 
+class LRUCache:
+    '''A mapping holding at most 'maxsize' entries, discarding the least
+    recently used entry when it gets full.
+
+    If 'maxbytes' is non-zero the total of 'sizeof(value)' over all
+    entries is limited too. Lookup, insertion, refresh and deletion are
+    all O(1): entries live in a dict and in a circular doubly-linked
+    list ordered from the most to the least recently used.
+    The number of entries discarded so far is kept in 'evictions'.
+    >>> c = LRUCache(2)
+    >>> c['a'] = 1
+    >>> c['b'] = 2
+    >>> c['a']
+    1
+    >>> c['c'] = 3
+    >>> c.keys()
+    ['c', 'a']
+
+    '''
+    # indexes into the list entries
+    PREV, NEXT, KEY, VALUE, SIZE = range(5)
+
+    def __init__(self, maxsize, maxbytes=0, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.evictions = 0
+        self.clear()
+
+    def clear(self):
+        self.root = root = []
+        root[:] = [root, root, None, None, 0]
+        self.map = {}
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.map)
+
+    def __contains__(self, key):
+        return key in self.map
+
+    has_key = __contains__
+
+    def __iter__(self):
+        root = self.root
+        link = root[self.NEXT]
+        while link is not root:
+            yield link[self.KEY]
+            link = link[self.NEXT]
+
+    def keys(self):
+        return list(self)
+
+    def _unlink(self, link):
+        link[self.PREV][self.NEXT] = link[self.NEXT]
+        link[self.NEXT][self.PREV] = link[self.PREV]
+
+    def _link_first(self, link):
+        root = self.root
+        first = root[self.NEXT]
+        link[self.PREV] = root
+        link[self.NEXT] = first
+        first[self.PREV] = root[self.NEXT] = link
+
+    def refresh(self, key):
+        '''Mark the entry for 'key' as the most recently used.'''
+        link = self.map[key]
+        self._unlink(link)
+        self._link_first(link)
+
+    def __getitem__(self, key):
+        self.refresh(key)
+        return self.map[key][self.VALUE]
+
+    def get(self, key, default=None):
+        if key not in self.map:
+            return default
+        return self[key]
+
+    def peek(self, key, default=None):
+        '''Return the value for 'key' without refreshing it.'''
+        link = self.map.get(key)
+        if link is None:
+            return default
+        return link[self.VALUE]
+
+    def put(self, key, value):
+        '''Store 'value' under 'key', return the number of entries
+        discarded to make room for it.'''
+        if key in self.map:
+            del self[key]
+        size = 0
+        if self.maxbytes and self.sizeof is not None:
+            size = self.sizeof(value)
+        link = [None, None, key, value, size]
+        self._link_first(link)
+        self.map[key] = link
+        self.bytes += size
+
+        evicted = 0
+        root = self.root
+        while self.map and (len(self.map) > self.maxsize or
+                (self.maxbytes and self.bytes > self.maxbytes)):
+            del self[root[self.PREV][self.KEY]]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    __setitem__ = put
+
+    def __delitem__(self, key):
+        link = self.map.pop(key)
+        self._unlink(link)
+        self.bytes -= link[self.SIZE]
+
+    def pop(self, key, default=None):
+        if key not in self.map:
+            return default
+        value = self.map[key][self.VALUE]
+        del self[key]
+        return value
+
 class Progress:
     '''Progress display for console applications.
 
@@ -79,7 +201,12 @@ class Progress:
         self.num += 1
 
         if self.num > self.total:
-            print self.info, 'done', ' '*(75-len(self.info)-6)
+            s = '%s done'%self.info
+            elapsed = time.time() - self.start
+            if self.total and elapsed:
+                s += ' (%d in %ds, %.1f/s)'%(self.total, elapsed,
+                    self.total / elapsed)
+            print s + ' '*(75-len(s))
             sys.stdout.flush()
             return self.sequence.next()
 
@@ -107,8 +234,9 @@ class Progress:
             M = M % 60
             S = eta % 60
             if self.total:
-                s = '%s %2d%% (ETA %02d:%02d:%02d)'%(self.info,
-                    self.num * 100. / self.total, H, M, S)
+                s = '%s %2d%% (%.1f/s, ETA %02d:%02d:%02d)'%(self.info,
+                    self.num * 100. / self.total,
+                    self.num / (now - self.start), H, M, S)
             else:
                 s = '%s 0%% (ETA %02d:%02d:%02d)'%(self.info, H, M, S)
         elif self.total:
@@ -87,17 +87,24 @@ class RoundupInstance:
         return result
 
     def filter(self, classname, search_matches, filterspec,
-               sort=[], group=[]):
+               sort=[], group=[], limit=None, offset=None):
         cl = self.db.getclass(classname)
         uid = self.db.getuid()
         security = self.db.security
         filterspec = security.filterFilterspec (uid, classname, filterspec)
         sort = security.filterSortspec (uid, classname, sort)
         group = security.filterSortspec (uid, classname, group)
-        result = cl.filter(search_matches, filterspec, sort=sort, group=group)
-        check = security.hasPermission
-        x = [id for id in result if check('View', uid, classname, itemid=id)]
-        return x
+        return cl.filter_with_permissions(search_matches, filterspec,
+            sort=sort, group=group, permission='View', userid=uid,
+            limit=limit, offset=offset)
+
+    def filter_count(self, classname, search_matches, filterspec):
+        cl = self.db.getclass(classname)
+        uid = self.db.getuid()
+        filterspec = self.db.security.filterFilterspec (uid, classname,
+            filterspec)
+        return cl.filter_count(search_matches, filterspec,
+            permission='View', userid=uid)
 
     def lookup(self, classname, key):
         cl = self.db.getclass(classname)
@@ -116,7 +116,7 @@ msg = FileClass(db, "msg",
                 date=Date(),
                 summary=String(),
                 files=Multilink("file"),
-                messageid=String(),
+                messageid=String(index='nocase'),
                 inreplyto=String(),
                 revision=Link("vcs_rev"))
 
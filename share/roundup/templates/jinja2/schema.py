@@ -59,7 +59,7 @@ msg = FileClass(db, "msg",
                 date=Date(),
                 summary=String(),
                 files=Multilink("file"),
-                messageid=String(),
+                messageid=String(index='nocase'),
                 inreplyto=String())
 
 file = FileClass(db, "file",
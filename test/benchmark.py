@@ -1,134 +1,504 @@
-import sys, os, time
-
-from roundup.hyperdb import String, Password, Link, Multilink, Date, \
-    Interval, DatabaseError, Boolean, Number
-from roundup import date, password
-
-from db_test_base import config
-
-def setupSchema(db, module):
-    status = module.Class(db, "status", name=String())
-    status.setkey("name")
-    user = module.Class(db, "user", username=String(), password=Password(),
-        assignable=Boolean(), age=Number(), roles=String())
-    user.setkey("username")
-    file = module.FileClass(db, "file", name=String(), type=String(),
-        comment=String(indexme="yes"))
-    issue = module.IssueClass(db, "issue", title=String(indexme="yes"),
-        status=Link("status"), nosy=Multilink("user"), deadline=Date(),
-        foo=Interval(), files=Multilink("file"), assignedto=Link('user'))
-    session = module.Class(db, 'session', title=String())
-    session.disableJournalling()
-    db.post_init()
-    db.commit()
+"""Benchmarks for the hyperdb backends.
 
-def main(backendname, time=time.time, numissues=10):
-    try:
-        exec('from roundup.backends import %s as backend'%backendname)
-    except ImportError:
-        return
-
-    times = []
-
-    config.DATABASE = os.path.join('_benchmark', '%s-%s'%(backendname,
-        numissues))
-    if not os.path.exists(config.DATABASE):
-        db = backend.Database(config, 'admin')
-        setupSchema(db, backend)
-        # create a whole bunch of stuff
-        db.user.create(**{'username': 'admin'})
-        db.status.create(name="unread")
-        db.status.create(name="in-progress")
-        db.status.create(name="testing")
-        db.status.create(name="resolved")
-        pc = -1
-        for i in range(numissues):
-            db.user.create(**{'username': 'user %s'%i})
-            for j in range(10):
-                db.user.set(str(i+1), assignable=1)
-                db.user.set(str(i+1), assignable=0)
-            db.issue.create(**{'title': 'issue %s'%i})
-            for j in range(10):
-                db.issue.set(str(i+1), status='2', assignedto='2', nosy=[])
-                db.issue.set(str(i+1), status='1', assignedto='1',
-                    nosy=['1','2'])
-            if (i*100/numissues) != pc:
-                pc = (i*100/numissues)
-                sys.stdout.write("%d%%\r"%pc)
-                sys.stdout.flush()
+Run from the top of the source tree, eg.
+
+    python test/benchmark.py -b anydbm,sqlite -n 1000 -o before.json
+    python test/benchmark.py -b anydbm,sqlite -n 1000 -c before.json
+
+Each backend gets a tracker made from the classic template and filled
+with a generated dataset of the requested number of issues (-n all runs
+the usual sizes, from a thousand to a million issues). The datasets of
+the anydbm and sqlite backends are kept in _benchmark and reused by
+later runs with the same size and seed; memorydb, postgresql and mysql
+ones are generated for every run (the latter two using the database of
+the test suite, if available).
+
+Every scenario is timed on its own and reported as seconds and
+operations per second. Scenarios changing the data roll their
+transaction back so the dataset stays the same. The results can be
+written as JSON (-o) and compared to an earlier run (-c) to spot
+regressions between commits. Tracker settings can be changed with
+--set, eg. to compare the SQLite journal modes:
+
+    python test/benchmark.py -b sqlite -s get,get_writing
+    python test/benchmark.py -b sqlite -s get,get_writing \\
+        --set RDBMS_SQLITE_JOURNAL_MODE=wal --set RDBMS_SQLITE_SYNCHRONOUS=normal
+"""
+
+import sys, os, time, random, shutil, optparse, subprocess, json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+
+from roundup import date, hyperdb
+from roundup.backends import have_backend
+
+from db_test_base import setupTracker
+
+BACKENDS = ['anydbm', 'sqlite', 'memorydb', 'postgresql', 'mysql']
+SIZES = [1000, 100000, 1000000]
+
+# the backends whose dataset can be kept between runs
+PERSISTENT = ['anydbm', 'sqlite']
+
+# tracker config settings given on the command line, (name, value)
+SETTINGS = []
+
+# made-up words for titles and messages, all found by the indexer
+SYLLABLES = ('ka', 'lo', 'mi', 'nu', 'pe', 'ra', 'si', 'to', 've', 'zu',
+    'bar', 'dor', 'fen', 'gil', 'hum', 'jax', 'kor', 'lum', 'mox', 'nar')
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES
+    for c in ('', 'ng', 'st')]
+
+
+def sentence(rand, numwords):
+    return ' '.join([rand.choice(WORDS) for i in range(numwords)])
+
+
+def generate(db, numissues, seed, progress=None):
+    """Fill the classic schema in db with numissues issues, each with a
+    message, and some users linked to them."""
+    rand = random.Random(seed)
+    for i in range(max(10, numissues / 100)):
+        db.user.create(username='user%d'%i, realname=sentence(rand, 2),
+            roles='User')
+    users = db.user.list()
+    statuses = db.status.list()
+    priorities = db.priority.list()
+    for i in range(numissues):
+        author = rand.choice(users)
+        msg = db.msg.create(content=sentence(rand, 30), author=author,
+            date=date.Date())
+        issueid = db.issue.create(title=sentence(rand, 5),
+            status=rand.choice(statuses), priority=rand.choice(priorities),
+            assignedto=rand.choice(users + [None]),
+            nosy=rand.sample(users, rand.randint(0, 3)), messages=[msg])
+        if i % 10 == 0:
+            # give some issues a longer history
+            db.issue.set(issueid, status=rand.choice(statuses))
+        if i % 1000 == 999:
             db.commit()
-    else:
-        db = backend.Database(config, 'admin')
-        setupSchema(db, backend)
+            if progress:
+                progress(i + 1)
+    db.commit()
 
-    sys.stdout.write('%7s: %-6d'%(backendname, numissues))
-    sys.stdout.flush()
 
-    times.append(('start', time()))
+class Environment:
+    """A generated dataset: "db" is the database opened as admin,
+    "tracker" the tracker instance or None if the backend isn't run as
+    a tracker."""
+    tracker = None
+    dirname = None
 
-    # fetch
-    db.clearCache()
-    for i in db.issue.list():
-        db.issue.get(i, 'title')
-    times.append(('fetch', time()))
+    def __init__(self, backend, numissues, seed):
+        self.backend = backend
+        self.numissues = numissues
+        self.seed = seed
 
-    # journals
-    db.clearCache()
-    for i in db.issue.list():
-        db.issue.history(i)
-    times.append(('journal', time()))
+    def close(self):
+        self.db.close()
+
+
+class TrackerEnvironment(Environment):
+    def __init__(self, backend, numissues, seed, basedir):
+        Environment.__init__(self, backend, numissues, seed)
+        self.dirname = os.path.join(basedir, '%s-%s-%s'%(backend,
+            numissues, seed))
+        marker = os.path.join(self.dirname, 'dataset-complete')
+        if backend not in PERSISTENT or not os.path.exists(marker):
+            self.tracker = self.setup(self.dirname)
+            self.db = self.tracker.open('admin')
+            generate(self.db, numissues, seed, self.progress)
+            self.db.close()
+            open(marker, 'w').close()
+        else:
+            from roundup import instance
+            self.tracker = instance.open(self.dirname)
+            self.configure(self.tracker)
+        self.db = self.tracker.open('admin')
+
+    def setup(self, dirname):
+        tracker = setupTracker(dirname, self.backend)
+        self.configure(tracker)
+        return tracker
+
+    def configure(self, tracker):
+        # don't send any mail
+        tracker.config.MAIL_DEBUG = os.path.join(tracker.tracker_home,
+            'mail.log')
+        for name, value in SETTINGS:
+            tracker.config[name] = value
+
+    def progress(self, done):
+        sys.stderr.write('%s: %d of %d issues generated\r'%(self.backend,
+            done, self.numissues))
+        sys.stderr.flush()
+
+
+class MemoryEnvironment(Environment):
+    def __init__(self, backend, numissues, seed, basedir):
+        Environment.__init__(self, backend, numissues, seed)
+        import memorydb
+        self.db = memorydb.create('admin')
+        # memorydb installs the tx_Source test detector
+        self.db.issue.addprop(tx_Source=hyperdb.String())
+        self.db.msg.addprop(tx_Source=hyperdb.String())
+        self.db.tx_Source = 'benchmark'
+        self.db.config.MAIL_DEBUG = os.path.join(basedir, 'memorydb-mail.log')
+        generate(self.db, numissues, seed)
+
+
+def environment(backend, numissues, seed, basedir):
+    if backend == 'memorydb':
+        return MemoryEnvironment(backend, numissues, seed, basedir)
+    return TrackerEnvironment(backend, numissues, seed, basedir)
+
+
+def available(backend):
+    """Check whether we can benchmark backend here."""
+    if backend == 'memorydb':
+        return True
+    if not have_backend(backend):
+        return False
+    if backend in ('postgresql', 'mysql'):
+        # we need the database of the test suite
+        from db_test_base import config
+        from roundup.backends import get_backend
+        try:
+            get_backend(backend).db_exists(config)
+        except Exception:
+            return False
+    return True
 
-    # "calculated" props
-    db.clearCache()
-    for i in db.issue.list():
-        db.issue.get(i, 'activity')
-        db.issue.get(i, 'creator')
-        db.issue.get(i, 'creation')
-    times.append(('jprops', time()))
 
-    # lookup
+# The scenarios. Each is called with the environment and a random
+# generator and returns the number of operations it did, or None if it
+# doesn't apply to the environment. Scenarios needing some preparation
+# return the number of operations and the seconds they took instead.
+
+def sample(env, rand, num):
+    ids = env.db.issue.list()
+    return rand.sample(ids, min(num, len(ids)))
+
+def bench_create(env, rand):
+    db = env.db
+    users = db.user.list()
+    for i in range(100):
+        db.issue.create(title=sentence(rand, 5), assignedto=rand.choice(users),
+            nosy=rand.sample(users, 2))
+    db.rollback()
+    return 100
+
+def bench_set(env, rand):
+    db = env.db
+    statuses = db.status.list()
+    ids = sample(env, rand, 100)
+    for issueid in ids:
+        db.issue.set(issueid, title=sentence(rand, 5),
+            status=rand.choice(statuses))
+    db.rollback()
+    return len(ids)
+
+def bench_get(env, rand):
+    db = env.db
     db.clearCache()
-    for i in range(numissues):
-        db.user.lookup('user %s'%i)
-    times.append(('lookup', time()))
+    ids = sample(env, rand, 1000)
+    for issueid in ids:
+        for name in ('title', 'status', 'assignedto', 'nosy', 'activity',
+                'creator'):
+            db.issue.get(issueid, name)
+    return len(ids)
 
-    # filter
+def bench_lookup(env, rand):
+    db = env.db
     db.clearCache()
+    names = [db.user.get(userid, 'username') for userid in db.user.list()]
+    for name in names:
+        db.user.lookup(name)
+    return len(names)
+
+def bench_filter(env, rand):
+    db = env.db
+    users = db.user.list()
+    for i in range(10):
+        db.clearCache()
+        db.issue.filter(None, {'assignedto': rand.choice(users)},
+            [('-', 'activity')], [('+', 'status')])
+        db.issue.filter(None, {'nosy': rand.choice(users)},
+            [('+', 'priority')], [('+', 'assignedto')])
+    return 20
+
+def bench_filter_page(env, rand):
+    db = env.db
+    for i in range(10):
+        db.clearCache()
+        db.issue.filter(None, {}, [('-', 'activity')], [('+', 'status')],
+            limit=50, offset=rand.randint(0, env.numissues))
+        db.issue.filter_count(None, {})
+    return 10
+
+def bench_search(env, rand):
+    db = env.db
     for i in range(100):
-        db.issue.filter(None, {'assignedto': '1', 'title':'issue'},
-            ('+', 'activity'), ('+', 'status'))
-    times.append(('filter', time()))
+        db.indexer.search([rand.choice(WORDS).upper()], db.issue)
+    return 100
 
-    # filter with multilink
+def bench_history(env, rand):
+    db = env.db
     db.clearCache()
-    for i in range(100):
-        db.issue.filter(None, {'nosy': ['1'], 'assignedto': '1',
-            'title':'issue'}, ('+', 'activity'), ('+', 'status'))
-    times.append(('filtml', time()))
-
-    # results
-    last = None
-    for event, stamp in times:
-        if last is None:
-            first = stamp
-        else:
-            sys.stdout.write(' %-6.2f'%(stamp-last))
-        last = stamp
-    print ' %-6.2f'%(last-first)
-    sys.stdout.flush()
+    ids = sample(env, rand, 200)
+    for issueid in ids:
+        db.issue.history(issueid)
+    return len(ids)
+
+def bench_web_index(env, rand):
+    if env.tracker is None:
+        return None
+    import cgi
+    from roundup.cgi import client
+    environ = {'PATH_INFO': 'issue', 'REQUEST_METHOD': 'GET',
+        'QUERY_STRING': '@columns=id,activity,title,creator,assignedto,'
+        'status&@sort=-activity&@group=priority&@pagesize=50'
+        '&@filter=status&status=-1,1,2,3,4,5,6,7'}
+    for i in range(5):
+        env.db.clearCache()
+        cl = client.Client(env.tracker, None, environ,
+            cgi.FieldStorage(environ=environ))
+        cl.db = env.db
+        cl.userid = '1'
+        cl.classname = 'issue'
+        cl.nodeid = None
+        cl.template = 'index'
+        cl.language = ('en',)
+        cl._ok_message = []
+        cl._error_message = []
+        cl.renderContext()
+    return 5
+
+def admin_tool(dirname, db):
+    from roundup.admin import AdminTool
+    tool = AdminTool()
+    tool.tracker_home = dirname
+    tool.db = db
+    tool.verbose = 0
+    return tool
+
+def bench_export(env, rand):
+    if env.tracker is None:
+        return None
+    exportdir = os.path.join(env.dirname, 'export')
+    if os.path.exists(exportdir):
+        shutil.rmtree(exportdir)
+    tool = admin_tool(env.dirname, env.db)
+    tool.do_export([exportdir])
+    return 1
+
+def bench_import(env, rand):
+    # importing needs an empty tracker of its own
+    if env.tracker is None or env.backend not in PERSISTENT:
+        return None
+    exportdir = os.path.join(env.dirname, 'export')
+    if not os.path.exists(exportdir):
+        bench_export(env, rand)
+    dirname = env.dirname + '-import'
+    tracker = setupTracker(dirname, env.backend)
+    db = tracker.open('admin')
+    # the classic initial data would clash with the import
+    for cn in db.getclasses():
+        for itemid in db.getclass(cn).getnodeids():
+            db.getclass(cn).destroy(itemid)
+    db.commit()
+    start = time.time()
+    tool = admin_tool(dirname, db)
+    tool.do_import([exportdir])
+    db.commit()
+    seconds = time.time() - start
+    db.close()
+    shutil.rmtree(dirname)
+    return 1, seconds
+
+def bench_open_cold(env, rand):
+    # a new process: the tracker is loaded before opening the database
+    if env.tracker is None:
+        return None
+    from roundup import instance
+    for i in range(10):
+        tracker = instance.open(env.dirname)
+        env.configure(tracker)
+        tracker.open('admin').close()
+    return 10
+
+def bench_open_warm(env, rand):
+    # a new request of a running server
+    if env.tracker is None:
+        return None
+    for i in range(50):
+        env.tracker.open('admin').close()
+    return 50
+
+def bench_get_writing(env, rand):
+    # a web server reading while another process keeps committing
+    if env.tracker is None:
+        return None
+    import threading
+    stop = threading.Event()
+    started = threading.Event()
+    def write():
+        # web sessions change the database without touching the dataset
+        db = env.tracker.open('admin')
+        sessions = db.getSessionManager()
+        n = 0
+        started.set()
+        while not stop.isSet():
+            n += 1
+            sessions.set('benchmark%d'%n, user='admin')
+            db.commit()
+        for i in range(1, n + 1):
+            sessions.destroy('benchmark%d'%i)
+        db.commit()
+        db.close()
+    writer = threading.Thread(target=write)
+    writer.start()
+    started.wait()
+    try:
+        start = time.time()
+        ops = bench_get(env, rand)
+        seconds = time.time() - start
+    finally:
+        stop.set()
+        writer.join()
+    return ops, seconds
+
+SCENARIOS = [
+    ('create', bench_create),
+    ('set', bench_set),
+    ('get', bench_get),
+    ('lookup', bench_lookup),
+    ('filter', bench_filter),
+    ('filter_page', bench_filter_page),
+    ('search', bench_search),
+    ('history', bench_history),
+    ('web_index', bench_web_index),
+    ('export', bench_export),
+    ('import', bench_import),
+    ('open_cold', bench_open_cold),
+    ('open_warm', bench_open_warm),
+    ('get_writing', bench_get_writing),
+]
+
+
+def run(backends, sizes, scenarios, seed, basedir, out=sys.stdout):
+    results = []
+    for numissues in sizes:
+        for backend in backends:
+            if not available(backend):
+                out.write('%-10s not available, skipped\n'%backend)
+                continue
+            start = time.time()
+            env = environment(backend, numissues, seed, basedir)
+            out.write('%-10s %8d issues, set up in %.1fs\n'%(backend,
+                numissues, time.time() - start))
+            rand = random.Random(seed)
+            for name, scenario in SCENARIOS:
+                if name not in scenarios:
+                    continue
+                start = time.time()
+                ops = scenario(env, rand)
+                seconds = time.time() - start
+                if ops is None:
+                    continue
+                if isinstance(ops, tuple):
+                    ops, seconds = ops
+                results.append(dict(backend=backend, issues=numissues,
+                    scenario=name, ops=ops, seconds=seconds))
+                out.write('    %-12s %6d ops %10.3fs %10.1f ops/s\n'%(name,
+                    ops, seconds, ops / max(seconds, 1e-9)))
+                out.flush()
+            env.close()
+    return results
+
+
+def compare(results, previous, out=sys.stdout, threshold=1.1):
+    """Print how the timings of results relate to those of an earlier
+    run; report the scenarios more than threshold times slower."""
+    old = {}
+    for r in previous['results']:
+        old[r['backend'], r['issues'], r['scenario']] = r
+    slower = 0
+    for r in results:
+        o = old.get((r['backend'], r['issues'], r['scenario']))
+        if o is None or not o['seconds'] or o['ops'] != r['ops']:
+            continue
+        ratio = r['seconds'] / o['seconds']
+        flag = ''
+        if ratio > threshold:
+            flag = '  SLOWER'
+            slower += 1
+        out.write('%-10s %8d %-12s %8.3fs -> %8.3fs %6.2fx%s\n'%(r['backend'],
+            r['issues'], r['scenario'], o['seconds'], r['seconds'], ratio,
+            flag))
+    return slower
+
+
+def revision():
+    """Return the git commit we're running, if we can find out."""
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return p.communicate()[0].strip() or None
+    except OSError:
+        return None
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-b', '--backends', default='anydbm,sqlite,memorydb',
+        help='comma-separated backends to run, out of %s'%','.join(BACKENDS))
+    parser.add_option('-n', '--issues', default='1000',
+        help='comma-separated dataset sizes, or "all" for %s'%','.join(
+        map(str, SIZES)))
+    parser.add_option('-s', '--scenarios',
+        default=','.join([name for name, f in SCENARIOS]),
+        help='comma-separated scenarios to run')
+    parser.add_option('--seed', type='int', default=1,
+        help='seed of the dataset and scenario generators')
+    parser.add_option('-d', '--dir', default='_benchmark',
+        help='directory to keep the datasets in')
+    parser.add_option('--set', action='append', default=[],
+        metavar='NAME=VALUE', help='change a tracker setting, eg. '
+        'RDBMS_SQLITE_JOURNAL_MODE=wal (may be repeated)')
+    parser.add_option('-o', '--output', help='write the results as JSON')
+    parser.add_option('-c', '--compare',
+        help='compare with the JSON results of an earlier run')
+    options, args = parser.parse_args(args)
+    for setting in options.set:
+        if '=' not in setting:
+            parser.error('--set needs NAME=VALUE, not %r'%setting)
+        SETTINGS.append(tuple(setting.split('=', 1)))
+    if options.issues == 'all':
+        sizes = SIZES
+    else:
+        sizes = [int(n) for n in options.issues.split(',')]
+    if not os.path.exists(options.dir):
+        os.makedirs(options.dir)
+
+    results = run(options.backends.split(','), sizes,
+        options.scenarios.split(','), options.seed, options.dir)
+
+    if options.output:
+        f = open(options.output, 'w')
+        json.dump(dict(revision=revision(), python=sys.version.split()[0],
+            seed=options.seed, results=results), f, indent=1)
+        f.close()
+    if options.compare:
+        f = open(options.compare)
+        previous = json.load(f)
+        f.close()
+        if compare(results, previous):
+            return 1
+    return 0
 
 if __name__ == '__main__':
-    #      0         1         2         3         4         5         6
-    #      01234567890123456789012345678901234567890123456789012345678901234
-    print 'Test name       fetch  journl jprops lookup filter filtml TOTAL '
-    for name in 'anydbm metakit sqlite'.split():
-        main(name)
-    for name in 'anydbm metakit sqlite'.split():
-        main(name, numissues=20)
-    for name in 'anydbm metakit sqlite'.split():
-        main(name, numissues=100)
-    # don't even bother benchmarking the dbm backends > 100!
-    for name in 'metakit sqlite'.split():
-        main(name, numissues=1000)
+    sys.exit(main())
 
 # vim: set et sts=4 sw=4 :
@@ -88,8 +88,10 @@ def setupSchema(db, create, module):
     file = module.FileClass(db, "file", name=String(), type=String(),
         comment=String(indexme="yes"), fooz=Password())
     file_nidx = module.FileClass(db, "file_nidx", content=String(indexme='no'))
-    issue = module.IssueClass(db, "issue", title=String(indexme="yes"),
-        status=Link("status"), nosy=Multilink("user"), deadline=Date(),
+    issue = module.IssueClass(db, "issue",
+        title=String(indexme="yes", index="nocase"),
+        status=Link("status", index="yes"), nosy=Multilink("user"),
+        deadline=Date(),
         foo=Interval(), files=Multilink("file"), assignedto=Link('user'),
         priority=Link('priority'), spam=Multilink('msg'),
         feedback=Link('msg'))
@@ -98,7 +100,7 @@ def setupSchema(db, create, module):
     msg = module.FileClass(db, "msg", date=Date(),
                            author=Link("user", do_journal='no'),
                            files=Multilink('file'), inreplyto=String(),
-                           messageid=String(),
+                           messageid=String(index='nocase'),
                            recipients=Multilink("user", do_journal='no')
                            )
     session.disableJournalling()
@@ -216,6 +218,16 @@ class DBTest(commonDBTest):
         self.assertNotEqual(i.get(id1, 'creator'), i.get(id1, 'actor'))
 
     # ID number controls
+    def testGetNodes(self):
+        ids = [self.db.issue.create(title='spam%s'%i, nosy=['1', '2'])
+            for i in range(3)]
+        self.db.commit()
+        nodes = self.db.issue.getnodes(ids, ['nosy'])
+        self.assertEqual([n.title for n in nodes], ['spam0', 'spam1', 'spam2'])
+        self.assertEqual(nodes[2].nosy, ['1', '2'])
+        # unknown ids are no problem when prefetching
+        self.db.prefetch('issue', ['999', 'spam'], ['nosy'])
+
     def testIDGeneration(self):
         id1 = self.db.issue.create(title="spam", status='1')
         id2 = self.db.issue.create(title="eggs", status='2')
@@ -995,6 +1007,42 @@ class DBTest(commonDBTest):
         self.assertEquals(self.db.indexer.search(['three'], self.db.issue),
             {i2: {'spam': [m2]}})
 
+    def testIndexerSearchRanked(self):
+        m1 = self.db.msg.create(content="the disk is full, full, full")
+        m2 = self.db.msg.create(content="full disk")
+        i1 = self.db.issue.create(title="reindexing is slow", messages=[m1])
+        i2 = self.db.issue.create(title="reindex the tracker", messages=[m2])
+        i3 = self.db.issue.create(title="disk quota")
+        self.db.commit()
+        search = self.db.indexer.search_ranked
+        ids = lambda text, **kw: [nodeid for nodeid, score in
+            search(text, self.db.issue, **kw)]
+        self.assertEquals(search('', self.db.issue), [])
+        self.assertEquals(search('the', self.db.issue), [])
+        self.assertEquals(ids('nothing'), [])
+
+        # all the words must match, in the issue or a linked item
+        self.assertEquals(sorted(ids('disk')), [i1, i2, i3])
+        self.assertEquals(ids('disk quota'), [i3])
+        self.assertEquals(sorted(ids('full disk')), [i1, i2])
+
+        # prefixes
+        self.assertEquals(sorted(ids('reindex*')), [i1, i2])
+        self.assertEquals(ids('reindex'), [i2])
+        self.assertEquals(ids('reindexing slo*'), [i1])
+
+        # phrases
+        self.assertEquals(ids('"full disk"'), [i2])
+        self.assertEquals(ids('"disk is full"'), [i1])
+        self.assertEquals(ids('"reindex the tracker"'), [i2])
+        self.assertEquals(ids('"tracker reindex"'), [])
+
+        # ranking and limit
+        self.assertEquals(ids('full', limit=1), [i1])
+        self.assertEquals(len(search('disk', self.db.issue, limit=2)), 2)
+        scores = dict(search('disk', self.db.issue))
+        self.assert_(scores[i1] > 0)
+
     def testReindexingChange(self):
         search = self.db.indexer.search
         issue = self.db.issue
@@ -1067,6 +1115,48 @@ class DBTest(commonDBTest):
         self.assertEquals(self.db.indexer.search(['flebble'], self.db.issue),
             {'1': {}})
 
+    def testReindexChunks(self):
+        for i in range(5):
+            self.db.issue.create(title="flebble frooz%d"%i)
+        self.db.commit()
+        self.db.config.INDEXER_REINDEX_CHUNK_SIZE = 2
+        self.db.config.INDEXER_REINDEX_WORKERS = 2
+        # commit and record the progress after every chunk
+        self.db.reindex_checkpoint_interval = -1
+        try:
+            self.db.reindex('issue', checkpoint=True)
+        finally:
+            self.db.config.INDEXER_REINDEX_CHUNK_SIZE = 1000
+            self.db.config.INDEXER_REINDEX_WORKERS = 0
+        self.assertEquals(self.db.indexer.search(['flebble'], self.db.issue),
+            dict([(str(i), {}) for i in range(1, 6)]))
+        self.assertEquals(self.db.indexer.search(['frooz3'], self.db.issue),
+            {'4': {}})
+
+    def testReindexResume(self):
+        for i in range(4):
+            self.db.issue.create(title="flebble frooz")
+        self.db.commit()
+        path = os.path.join(self.db.config.DATABASE, 'reindex-checkpoint')
+        self.db.save_reindex_checkpoint(path, ['issue'], 'issue', '2')
+        indexed = []
+        index_texts = self.db.issue.index_texts
+        def record(nodeid):
+            indexed.append(nodeid)
+            return index_texts(nodeid)
+        self.db.issue.index_texts = record
+        self.db.reindex('issue', checkpoint=True)
+        self.assertEquals(indexed, ['3', '4'])
+        self.assert_(not os.path.exists(path))
+        self.assertEquals(len(self.db.indexer.search(['flebble'],
+            self.db.issue)), 4)
+
+        # a checkpoint of other classes is ignored
+        self.db.save_reindex_checkpoint(path, ['user'], 'user', '2')
+        del indexed[:]
+        self.db.reindex('issue', checkpoint=True)
+        self.assertEquals(indexed, ['1', '2', '3', '4'])
+
     def testIndexingPropertiesOnImport(self):
         # import an issue
         title = 'Bzzt'
@@ -1192,6 +1282,52 @@ class DBTest(commonDBTest):
         self.db.issue.retire(ids[0])
         self.assertEqual(len(self.db.issue.stringFind(title='spam')), 1)
 
+    def testPropertyIndexes(self):
+        self.assertEqual(self.db.issue.getindexes(),
+            {'title': 'nocase', 'status': 'yes'})
+        self.assertEqual(self.db.user.getindexes(), {})
+        self.assertRaises(ValueError, String, index='maybe')
+        self.assertRaises(ValueError, Link, 'user', index='nocase')
+
+    def testStringFindIndexed(self):
+        one = self.db.issue.create(title="Spam")
+        two = self.db.issue.create(title="eggs")
+        self.db.commit()
+        self.assertEqual(self.db.issue.stringFind(title='SPAM'), [one])
+
+        # uncommitted changes are seen, committed ones too
+        self.db.issue.set(two, title="spam")
+        three = self.db.issue.create(title="spam")
+        got = self.db.issue.stringFind(title='spam')
+        got.sort()
+        self.assertEqual(got, [one, two, three])
+        self.db.commit()
+        got = self.db.issue.stringFind(title='spam')
+        got.sort()
+        self.assertEqual(got, [one, two, three])
+        self.assertEqual(self.db.issue.stringFind(title='eggs'), [])
+
+        self.db.issue.destroy(two)
+        self.assertEqual(len(self.db.issue.stringFind(title='spam')), 2)
+        self.db.commit()
+        self.assertEqual(len(self.db.issue.stringFind(title='spam')), 2)
+
+    def testFindIndexed(self):
+        one, two, three, four = self._find_test_setup()
+        self.db.commit()
+        self.db.issue.set(one, status='3')
+        got = self.db.issue.find(status='1')
+        self.assertEqual(got, [three])
+        self.db.commit()
+        self.assertEqual(self.db.issue.find(status='1'), [three])
+        got = self.db.issue.find(status={'3':1})
+        got.sort()
+        self.assertEqual(got, [one, four])
+        self.db.issue.set(one, status=None)
+        self.db.commit()
+        self.assertEqual(self.db.issue.find(status={'3':1}), [four])
+        self.assertEqual(self.db.issue.find(status=None), [one])
+
     def filteringSetup(self, classname='issue'):
         for user in (
                 {'username': 'bleep', 'age': 1, 'assignable': True},
@@ -1224,6 +1360,76 @@ class DBTest(commonDBTest):
             ae(filt(None, {'id': '2'}, ('+','id'), (None,None)), ['2'])
             ae(filt(None, {'id': '100'}, ('+','id'), (None,None)), [])
 
+    def testFilteringWithPermissions(self):
+        ae, filter, filter_iter = self.filteringSetup()
+        security = self.db.security
+        def own_issue(db, userid, itemid):
+            return (db.issue.get(itemid, 'assignedto') == userid
+                or userid in db.issue.get(itemid, 'nosy'))
+        def own_issue_filter(db, userid, klass):
+            return [{'assignedto': userid}, {'nosy': userid}]
+        security.addRole(name='Own')
+        security.addPermissionToRole('Own', security.addPermission(
+            name='View', klass='issue', check=own_issue,
+            filter=own_issue_filter))
+        security.addRole(name='Odd')
+        security.addPermissionToRole('Odd', security.addPermission(
+            name='View', klass='issue',
+            check=lambda db, userid, itemid: int(itemid) % 2))
+        self.db.user.set('2', roles='Own')
+        self.db.user.set('3', roles='Own')
+        self.db.user.set('4', roles='Odd')
+        self.db.user.set('5', roles='Own,Odd')
+        self.assertEqual(security.permissionFilters('View', '2', 'issue'),
+            [{'assignedto': '2'}, {'nosy': '2'}])
+        self.assertEqual(security.permissionFilters('View', '1', 'issue'),
+            [{}])
+        self.assertEqual(security.permissionFilters('View', '4', 'issue'),
+            None)
+        f = self.db.issue.filter_with_permissions
+        ae(f(None, {}, [('+','id')], [], 'View', '1'), ['1','2','3','4'])
+        ae(f(None, {}, [('+','id')], [], 'View', '2'), ['2','3','4'])
+        ae(f(None, {}, [('-','id')], [], 'View', '2'), ['4','3','2'])
+        ae(f(None, {'status': '1'}, [('+','id')], [], 'View', '2'),
+            ['2','3'])
+        ae(f(['1','2'], {}, [('+','id')], [], 'View', '2'), ['2'])
+        ae(f(None, {}, [('+','id')], [], 'View', '3'), ['4'])
+        ae(f(None, {}, [('+','id')], [], 'Edit', '3'), [])
+        # check functions without a filter are called for each item
+        ae(f(None, {}, [('+','id')], [], 'View', '4'), ['1','3'])
+        ae(f(None, {}, [('+','id')], [], 'View', '5'), ['1','3'])
+        # which can't be done in the query
+        supports = self.db.issue.supports_permission_filters
+        self.assertEqual(supports('View', '2'),
+            hasattr(self.db.issue, 'supports_subselects') and
+            self.db.issue.supports_subselects())
+        self.assertEqual(supports('View', '4'), False)
+        self.assertEqual(supports('View', '5'), False)
+
+    def testFilteringLimit(self):
+        ae, filter, filter_iter = self.filteringSetup()
+        for filt in filter, filter_iter:
+            ae(filt(None, {}, [('+','id')], [], 2), ['1','2'])
+            ae(filt(None, {}, [('+','id')], [], 2, 1), ['2','3'])
+            ae(filt(None, {}, [('-','id')], [], 2, 3), ['1'])
+            ae(filt(None, {}, [('+','id')], [], None, 3), ['4'])
+            ae(filt(None, {}, [('+','id')], [], 0), [])
+            ae(filt(None, {'status': '1'}, [('+','title')], [], 1, 1),
+                ['2'])
+            ae(filt(None, {}, [('+','id')], [], 2, 10), [])
+        # sorting by a Multilink is done in Python, by a Link in SQL
+        for sort in [('-','nosy')], [('+','priority')]:
+            ae(filter(None, {}, sort, [], 2, 1), filter(None, {}, sort)[1:3])
+        f = self.db.issue.filter_with_permissions
+        ae(f(None, {}, [('-','id')], [], 'View', '1', 2, 1), ['3','2'])
+        count = self.db.issue.filter_count
+        ae(count(None, {}), 4)
+        ae(count(None, {'status': '1'}), 2)
+        ae(count(None, {'nosy': '2'}), 2)
+        ae(count(['1','3'], {'nosy': '2'}), 1)
+        ae(count(None, {'title': 'nonexistent'}), 0)
+        ae(count(None, {}, 'View', '1'), 4)
+
     def testFilteringBoolean(self):
         ae, filter, filter_iter = self.filteringSetup('user')
         a = 'assignable'
@@ -2463,6 +2669,289 @@ class FilterCacheTest(commonDBTest):
         ae (result, ['4', '5', '6', '7', '8', '1', '2', '3'])
 
 
+class SchemaFingerprintTest(commonDBTest):
+    """ tests of the schema fingerprint of the RDBMS backends """
+    def testUnchanged(self):
+        self.assertEqual(self.db.load_schema_fingerprint(),
+            self.db.schema_fingerprint())
+        self.db.close()
+        self.open_database()
+        def update_dbschema(fingerprint):
+            self.fail('schema compared with the database')
+        self.db.update_dbschema = update_dbschema
+        setupSchema(self.db, 0, self.module)
+        self.db.issue.create(title='spam')
+        self.db.commit()
+
+    def testChanged(self):
+        old = self.db.schema_fingerprint()
+        self.db.issue.addprop(fixer=Link('user'))
+        self.assertNotEqual(self.db.schema_fingerprint(), old)
+        self.db.post_init()
+        self.assertEqual(self.db.load_schema_fingerprint(),
+            self.db.schema_fingerprint())
+        self.db.issue.create(title='spam', fixer='1')
+        self.db.commit()
+
+        # a declared index changes the fingerprint too
+        old = self.db.schema_fingerprint()
+        self.db.user.properties['realname'].index = 'nocase'
+        self.assertNotEqual(self.db.schema_fingerprint(), old)
+
+
+class ConnectionPoolTest(commonDBTest):
+    """ tests of the connection pool of the RDBMS backends """
+    def setUp(self):
+        config.RDBMS_CONNECTION_POOL_SIZE = 2
+        commonDBTest.setUp(self)
+        self.db.pool.clear()
+
+    def tearDown(self):
+        commonDBTest.tearDown(self)
+        self.db.pool.clear()
+        config.RDBMS_CONNECTION_POOL_SIZE = 0
+
+    def reopen(self):
+        self.db.close()
+        self.open_database()
+        setupSchema(self.db, 0, self.module)
+
+    def testReuse(self):
+        self.db.issue.create(title='spam')
+        self.db.commit()
+        conn = self.db.conn
+        self.reopen()
+        self.assert_(self.db.conn is conn)
+        self.assertEqual(self.db.database_schema, self.db.pool.schema)
+
+        # once verified, the schema isn't read again but copied
+        def load_dbschema(db):
+            self.fail('schema loaded from the database')
+        load = self.module.Database.load_dbschema
+        self.module.Database.load_dbschema = load_dbschema
+        try:
+            self.reopen()
+        finally:
+            self.module.Database.load_dbschema = load
+        self.assert_(self.db.conn is conn)
+        self.assert_(self.db.database_schema is not self.db.pool.schema)
+        self.assertEqual(self.db.issue.get('1', 'title'), 'spam')
+
+    def testRollbackOnClose(self):
+        self.db.issue.create(title='spam')
+        self.reopen()
+        self.assertEqual(self.db.issue.list(), [])
+
+    def testCloseTwice(self):
+        conn = self.db.conn
+        self.db.close()
+        self.db.close()
+        self.assertEqual(len(self.db.pool.idle), 1)
+        self.open_database()
+        self.assert_(self.db.conn is conn)
+        self.assertEqual(self.db.pool.idle, [])
+
+    def testBrokenConnection(self):
+        conn = self.db.conn
+        self.db.close()
+        conn.close()
+        self.open_database()
+        self.assert_(self.db.conn is not conn)
+        self.assertEqual(self.db.pool.idle, [])
+        setupSchema(self.db, 0, self.module)
+        self.db.issue.create(title='spam')
+        self.db.commit()
+
+    def testMaxAge(self):
+        conn = self.db.conn
+        self.db.pool.max_age = 0
+        try:
+            self.reopen()
+            self.assert_(self.db.conn is not conn)
+            self.assertEqual(self.db.pool.idle, [])
+        finally:
+            self.db.pool.max_age = config.RDBMS_CONNECTION_MAX_AGE
+
+    def testSchemaChangedElsewhere(self):
+        self.reopen()
+        self.db.close()
+        # a connection outside of the pool adds a property
+        config.RDBMS_CONNECTION_POOL_SIZE = 0
+        try:
+            self.open_database()
+            setupSchema(self.db, 0, self.module)
+            self.db.issue.addprop(fixer=Link('user'))
+            self.db.post_init()
+            self.db.close()
+        finally:
+            config.RDBMS_CONNECTION_POOL_SIZE = 2
+        # the pooled schema is outdated, the property is dropped anyway
+        self.open_database()
+        self.assert_(self.db.schema_pooled)
+        setupSchema(self.db, 0, self.module)
+        self.db.sql('select * from _issue')
+        columns = [d[0] for d in self.db.cursor.description]
+        self.assert_('_fixer' not in columns)
+
+    def testPoolSize(self):
+        dbs = [self.module.Database(config, 'admin') for i in range(2)]
+        for db in dbs:
+            db.close()
+        self.db.close()
+        self.assertEqual(len(self.db.pool.idle), 2)
+        self.open_database()
+
+
+class NodeCacheTest(commonDBTest):
+    """ tests of the node caches of the RDBMS backends """
+    def setUp(self):
+        config.RDBMS_SHARED_CACHE_SIZE = 100
+        commonDBTest.setUp(self)
+        if self.db.shared_cache is not None:
+            self.db.shared_cache.lru.clear()
+
+    def tearDown(self):
+        config.RDBMS_SHARED_CACHE_SIZE = 0
+        commonDBTest.tearDown(self)
+
+    def testCacheEviction(self):
+        self.db.cache.maxsize = 2
+        self.db.clearCache()
+        evictions = self.db.stats['cache_evictions']
+        for id in self.db.status.list():
+            self.db.status.get(id, 'name')
+        self.assertEqual(len(self.db.cache), 2)
+        self.assertEqual(self.db.stats['cache_evictions'] - evictions,
+            len(self.db.status.list()) - 2)
+        # the most recently used items are kept
+        self.assertEqual(self.db.cache.keys(), [('status', '4'),
+            ('status', '3')])
+
+    def testPrefetch(self):
+        ids = [self.db.issue.create(title='spam%s'%i, nosy=['1', '2'])
+            for i in range(5)]
+        self.db.issue.create(title='eggs')
+        self.db.commit()
+        self.db.clearCache()
+        self.db.prefetch_chunk_size = 2
+        self.db.prefetch('issue', ids + ['999'], ['nosy', 'title'])
+        self.assertEqual(len(self.db.cache), 5)
+        misses = self.db.stats['cache_misses']
+        for id in ids:
+            self.assertEqual(self.db.issue.get(id, 'nosy'), ['1', '2'])
+            self.assert_(self.db.issue.get(id, 'title').startswith('spam'))
+        self.assertEqual(self.db.stats['cache_misses'], misses)
+
+        # no more items are fetched than fit into the cache
+        self.db.clearCache()
+        self.db.cache.maxsize = 3
+        self.db.prefetch('issue', ids, ['nosy'])
+        self.assertEqual(self.db.cache.keys(), [('issue', id)
+            for id in ids[2::-1]])
+
+    def testSharedCache(self):
+        id = self.db.issue.create(title='spam', status='1', nosy=['1'])
+        self.db.commit()
+        self.db.issue.get(id, 'title')
+        self.db.commit()
+        hits = self.db.stats['shared_cache_hits']
+        self.assertEqual(self.db.issue.get(id, 'title'), 'spam')
+        self.assertEqual(self.db.issue.get(id, 'nosy'), ['1'])
+        self.assertEqual(self.db.stats['shared_cache_hits'], hits + 1)
+
+        # a change in another connection is seen by the first one
+        self.db.commit()
+        db2 = self.module.Database(config, 'admin')
+        setupSchema(db2, 0, self.module)
+        self.assertEqual(db2.issue.get(id, 'title'), 'spam')
+        db2.issue.set(id, title='eggs', nosy=['1', '2'])
+        db2.commit()
+        db2.close()
+        self.db.commit()
+        self.assertEqual(self.db.issue.get(id, 'title'), 'eggs')
+        self.assertEqual(self.db.issue.get(id, 'nosy'), ['1', '2'])
+
+    def testSharedCacheUncommitted(self):
+        id = self.db.issue.create(title='spam', status='1')
+        self.db.commit()
+        self.db.issue.set(id, title='eggs')
+        self.db.clearCache()
+        self.assertEqual(self.db.issue.get(id, 'title'), 'eggs')
+        self.db.rollback()
+        self.assertEqual(self.db.issue.get(id, 'title'), 'spam')
+
+
+class JournalFormatTest(commonDBTest):
+    """ tests of the journal params encoding of the RDBMS backends """
+    def raw_params(self, classname, nodeid):
+        self.db.sql('select params from %s__journal where nodeid=%s '
+            'order by date'%(classname, self.db.arg), (nodeid,))
+        return [row[0] for row in self.db.sql_fetchall()]
+
+    def testJournalValues(self):
+        id = self.db.issue.create(title='spam', status='1')
+        self.db.commit()
+        deadline = date.Date('2015-03-01.12:00')
+        self.db.issue.set(id, title='\xc3\xa4pfel', nosy=['1', '2'],
+            deadline=deadline, foo=date.Interval('-1d'))
+        self.db.issue.set(id, title='eggs', deadline=date.Date('.'),
+            foo=None, nosy=['2'])
+        self.db.user.set('2', password=password.Password('pw'),
+            assignable=1)
+        self.db.user.set('2', password=password.Password('sekrit'),
+            assignable=0)
+        self.db.commit()
+        for params in self.raw_params('issue', id):
+            self.assert_(params.startswith('1:'))
+
+        journal = self.db.getjournal('issue', id)
+        params = journal[-1][4]
+        self.assertEqual(params['title'], '\xc3\xa4pfel')
+        self.assert_(isinstance(params['title'], str))
+        self.assertEqual(params['deadline'], deadline)
+        self.assertEqual(params['foo'], date.Interval('-1d'))
+        self.assertEqual(params['nosy'], (('-', ['1']),))
+        params = journal[-2][4]
+        self.assertEqual(params['nosy'], (('+', ['1', '2']),))
+        self.assertEqual(params['deadline'], None)
+
+        params = self.db.getjournal('user', '2')[-1][4]
+        self.assert_(isinstance(params['password'], password.JournalPassword))
+        self.assertEqual(params['assignable'], 1)
+
+        link = self.db.getjournal('user', '1')[-1]
+        self.assertEqual(link[3:], ('unlink', ('issue', id, 'nosy')))
+
+    def testLegacyJournal(self):
+        id = self.db.issue.create(title='spam', status='1')
+        self.db.commit()
+        dc = self.db.to_sql_value(Date)
+        legacy = {'title': 'eggs', 'deadline': dc(date.Date('2015-03-01')),
+            'foo': '- 1d', 'nosy': (('+', ['1']),)}
+        self.db.save_journal('issue', 'nodeid,date,tag,action,params', id,
+            dc(date.Date('.')), '1', 'set', repr(legacy))
+        self.db.save_journal('user', 'nodeid,date,tag,action,params', '1',
+            dc(date.Date('.')), '1', 'link', repr(('issue', id, 'nosy')))
+        self.db.commit()
+
+        def check():
+            params = self.db.getjournal('issue', id)[-1][4]
+            self.assertEqual(params['title'], 'eggs')
+            self.assertEqual(params['deadline'], date.Date('2015-03-01'))
+            self.assertEqual(params['foo'], date.Interval('- 1d'))
+            self.assertEqual(params['nosy'], (('+', ['1']),))
+            link = self.db.getjournal('user', '1')[-1]
+            self.assertEqual(link[3:], ('link', ('issue', id, 'nosy')))
+        check()
+        self.assert_(self.raw_params('issue', id)[-1].startswith('{'))
+
+        # the version 6 upgrade converts the old entries
+        self.db.fix_version_5_tables()
+        for params in self.raw_params('issue', id):
+            self.assert_(params.startswith('1:'))
+        check()
+
+
 class ClassicInitBase(object):
     count = 0
     db = None
@@ -2511,6 +3000,37 @@ class ClassicInitTest(ClassicInitBase):
         l = db.issue.list()
         ae(l, [])
 
+    def testSchemaCache(self):
+        setupTracker(self.dirname, self.backend)
+        tracker = instance.open(self.dirname, optimize=1)
+        db = tracker.open('admin')
+        issue, security = db.issue, db.security
+        db.close()
+        self.assert_(tracker.db_schema is not None)
+
+        # the second open binds copies of the classes built by the first
+        db = self.db = tracker.open('admin')
+        self.assert_(db.issue is not issue)
+        self.assertEqual(db.issue.properties, issue.properties)
+        self.assert_(db.issue.auditors['create'].list is not
+            issue.auditors['create'].list)
+        self.assertEqual(db.issue.db.getclasses(), db.getclasses())
+        self.assert_(db.security is not security)
+        self.assert_(db.security.hasPermission('Edit', '1', 'issue'))
+        # detectors are active and see the security settings
+        self.assertRaises(ValueError, db.user.create, username='fred',
+            roles='nosuchrole')
+        id = db.issue.create(title='spam')
+        self.assertEqual(db.issue.get(id, 'title'), 'spam')
+        db.commit()
+        db.close()
+
+        # the cache may be switched off
+        tracker = instance.Tracker(self.dirname, optimize=1)
+        tracker.config.CACHE_SCHEMA = False
+        db = self.db = tracker.open('admin')
+        self.assertEqual(tracker.db_schema, None)
+
 
 class ConcurrentDBTest(ClassicInitBase):
     def testConcurrency(self):
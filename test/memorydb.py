@@ -161,6 +161,7 @@ class Indexer(indexer_dbm.Indexer):
         self.files = {'_TOP':(0,None)}
         self.fileids = {}
         self.changed = 0
+        self.avglength = None
 
     def save_index(self):
         pass
@@ -183,6 +184,8 @@ class Database(back_anydbm.Database):
         self.classes = {}
         self.items = {}
         self.ids = {}
+        self.indexes = {}
+        self.built_indexes = {}
         self.journals = {}
         self.files = {}
         self.tx_files = {}
@@ -200,6 +203,8 @@ class Database(back_anydbm.Database):
         self.destroyednodes = {}# keep track of the destroyed nodes by class
         self.transactions = []
         self.tx_Source = None
+        self.loaded = {}
+        self.generation = 0
 
     def filename(self, classname, nodeid, property=None, create=0):
         shutil.copyfile(__file__, __file__+'.dummy')
@@ -209,18 +214,36 @@ class Database(back_anydbm.Database):
         return len(self.getfile(classname, nodeid, property))
 
     def post_init(self):
-        pass
+        self.update_indexes()
 
     def refresh_database(self):
         pass
 
+    def lock_read(self):
+        pass
+
+    def lock_exclusive(self):
+        pass
+
+    def lock_shared(self):
+        pass
+
+    def unlock(self):
+        pass
+
+    def get_generation(self):
+        return 0
+
+    def set_generation(self, generation):
+        pass
+
     def getSessionManager(self):
         return self.sessions
 
     def getOTKManager(self):
         return self.otks
 
-    def reindex(self, classname=None, show_progress=False):
+    def reindex(self, classname=None, show_progress=False, checkpoint=False):
         pass
 
     def __repr__(self):
@@ -300,6 +323,8 @@ class Database(back_anydbm.Database):
     #
     def clear(self):
         self.items = {}
+        self.indexes = {}
+        self.built_indexes = {}
 
     def getclassdb(self, classname, mode='r'):
         """ grab a connection to the class db that will be used for
@@ -310,6 +335,15 @@ class Database(back_anydbm.Database):
     def getCachedJournalDB(self, classname):
         return self.journals.setdefault(classname, {})
 
+    def getindexdb(self, classname, mode='r'):
+        return self.indexes.setdefault(classname, cldb())
+
+    def load_index_spec(self):
+        return self.built_indexes
+
+    def save_index_spec(self, spec):
+        self.built_indexes = spec
+
     #
     # Node IDs
     #
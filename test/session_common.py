@@ -1,4 +1,4 @@
-import os, shutil, unittest
+import os, shutil, time, unittest
 
 from db_test_base import config
 
@@ -50,9 +50,85 @@ class SessionTest(object):
         self.sessions.set('random_key', text='nope')
         self.assertEqual(self.sessions.get('random_key', 'text'), 'nope')
 
+    def testValues(self):
+        values = {'text': "__import__('os').getcwd()", 'n': 1.5,
+            'l': ['a', 2], 'd': {'u': u'\xe9'}}
+        self.sessions.set('random_key', **values)
+        self.assertEqual(self.sessions.getall('random_key'), values)
+
+    def testUpdateTimestamp(self):
+        self.sessions.set('random_key', text='hello, world!')
+        # recently used sessions aren't written to
+        self.failIf(self.sessions.updateTimestamp('random_key'))
+        self.sessions.refresh_interval = -1
+        self.sessions.updateTimestamp('random_key')
+        self.assertEqual(self.sessions.getall('random_key'),
+            {'text': 'hello, world!'})
+
 class DBMTest(SessionTest):
     import roundup.backends.sessions_dbm as sessions_module
 
 class RDBMSTest(SessionTest):
     import roundup.backends.sessions_rdbms as sessions_module
 
+    def testValuesStored(self):
+        values = {'text': "__import__('os').getcwd()", 'n': 1.5}
+        self.sessions.set('random_key', **values)
+        # a new store reads them back from the database
+        sessions = self.sessions_module.Sessions(self.db)
+        self.assertEqual(sessions.getall('random_key'), values)
+        self.assertEqual(sessions.get('random_key', 'n'), 1.5)
+
+    def testSetWithoutRead(self):
+        self.sessions.set('random_key', text='hello, world!')
+        # a store that didn't read the record replaces it
+        sessions = self.sessions_module.Sessions(self.db)
+        sessions.set('random_key', n=1)
+        self.assertEqual(sessions.getall('random_key'), {'n': 1})
+        self.db.sql('select count(*) from sessions')
+        self.assertEqual(self.db.cursor.fetchone()[0], 1)
+
+    def testUpdateTimestampWrites(self):
+        self.sessions.set('random_key', text='hello, world!')
+        self.sessions.refresh_interval = -1
+        self.assertEqual(self.sessions.updateTimestamp('random_key'), True)
+
+class MemoryTest(SessionTest):
+    import roundup.backends.sessions_memory as sessions_module
+
+    def setUp(self):
+        # remove previous test, ignore errors
+        if os.path.exists(config.DATABASE):
+            shutil.rmtree(config.DATABASE)
+        os.makedirs(config.DATABASE + '/files')
+        self.db = self.module.Database(config, 'admin')
+        self.sessions = self.sessions_module.Sessions(self.db)
+        self.sessions.clear()
+        self.otks = None
+
+    def testSessionBackend(self):
+        config.WEB_SESSION_BACKEND = 'memory'
+        try:
+            self.assert_(isinstance(self.db.getSessionManager(),
+                self.sessions_module.Sessions))
+        finally:
+            config.WEB_SESSION_BACKEND = 'database'
+
+    def testLRU(self):
+        self.sessions.store.maxsize = 2
+        try:
+            for key in 'a', 'b', 'c':
+                self.sessions.set(key, text=key)
+                self.sessions.get('a', 'text')
+            self.assertEqual(sorted(self.sessions.list()), ['a', 'c'])
+        finally:
+            self.sessions.store.maxsize = config.WEB_SESSION_CACHE_SIZE
+
+    def testClean(self):
+        self.sessions.set('old', text='old')
+        self.sessions.set('new', text='new')
+        self.sessions.store.peek('old')['__timestamp'] = time.time() - \
+            60*60*24*8
+        self.sessions.clean()
+        self.assertEqual(self.sessions.list(), ['new'])
+
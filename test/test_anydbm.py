@@ -16,10 +16,13 @@
 # SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
 
 import unittest, os, shutil, time
-from roundup.backends import get_backend
+from roundup.backends import get_backend, locking
+from roundup.hyperdb import DatabaseError
 
 from db_test_base import DBTest, ROTest, SchemaTest, ClassicInitTest, config
-from db_test_base import HTMLItemTest
+from db_test_base import HTMLItemTest, commonDBTest, setupSchema
+from db_test_base import ClassicInitBase, setupTracker
+from roundup import instance
 
 class anydbmOpener:
     module = get_backend('anydbm')
@@ -48,8 +51,193 @@ class anydbmHTMLItemTest(HTMLItemTest, unittest.TestCase):
     backend = 'anydbm'
 
 
-from session_common import DBMTest
+class anydbmLockingTest(anydbmOpener, commonDBTest, unittest.TestCase):
+    def open_second(self):
+        db = self.module.Database(config, 'admin')
+        setupSchema(db, 0, self.module)
+        return db
+
+    def commit_concurrently(self, classname, **propvalues):
+        # do what another process may do while we wait for the exclusive
+        # lock in commit()
+        locking.release_lock(self.db.lockfile)
+        db2 = self.open_second()
+        try:
+            cl = db2.getclass(classname)
+            if 'id' in propvalues:
+                cl.set(propvalues.pop('id'), **propvalues)
+            else:
+                cl.create(**propvalues)
+            db2.commit()
+        finally:
+            db2.close()
+
+    def locked(self):
+        # would another process have to wait for the exclusive lock?
+        f = open(os.path.join(config.DATABASE, 'lock'), 'a+')
+        try:
+            try:
+                locking.lock(f, block=0)
+            except IOError:
+                return True
+            locking.release_lock(f)
+            return False
+        finally:
+            f.close()
+
+    def testLockedPerTransaction(self):
+        id = self.db.issue.create(title='spam')
+        self.db.commit()
+        self.assert_(not self.locked())
+        self.assertEqual(self.db.issue.get(id, 'title'), 'spam')
+        self.assert_(self.locked())
+        self.db.rollback()
+        self.assert_(not self.locked())
+        # the next transaction sees what was committed in between
+        self.commit_concurrently('issue', id=id, title='eggs')
+        self.assertEqual(self.db.issue.get(id, 'title'), 'eggs')
+        self.db.close()
+        self.assert_(not self.locked())
+
+    def testSharedReaders(self):
+        id = self.db.issue.create(title='spam')
+        self.db.commit()
+        self.db.issue.set(id, title='eggs')
+        # a second reader may come in and doesn't see our changes
+        db2 = self.open_second()
+        try:
+            self.assertEqual(db2.issue.get(id, 'title'), 'spam')
+        finally:
+            db2.close()
+        self.db.commit()
+        self.assertEqual(self.db.issue.get(id, 'title'), 'eggs')
+        db2 = self.open_second()
+        try:
+            self.assertEqual(db2.issue.get(id, 'title'), 'eggs')
+        finally:
+            db2.close()
+
+    def testConflict(self):
+        id = self.db.issue.create(title='spam')
+        self.db.commit()
+        self.db.issue.set(id, title='eggs')
+        self.commit_concurrently('issue', id=id, title='ham')
+        self.assertRaises(DatabaseError, self.db.commit)
+        self.db.rollback()
+        self.assertEqual(self.db.issue.get(id, 'title'), 'ham')
+
+    def testNoConflict(self):
+        id1 = self.db.issue.create(title='spam')
+        id2 = self.db.issue.create(title='spam')
+        self.db.commit()
+        self.db.issue.set(id1, title='eggs')
+        self.commit_concurrently('issue', id=id2, title='ham')
+        self.db.commit()
+        self.assertEqual(self.db.issue.get(id1, 'title'), 'eggs')
+        self.assertEqual(self.db.issue.get(id2, 'title'), 'ham')
+
+    def testKeyConflict(self):
+        self.db.user.create(username='bob')
+        self.commit_concurrently('user', username='bob')
+        self.assertRaises(DatabaseError, self.db.commit)
+
+    def testKeyConflictIndexed(self):
+        # found through the index of the key, if there's one
+        self.db.issue.setkey('title')
+        self.db.issue.create(title='spam')
+        self.commit_concurrently('issue', title='Eggs')
+        self.commit_concurrently('issue', title='spam')
+        self.assertEqual(self.db.key_candidates('status', 'name', ['spam']),
+            None)
+        self.assertEqual(self.db.key_candidates('issue', 'title', ['eggs']),
+            set(['2']))
+        self.assertRaises(DatabaseError, self.db.commit)
+
+
+class anydbmPropertyIndexTest(anydbmOpener, commonDBTest, unittest.TestCase):
+    def lookup(self, propname, value):
+        l = self.db.index_lookup('issue', propname, 'yes', value)
+        l.sort()
+        return l
+
+    def testLinkIndex(self):
+        one = self.db.issue.create(title='spam', nosy=['1', '2'], status='1')
+        two = self.db.issue.create(title='eggs', nosy=['2'])
+        self.db.commit()
+        self.assertEqual(self.lookup('nosy', '2'), [one, two])
+        self.assertEqual(self.lookup('status', '1'), [one])
+        self.db.issue.set(one, nosy=['1'], status='2')
+        self.db.commit()
+        self.assertEqual(self.lookup('nosy', '2'), [two])
+        self.assertEqual(self.lookup('nosy', '1'), [one])
+        self.assertEqual(self.lookup('status', '1'), [])
+        self.db.issue.destroy(two)
+        self.db.commit()
+        self.assertEqual(self.lookup('nosy', '2'), [])
+
+    def testRebuildIndexes(self):
+        one = self.db.issue.create(title='spam', nosy=['2'])
+        self.db.commit()
+        # find() and filter() trust the index...
+        self.db.build_index('issue', [])
+        self.assertEqual(self.db.issue.find(nosy='2'), [])
+        self.assertEqual(self.db.issue.filter(None, {'nosy': '2'}), [])
+        # ...but still look at the uncommitted changes
+        two = self.db.issue.create(title='eggs', nosy=['2'])
+        self.assertEqual(self.db.issue.find(nosy='2'), [two])
+        self.db.rollback()
+
+        self.db.rebuild_indexes('issue')
+        self.assertEqual(self.db.issue.find(nosy='2'), [one])
+        self.assertEqual(self.db.issue.filter(None, {'nosy': '2'}), [one])
+
+    def testIndexesBuiltOnOpen(self):
+        one = self.db.issue.create(title='spam', nosy=['2'])
+        self.db.commit()
+        self.db.build_index('issue', [])
+        self.db.close()
+        os.remove(os.path.join(config.DATABASE, 'propindexes'))
+        self.db = self.module.Database(config, 'admin')
+        setupSchema(self.db, 0, self.module)
+        self.assertEqual(self.lookup('nosy', '2'), [one])
+
+class anydbmOptimizedOpenTest(ClassicInitBase, unittest.TestCase):
+    backend = 'anydbm'
+
+    def testIndexesUsed(self):
+        setupTracker(self.dirname, self.backend)
+        tracker = instance.open(self.dirname, optimize=1)
+        db = self.db = tracker.open('admin')
+        one = db.issue.create(title='spam', nosy=['1'], status='1')
+        db.commit()
+        db.close()
+
+        # the second open doesn't run post_init(), the indexes built
+        # must be known all the same
+        db = self.db = tracker.open('admin')
+        self.assertEqual(db.index_lookup('issue', 'nosy', 'yes', '1'), [one])
+        self.assertEqual(db.issue.indexed_nodeids('status', 'yes', ['1']),
+            [one])
+        self.assertEqual(db.issue.find(nosy='1'), [one])
+        self.assertEqual(db.issue.filter(None, {'status': '1'}), [one])
+        # and maintained by commit()
+        two = db.issue.create(title='eggs', nosy=['1'])
+        db.commit()
+        l = db.index_lookup('issue', 'nosy', 'yes', '1')
+        l.sort()
+        self.assertEqual(l, [one, two])
+
+
+from session_common import DBMTest, MemoryTest
 class anydbmSessionTest(anydbmOpener, DBMTest, unittest.TestCase):
+    def testNestedOpen(self):
+        db1 = self.sessions.opendb('r')
+        db2 = self.sessions.opendb('r')
+        self.sessions.closedb(db2)
+        self.sessions.closedb(db1)
+        self.assertEqual(self.sessions.lockfiles, {})
+
+class memorySessionTest(anydbmOpener, MemoryTest, unittest.TestCase):
     pass
 
 # vim: set filetype=python ts=4 sw=4 et si
@@ -957,6 +957,44 @@ class FormTestCase(unittest.TestCase):
             '8,resolved\r\n',
             output.getvalue())
 
+    def testCSVExportLinks(self):
+        self.db.issue.create(title='foo', status='2', nosy=['3', '4'])
+        self.db.issue.create(title='bar')
+        self.db.commit()
+        cl = self._make_client({'@columns': 'id,title,status,nosy',
+            '@sort': '-id'}, nodeid=None, userid='1')
+        cl.classname = 'issue'
+        output = StringIO.StringIO()
+        cl.request = MockNull()
+        cl.request.wfile = output
+        action = actions.ExportCSVAction(cl)
+        action.chunksize = 1
+        action.handle()
+        self.assertEquals('id,title,status,nosy\r\n2,bar,unread,\r\n'
+            '1,foo,deferred,Chef;mary\r\n', output.getvalue())
+
+    def testCSVExportLinksPermission(self):
+        self.db.issue.create(title='foo', status='2', nosy=['3', '4'])
+        self.db.commit()
+        self.db.security.addRole(name='Exporter')
+        for klass in 'issue', 'status':
+            self.db.security.addPermissionToRole('Exporter', 'View', klass)
+        p = self.db.security.addPermission(name='View', klass='user',
+            check=lambda db, userid, itemid: itemid == '4')
+        self.db.security.addPermissionToRole('Exporter', p)
+        exporter = self.db.user.create(username='exporter',
+            roles='Exporter')
+        cl = self._make_client({'@columns': 'id,status,nosy'}, nodeid=None,
+            userid=exporter)
+        cl.classname = 'issue'
+        output = StringIO.StringIO()
+        cl.request = MockNull()
+        cl.request.wfile = output
+        actions.ExportCSVAction(cl).handle()
+        # the users the exporter may not view are given by their ids
+        self.assertEquals('id,status,nosy\r\n1,deferred,3;mary\r\n',
+            output.getvalue())
+
     def testCSVExportBadColumnName(self):
         cl = self._make_client({'@columns': 'falseid,name'}, nodeid=None,
             userid='1')
@@ -979,4 +1017,149 @@ class FormTestCase(unittest.TestCase):
         self.assertRaises(exceptions.SeriousError,
             actions.ExportCSVAction(cl).handle)
 
+    def _write_file_client(self, request, range=None):
+        self.db.file.create(name='x.txt', type='text/plain',
+            content='0123456789')
+        self.db.commit()
+        cl = self._make_client({}, nodeid=None)
+        cl.env['REQUEST_METHOD'] = 'GET'
+        if range:
+            cl.env['HTTP_RANGE'] = range
+        cl.request = request
+        cl.FILE_CHUNK_SIZE = 3
+        return cl, self.db.filename('file', '1')
+
+    def testWriteFileChunks(self):
+        request = FileRequest()
+        cl, filename = self._write_file_client(request)
+        cl.write_file(filename)
+        self.assertEqual(request.response, 200)
+        self.assertEqual(request.headers['Content-Length'], '10')
+        self.assertEqual(request.wfile.getvalue(), '0123456789')
+
+    def testWriteFileRange(self):
+        request = FileRequest()
+        cl, filename = self._write_file_client(request, 'bytes=2-6')
+        cl.write_file(filename)
+        self.assertEqual(request.response, 206)
+        self.assertEqual(request.headers['Content-Range'], 'bytes 2-6/10')
+        self.assertEqual(request.wfile.getvalue(), '23456')
+
+    def testWriteFileSendfile(self):
+        request = FileRequest()
+        sent = []
+        request.sendfile = lambda *args: sent.append(args)
+        cl, filename = self._write_file_client(request, 'bytes=3-')
+        cl.write_file(filename)
+        self.assertEqual(sent, [(filename, 3, 7)])
+        self.assertEqual(request.wfile.getvalue(), '')
+
+    def testWSGIFile(self):
+        from roundup.cgi.wsgi_handler import RequestDispatcher
+        self.db.file.create(name='x.txt', type='text/plain',
+            content='0123456789')
+        self.db.commit()
+        dispatcher = RequestDispatcher(self.dirname)
+        def get(**env):
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file1/x.txt',
+                'wsgi.input': StringIO.StringIO(), 'SERVER_NAME': 'test',
+                'SERVER_PORT': '80', 'HTTP_HOST': 'test',
+                'SCRIPT_NAME': ''}
+            environ.update(env)
+            status = []
+            def start_response(code, headers):
+                status.append(code)
+                return status.append
+            body = dispatcher(environ, start_response)
+            return status[0], ''.join(status[1:] + list(body))
+        self.assertEqual(get(), ('200 OK', '0123456789'))
+        self.assertEqual(get(HTTP_RANGE='bytes=1-3'),
+            ('206 Partial Content', '123'))
+        def file_wrapper(f, blocksize):
+            return ['wrapped', f.read()]
+        self.assertEqual(get(HTTP_RANGE='bytes=1-3',
+            **{'wsgi.file_wrapper': file_wrapper}),
+            ('206 Partial Content', 'wrapped123'))
+
+
+class SessionTestCase(unittest.TestCase):
+    backend = 'sqlite'
+
+    def setUp(self):
+        self.dirname = '_test_cgi_session'
+        self.instance = db_test_base.setupTracker(self.dirname, self.backend)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def client(self):
+        cl = client.Client(self.instance, None, {'PATH_INFO': '/',
+            'REQUEST_METHOD': 'GET'}, makeForm({}))
+        cl.db = self.instance.open('admin')
+        return cl
+
+    def testNewSessionKept(self):
+        cl = self.client()
+        session = client.Session(cl)
+        session.set(user='admin')
+        sid = session._sid
+        cl.db.close()
+
+        cl = self.client()
+        try:
+            self.assert_(cl.db.getSessionManager().exists(sid))
+            self.assertEqual(cl.db.getSessionManager().get(sid, 'user'),
+                'admin')
+        finally:
+            cl.db.close()
+
+
+class anydbmSessionTestCase(SessionTestCase):
+    backend = 'anydbm'
+
+
+class TranslationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dirname = '_test_cgi_i18n'
+        os.makedirs(os.path.join(self.dirname, 'locale'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def write_po(self, msgstr):
+        f = open(os.path.join(self.dirname, 'locale', 'de.po'), 'w')
+        f.write('msgid ""\nmsgstr ""\n'
+            '"Content-Type: text/plain; charset=utf-8\\n"\n\n'
+            'msgid "spam"\nmsgstr "%s"\n'%msgstr)
+        f.close()
+
+    def testCachedTranslation(self):
+        from roundup.cgi import TranslationService
+        self.write_po('Spam')
+        t = TranslationService.get_translation(['de'], self.dirname)
+        self.assertEqual(t.gettext('spam'), 'Spam')
+        self.assert_(TranslationService.get_translation(['de'],
+            self.dirname) is t)
+        # a changed catalog is compiled and read again
+        self.write_po('Dosenfleisch')
+        t = TranslationService.get_translation(['de'], self.dirname)
+        self.assertEqual(t.gettext('spam'), 'Dosenfleisch')
+
+    def testAcceptLanguage(self):
+        from roundup.cgi import accept_language
+        languages = accept_language.parse('de, en-gb;q=0.8')
+        self.assertEqual(languages, ['de', 'en_gb'])
+        languages.append('fr')
+        self.assertEqual(accept_language.parse('de, en-gb;q=0.8'),
+            ['de', 'en_gb'])
+
+
+class FileRequest:
+    """A request object without sendfile()"""
+    def __init__(self):
+        self.wfile = StringIO.StringIO()
+    def start_response(self, headers, response):
+        self.headers = dict(headers)
+        self.response = response
+
 # vim: set filetype=python sts=4 sw=4 et si :
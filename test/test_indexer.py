@@ -76,6 +76,15 @@ class IndexerTest(unittest.TestCase):
         self.assertSeqEqual(self.dex.find(['blah']), [('test', '2', 'foo')])
         self.assertSeqEqual(self.dex.find(['blah', 'hello']), [])
 
+    def test_add_texts(self):
+        self.dex.add_text(('test', '1', 'foo'), 'blah blah the world')
+        self.dex.add_texts([(('test', '1', 'foo'), 'a the hello world',
+            'text/plain'), (('test', '2', 'foo'), 'blah world', 'text/plain')])
+        self.assertSeqEqual(self.dex.find(['world']), [('test', '1', 'foo'),
+                                                    ('test', '2', 'foo')])
+        self.assertSeqEqual(self.dex.find(['blah']), [('test', '2', 'foo')])
+        self.assertSeqEqual(self.dex.find(['hello']), [('test', '1', 'foo')])
+
     def test_change(self):
         self.dex.add_text(('test', '1', 'foo'), 'a the hello world')
         self.dex.add_text(('test', '2', 'foo'), 'blah blah the world')
@@ -177,6 +186,32 @@ class RDBMSIndexerTest(object):
         if os.path.exists(config.DATABASE):
             shutil.rmtree(config.DATABASE)
 
+    def test_rollback(self):
+        self.dex.add_text(('test', '1', 'foo'), 'a the hello world')
+        self.dex.flush()
+        self.dex.add_text(('test', '2', 'foo'), 'blah hello')
+        self.dex.rollback()
+        self.assertSeqEqual(self.dex.find(['hello']), [('test', '1', 'foo')])
+        self.assertSeqEqual(self.dex.find(['blah']), [])
+
+    def test_concurrent_words(self):
+        # another transaction numbers a word while we do
+        newids = self.db.newids
+        taken = []
+        def concurrent_newids(classname, count):
+            ids = newids(classname, count)
+            if classname == '__wordids' and not taken:
+                taken.append(int(ids[-1]) + 100)
+                self.db.sql('insert into __wordids (_wordid, _word) '
+                    'values (%s, %s)'%(self.db.arg, self.db.arg),
+                    (taken[0], 'HELLO'))
+            return ids
+        self.db.newids = concurrent_newids
+        wordids = self.dex.get_wordids(['HELLO', 'WORLD'], create=True)
+        self.assertEqual(wordids['HELLO'], taken[0])
+        self.dex.add_text(('test', '1', 'foo'), 'hello world')
+        self.assertSeqEqual(self.dex.find(['hello']), [('test', '1', 'foo')])
+
 
 @skip_postgresql
 class postgresqlIndexerTest(postgresqlOpener, RDBMSIndexerTest, IndexerTest):
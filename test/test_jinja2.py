@@ -7,6 +7,8 @@ see the COPYING.txt file coming with Roundup.
 
 Just a test file template for now.
 """
+import errno
+import shutil
 import unittest
 
 import db_test_base
@@ -27,6 +29,13 @@ class Jinja2Test(object):
         self.instance = db_test_base.setupTracker(self.dirname, self.backend)
         self.db = self.instance.open('admin')
 
+    def tearDown(self):
+        self.db.close()
+        try:
+            shutil.rmtree(self.dirname)
+        except OSError, error:
+            if error.errno not in (errno.ENOENT, errno.ESRCH): raise
+
     def test_zero(self):
         pass
 
@@ -1,8 +1,10 @@
 #-*- encoding: utf8 -*-
-import unittest
+import os, shutil, socket, smtplib, time, unittest
 
 from roundup import mailer
 
+import memorydb
+
 class EncodingTestCase(unittest.TestCase):
     def testEncoding(self):
         a = lambda n, a, c, o: self.assertEquals(mailer.nice_sender_header(n,
@@ -12,4 +14,208 @@ class EncodingTestCase(unittest.TestCase):
             '=?iso8859-1?q?caf=E9?= <ascii@test.com>')
         a('as"ii', 'ascii@test.com', 'iso8859-1', '"as\\"ii" <ascii@test.com>')
 
+class FakeSMTP:
+    """Stands in for SMTPConnection, recording the messages sent."""
+    down = False
+    def __init__(self, config):
+        FakeSMTP.opened += 1
+        self.closed = False
+        self.drop = None
+    def sendmail(self, sender, to, message):
+        if self.drop is not None:
+            raise self.drop
+        refused = {}
+        for address in to:
+            if address.startswith('bad'):
+                refused[address] = (550, 'no such user')
+            elif address.startswith('busy'):
+                refused[address] = (450, 'mailbox busy')
+        if len(refused) == len(to):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if FakeSMTP.down:
+            raise socket.error('down')
+        FakeSMTP.sent.append((to, message))
+        return refused
+    def quit(self):
+        self.closed = True
+    close = quit
+
+class FakeSMTPMixin:
+    def setUp(self):
+        FakeSMTP.opened = 0
+        FakeSMTP.sent = []
+        FakeSMTP.down = False
+        self.backup = mailer.SMTPConnection, mailer.smtp_pool
+        mailer.SMTPConnection = FakeSMTP
+        self.pool = mailer.smtp_pool = mailer.SMTPPool()
+
+    def tearDown(self):
+        mailer.SMTPConnection, mailer.smtp_pool = self.backup
+
+
+class SpoolTestCase(FakeSMTPMixin, unittest.TestCase):
+    dirname = '_test_mailspool'
+
+    def setUp(self):
+        FakeSMTPMixin.setUp(self)
+        self.config = memorydb.new_config()
+        self.config.MAILHOST = 'localhost'
+        self.config.MAIL_SPOOL = os.path.abspath(self.dirname)
+        self.spool = mailer.MailSpool(self.config.MAIL_SPOOL)
+
+    def tearDown(self):
+        FakeSMTPMixin.tearDown(self)
+        shutil.rmtree(self.dirname)
+
+    def testShared(self):
+        spool = mailer.Mailer(self.config).spool
+        self.assert_(mailer.Mailer(self.config).spool is spool)
+        self.assertEqual(spool.new, self.spool.new)
+
+    def testPutGet(self):
+        self.spool.put('me@test.test', ['a@test.test', 'b@test.test'],
+            'Subject: hi\n\nbody\n\nmore\n')
+        names = self.spool.names()
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.spool.get(names[0]), ('me@test.test',
+            ['a@test.test', 'b@test.test'], 'Subject: hi\n\nbody\n\nmore\n',
+            0, 0))
+        self.spool.remove(names[0])
+        self.assertEqual(self.spool.names(), [])
+        self.assertEqual(self.spool.get(names[0]), None)
+
+    def testQueuedOnCommit(self):
+        db = memorydb.create('admin')
+        db.config.MAIL_SPOOL = self.config.MAIL_SPOOL
+        try:
+            m = mailer.Mailer(db.config, db)
+            m.smtp_send(['a@test.test'], 'first')
+            self.assertEqual(self.spool.names(), [])
+            db.commit()
+            self.assertEqual(len(self.spool.names()), 1)
+            m.smtp_send(['a@test.test'], 'second')
+            db.rollback()
+            db.commit()
+            names = self.spool.names()
+            self.assertEqual(len(names), 1)
+            self.assertEqual(self.spool.get(names[0])[2], 'first')
+        finally:
+            db.close()
+
+    def testSend(self):
+        self.config.MAIL_DEBUG = os.path.abspath(os.path.join(self.dirname,
+            'debug.log'))
+        m = mailer.Mailer(self.config)
+        m.smtp_send(['a@test.test'], 'first')
+        m.smtp_send(['b@test.test'], 'second')
+        sender = mailer.SpoolSender(self.config)
+        sender.mailer.debug = self.config.MAIL_DEBUG
+        self.assertEqual(sender.run_once(), 2)
+        self.assertEqual(self.spool.names(), [])
+        log = open(self.config.MAIL_DEBUG).read()
+        self.assert_('TO: a@test.test\nfirst' in log)
+        self.assert_('TO: b@test.test\nsecond' in log)
+
+    def testRetry(self):
+        self.spool.put('me@test.test', ['a@test.test'], 'retried')
+        self.spool.put('me@test.test', ['bad@test.test'], 'refused')
+        sender = mailer.SpoolSender(self.config)
+        sender.mailer.debug = ''
+        FakeSMTP.down = True
+        now = time.time()
+        self.assertEqual(sender.run_once(now), 0)
+        names = self.spool.names()
+        self.assertEqual(len(names), 1)
+        self.assertEqual(len(os.listdir(self.spool.failed)), 1)
+        entry = self.spool.get(names[0])
+        self.assertEqual(entry[2:4], ('retried', 1))
+        self.assertEqual(entry[4], int(now + 60))
+        # not due yet
+        FakeSMTP.down = False
+        self.assertEqual(sender.run_once(now + 10), 0)
+        self.assertEqual(sender.run_once(now + 60), 1)
+        self.assertEqual(FakeSMTP.sent, [(['a@test.test'], 'retried')])
+        self.assertEqual(self.spool.names(), [])
+
+    def testSomeRecipientsRefused(self):
+        self.spool.put('me@test.test', ['a@test.test', 'bad@test.test',
+            'busy@test.test'], 'partly')
+        sender = mailer.SpoolSender(self.config)
+        sender.mailer.debug = ''
+        now = time.time()
+        self.assertEqual(sender.run_once(now), 1)
+        self.assertEqual(FakeSMTP.sent, [(['a@test.test', 'bad@test.test',
+            'busy@test.test'], 'partly')])
+        # the permanently refused recipient is given up
+        failed = os.listdir(self.spool.failed)
+        self.assertEqual(len(failed), 1)
+        self.assert_('Recipients: bad@test.test\n' in
+            open(os.path.join(self.spool.failed, failed[0])).read())
+        # the temporarily refused one is retried on its own
+        names = self.spool.names()
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.spool.get(names[0]), ('me@test.test',
+            ['busy@test.test'], 'partly', 1, int(now + 60)))
+
+
+class PoolTestCase(FakeSMTPMixin, unittest.TestCase):
+    def setUp(self):
+        FakeSMTPMixin.setUp(self)
+        self.config = memorydb.new_config()
+        self.config.MAILHOST = 'localhost'
+
+    def testReuse(self):
+        m = mailer.Mailer(self.config)
+        m.sendmail('me@test.test', ['a@test.test'], 'one')
+        m.sendmail('me@test.test', ['b@test.test', 'c@test.test'], 'two')
+        self.assertEqual(FakeSMTP.opened, 1)
+        self.assertEqual(self.pool.stats['connections'], 1)
+        self.assertEqual(self.pool.stats['reused'], 1)
+        self.assertEqual(self.pool.stats['messages'], 2)
+        self.assertEqual(self.pool.stats['recipients'], 3)
+        smtp = self.pool.idle.values()[0][0][0]
+        self.pool.clear()
+        self.assert_(smtp.closed)
+
+    def testNoPool(self):
+        self.config.MAIL_POOL_SIZE = 0
+        m = mailer.Mailer(self.config)
+        m.sendmail('me@test.test', ['a@test.test'], 'one')
+        m.sendmail('me@test.test', ['a@test.test'], 'two')
+        self.assertEqual(FakeSMTP.opened, 2)
+        self.assertEqual(self.pool.idle.values(), [[]])
+
+    def testTimeout(self):
+        m = mailer.Mailer(self.config)
+        m.sendmail('me@test.test', ['a@test.test'], 'one')
+        smtp, since = self.pool.idle.values()[0][0]
+        self.pool.idle.values()[0][0] = (smtp, since - 61)
+        m.sendmail('me@test.test', ['a@test.test'], 'two')
+        self.assertEqual(FakeSMTP.opened, 2)
+        self.assert_(smtp.closed)
+
+    def testDropped(self):
+        m = mailer.Mailer(self.config)
+        m.sendmail('me@test.test', ['a@test.test'], 'one')
+        self.pool.idle.values()[0][0][0].drop = \
+            smtplib.SMTPServerDisconnected('dropped')
+        m.sendmail('me@test.test', ['a@test.test'], 'two')
+        self.assertEqual(FakeSMTP.opened, 2)
+        self.assertEqual([m for t, m in FakeSMTP.sent], ['one', 'two'])
+
+    def testReset(self):
+        m = mailer.Mailer(self.config)
+        m.sendmail('me@test.test', ['a@test.test'], 'one')
+        smtp = self.pool.idle.values()[0][0][0]
+        smtp.drop = socket.error('reset')
+        m.sendmail('me@test.test', ['a@test.test'], 'two')
+        self.assertEqual(FakeSMTP.opened, 2)
+        self.assert_(smtp.closed)
+        self.assertEqual([msg for t, msg in FakeSMTP.sent], ['one', 'two'])
+        # a new connection isn't retried
+        self.pool.clear()
+        FakeSMTP.down = True
+        self.assertRaises(socket.error, m.sendmail, 'me@test.test',
+            ['a@test.test'], 'three')
+        self.assertEqual(FakeSMTP.opened, 3)
 # vim: set et sts=4 sw=4 :
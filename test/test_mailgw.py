@@ -13,7 +13,7 @@
 
 import email
 import gpgmelib
-import unittest, tempfile, os, shutil, errno, imp, sys, difflib, time
+import unittest, tempfile, os, shutil, errno, imp, sys, difflib, time, random
 
 import pytest
 
@@ -3268,6 +3268,185 @@ Stack trace:
         fileid = self.db.msg.get(msgid, 'files')[0]
         self.assertEqual(self.db.file.get(fileid, 'type'), 'message/rfc822')
 
+    def _imap_message(self, subject):
+        return '''Content-Type: text/plain;
+  charset="iso-8859-1"
+From: Chef <chef@bork.bork.bork>
+To: issue_tracker@your.tracker.email.domain.example
+Message-Id: <dummy_%s>
+Subject: %s
+
+Fetched over IMAP.
+'''%(subject.replace(' ', '_'), subject)
+
+    def _imap_server(self, messages, commands, deleted=()):
+        # messages have the UIDs 11, 12, ...
+        class IMAP:
+            def __init__(self, server):
+                commands.append(('connect', server))
+            def login(self, user, password):
+                commands.append(('login', user))
+            def select(self, mailbox='INBOX'):
+                return 'OK', [str(len(messages))]
+            def uid(self, command, *args):
+                if command == 'search':
+                    commands.append(('search', args[1]))
+                    uids = [str(i + 11) for i in range(len(messages))]
+                    return 'OK', [' '.join([u for u in uids
+                        if u not in deleted])]
+                if command == 'store':
+                    commands.append(('store', args[0], args[2]))
+                    return 'OK', []
+                commands.append(('fetch', args[0]))
+                data = []
+                for uid in args[0].split(','):
+                    message = messages[int(uid) - 11]
+                    data.append(('%d (UID %s RFC822 {%d}'%(int(uid) - 10,
+                        uid, len(message)), message))
+                    data.append(')')
+                return 'OK', data
+            def close(self):
+                commands.append(('close',))
+            def expunge(self):
+                commands.append(('expunge',))
+            def logout(self):
+                commands.append(('logout',))
+        return IMAP
+
+    def testImapBatchFetch(self):
+        import imaplib
+        messages = [self._imap_message('imap %d'%i) for i in range(4)]
+        commands = []
+        handler = self._create_mailgw('')
+        handler.trapExceptions = 0
+        handler.imap_batch = 2
+        backup, imaplib.IMAP4 = imaplib.IMAP4, self._imap_server(messages,
+            commands, deleted=['12'])
+        try:
+            self.assertEqual(handler.do_imap('imap.test', 'roundup', 'pw'), 0)
+        finally:
+            imaplib.IMAP4 = backup
+        # messages already marked as deleted aren't fetched, the others
+        # are marked one by one once they are handled
+        self.assertEqual(commands, [('connect', 'imap.test'),
+            ('login', 'roundup'), ('search', 'UNDELETED'),
+            ('fetch', '11,13'), ('store', '11', r'(\Deleted)'),
+            ('store', '13', r'(\Deleted)'), ('fetch', '14'),
+            ('store', '14', r'(\Deleted)'), ('close',), ('expunge',),
+            ('logout',)])
+        titles = [self.db.issue.get(i, 'title') for i in self.db.issue.list()]
+        self.assertEqual(titles, ['imap 0', 'imap 2', 'imap 3'])
+
+    def testImapFetchFailure(self):
+        import imaplib
+        messages = [self._imap_message('imap %d'%i) for i in range(3)]
+        commands = []
+        handler = self._create_mailgw('')
+        handler.trapExceptions = 0
+        handle_Message = handler.handle_Message
+        def failing_handle_Message(message):
+            if message.getheader('subject') == 'imap 1':
+                raise ValueError('failed')
+            return handle_Message(message)
+        handler.handle_Message = failing_handle_Message
+        backup, imaplib.IMAP4 = imaplib.IMAP4, self._imap_server(messages,
+            commands)
+        try:
+            self.assertRaises(ValueError, handler.do_imap, 'imap.test',
+                'roundup', 'pw')
+        finally:
+            imaplib.IMAP4 = backup
+        # the message that failed and the ones after it are left alone
+        self.assertEqual([c for c in commands if c[0] == 'store'],
+            [('store', '11', r'(\Deleted)')])
+        self.assertEqual(commands[-2:], [('expunge',), ('logout',)])
+
+    def testImapIdle(self):
+        sent = []
+        lines = ['+ idling\r\n', '* 3 EXISTS\r\n',
+            'A1 OK IDLE terminated\r\n']
+        class Socket:
+            timeout = None
+            def gettimeout(self):
+                return self.timeout
+            def settimeout(self, timeout):
+                self.timeout = timeout
+        class IMAP:
+            sock = Socket()
+            def _new_tag(self):
+                return 'A1'
+            def send(self, data):
+                sent.append(data)
+            def readline(self):
+                return lines.pop(0)
+            def socket(self):
+                return self.sock
+        handler = self._create_mailgw('')
+        server = IMAP()
+        handler.imap_idle(server, 30)
+        self.assertEqual(sent, ['A1 IDLE\r\n', 'DONE\r\n'])
+        self.assertEqual(lines, [])
+        self.assertEqual(server.sock.timeout, None)
+
+        # IDLE is only used when the server and imaplib allow it
+        server.capabilities = ('IMAP4REV1', 'IDLE')
+        self.assert_(handler.imap_can_idle(server))
+        server.capabilities = ('IMAP4REV1', )
+        self.assert_(not handler.imap_can_idle(server))
+        del IMAP._new_tag
+        server.capabilities = ('IMAP4REV1', 'IDLE')
+        self.assert_(not handler.imap_can_idle(server))
+
+    def testDaemonNeedsImap(self):
+        from roundup.scripts import roundup_mailgw
+        home = tempfile.mkdtemp()
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            # neither stdin nor a mailbox is read
+            for source in [], ['mailbox', '/dev/null']:
+                self.assertEqual(roundup_mailgw.main(['roundup-mailgw',
+                    '--daemon', home] + source), 1)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            os.rmdir(home)
+        self.assertEqual(output.count('--daemon needs an IMAP'), 2)
+
+    def testDispatcherOrdering(self):
+        handled = []
+        class Handler:
+            instance = self.instance
+            def handle_Message(self, message):
+                time.sleep(random.random() / 1000)
+                handled.append(message.getheader('subject'))
+        dispatcher = mailgw.MessageDispatcher(Handler(), workers=3,
+            queuesize=2)
+        done = []
+        subjects = []
+        for i in range(30):
+            subject = '[issue%d] message %d'%(i % 4, i)
+            if i % 5 == 0:
+                subject = 'Re: ' + subject
+            subjects.append(subject)
+        try:
+            for subject in subjects:
+                message = StringIO('Subject: %s\n\n'%subject)
+                dispatcher.put(mailgw.Message(message),
+                    lambda subject=subject: done.append(subject))
+            dispatcher.join()
+        finally:
+            dispatcher.stop()
+        self.assertEqual(sorted(handled), sorted(subjects))
+        self.assertEqual(sorted(done), sorted(subjects))
+        for n in range(4):
+            key = '[issue%d]'%n
+            self.assertEqual([h for h in handled if key in h],
+                [h for h in subjects if key in h])
+        key = lambda subject: dispatcher.key(mailgw.Message(StringIO(
+            'Subject: %s\n\n'%subject)))
+        self.assertEqual(key('Re: [Issue2] x'), 'issue2')
+        self.assertEqual(key('Fwd: New one'), 'new one')
+
 
 @skip_pgp
 class MailgwPGPTestCase(MailgwTestAbstractBase, unittest.TestCase):
@@ -35,7 +35,12 @@ class memorydbOpener:
 
 
 class memorydbDBTest(memorydbOpener, DBTest, unittest.TestCase):
-    pass
+    # the memorydb has no reindex
+    def testReindexChunks(self):
+        pass
+
+    def testReindexResume(self):
+        pass
 
 
 class memorydbROTest(memorydbOpener, ROTest, unittest.TestCase):
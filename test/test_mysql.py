@@ -23,6 +23,8 @@ from roundup.backends import get_backend, have_backend
 
 from db_test_base import DBTest, ROTest, config, SchemaTest, ClassicInitTest
 from db_test_base import ConcurrentDBTest, HTMLItemTest, FilterCacheTest
+from db_test_base import NodeCacheTest, JournalFormatTest
+from db_test_base import ConnectionPoolTest, SchemaFingerprintTest
 
 
 class mysqlOpener:
@@ -121,6 +123,58 @@ class mysqlFilterCacheTest(mysqlOpener, FilterCacheTest, unittest.TestCase):
         self.nuke_database()
 
 
+@skip_mysql
+class mysqlNodeCacheTest(mysqlOpener, NodeCacheTest, unittest.TestCase):
+    backend = 'mysql'
+    def setUp(self):
+        mysqlOpener.setUp(self)
+        NodeCacheTest.setUp(self)
+    def tearDown(self):
+        NodeCacheTest.tearDown(self)
+        self.nuke_database()
+
+    # the shared cache isn't used with MySQL
+    def testSharedCache(self):
+        self.assertEqual(self.db.shared_cache, None)
+    testSharedCacheUncommitted = testSharedCache
+
+
+@skip_mysql
+class mysqlConnectionPoolTest(mysqlOpener, ConnectionPoolTest,
+                              unittest.TestCase):
+    backend = 'mysql'
+    def setUp(self):
+        mysqlOpener.setUp(self)
+        ConnectionPoolTest.setUp(self)
+    def tearDown(self):
+        ConnectionPoolTest.tearDown(self)
+        self.nuke_database()
+
+
+@skip_mysql
+class mysqlSchemaFingerprintTest(mysqlOpener, SchemaFingerprintTest,
+                                 unittest.TestCase):
+    backend = 'mysql'
+    def setUp(self):
+        mysqlOpener.setUp(self)
+        SchemaFingerprintTest.setUp(self)
+    def tearDown(self):
+        SchemaFingerprintTest.tearDown(self)
+        self.nuke_database()
+
+
+@skip_mysql
+class mysqlJournalFormatTest(mysqlOpener, JournalFormatTest,
+                             unittest.TestCase):
+    backend = 'mysql'
+    def setUp(self):
+        mysqlOpener.setUp(self)
+        JournalFormatTest.setUp(self)
+    def tearDown(self):
+        JournalFormatTest.tearDown(self)
+        self.nuke_database()
+
+
 from session_common import RDBMSTest
 @skip_mysql
 class mysqlSessionTest(mysqlOpener, RDBMSTest, unittest.TestCase):
@@ -22,6 +22,8 @@ from roundup.hyperdb import DatabaseError
 
 from db_test_base import DBTest, ROTest, config, SchemaTest, ClassicInitTest
 from db_test_base import ConcurrentDBTest, HTMLItemTest, FilterCacheTest
+from db_test_base import NodeCacheTest, JournalFormatTest
+from db_test_base import ConnectionPoolTest, SchemaFingerprintTest
 from db_test_base import ClassicInitBase, setupTracker
 
 from roundup.backends import get_backend, have_backend
@@ -162,6 +164,58 @@ class postgresqlFilterCacheTest(postgresqlOpener, FilterCacheTest,
         postgresqlOpener.tearDown(self)
 
 
+@skip_postgresql
+class postgresqlNodeCacheTest(postgresqlOpener, NodeCacheTest,
+                              unittest.TestCase):
+    backend = 'postgresql'
+    def setUp(self):
+        postgresqlOpener.setUp(self)
+        NodeCacheTest.setUp(self)
+
+    def tearDown(self):
+        NodeCacheTest.tearDown(self)
+        postgresqlOpener.tearDown(self)
+
+
+@skip_postgresql
+class postgresqlConnectionPoolTest(postgresqlOpener, ConnectionPoolTest,
+                                   unittest.TestCase):
+    backend = 'postgresql'
+    def setUp(self):
+        postgresqlOpener.setUp(self)
+        ConnectionPoolTest.setUp(self)
+
+    def tearDown(self):
+        ConnectionPoolTest.tearDown(self)
+        postgresqlOpener.tearDown(self)
+
+
+@skip_postgresql
+class postgresqlSchemaFingerprintTest(postgresqlOpener, SchemaFingerprintTest,
+                                      unittest.TestCase):
+    backend = 'postgresql'
+    def setUp(self):
+        postgresqlOpener.setUp(self)
+        SchemaFingerprintTest.setUp(self)
+
+    def tearDown(self):
+        SchemaFingerprintTest.tearDown(self)
+        postgresqlOpener.tearDown(self)
+
+
+@skip_postgresql
+class postgresqlJournalFormatTest(postgresqlOpener, JournalFormatTest,
+                                  unittest.TestCase):
+    backend = 'postgresql'
+    def setUp(self):
+        postgresqlOpener.setUp(self)
+        JournalFormatTest.setUp(self)
+
+    def tearDown(self):
+        JournalFormatTest.tearDown(self)
+        postgresqlOpener.tearDown(self)
+
+
 @skip_postgresql
 class postgresqlSchemaTest(postgresqlOpener, SchemaTest, unittest.TestCase):
     def setUp(self):
@@ -177,6 +177,62 @@ class PermissionTest(MyTestCase, unittest.TestCase):
         self.assertEquals(has('Test', none, 'test', itemid='1'), 0)
         self.assertEquals(has('Test', none, 'test', itemid='2'), 0)
 
+    def testPermissionCache(self):
+        add = self.db.security.addPermission
+        has = self.db.security.hasPermission
+        addRole = self.db.security.addRole
+        addToRole = self.db.security.addPermissionToRole
+        calls = []
+        def check(db, userid, itemid):
+            calls.append(itemid)
+            return itemid == '1'
+        def cached_check(db, userid, itemid):
+            calls.append(itemid)
+            return itemid == '2'
+        cached_check.cacheable = True
+        addRole(name='Role1')
+        addToRole('Role1', add(name="Test", klass="test", check=check))
+        addToRole('Role1', add(name="Cached", klass="test",
+            check=cached_check))
+        user1 = self.db.user.create(username='user1', roles='Role1')
+
+        # uncacheable check functions are called every time
+        self.assertEquals(has('Test', user1, 'test', itemid='1'), 1)
+        self.assertEquals(has('Test', user1, 'test', itemid='1'), 1)
+        self.assertEquals(calls, ['1', '1'])
+
+        # cacheable ones only once per transaction
+        del calls[:]
+        self.assertEquals(has('Cached', user1, 'test', itemid='2'), 1)
+        self.assertEquals(has('Cached', user1, 'test', itemid='2'), 1)
+        self.assertEquals(has('Cached', user1, 'test', itemid='3'), 0)
+        self.assertEquals(has('Cached', user1, 'test', itemid='3'), 0)
+        self.assertEquals(calls, ['2', '3'])
+        self.db.commit()
+        self.assertEquals(has('Cached', user1, 'test', itemid='2'), 1)
+        self.assertEquals(calls, ['2', '3', '2'])
+
+        # a change of roles is noticed straight away
+        self.assertEquals(has('Test', user1, 'other'), 0)
+        addRole(name='Role2')
+        addToRole('Role2', add(name="Test", klass="other"))
+        self.assertEquals(has('Test', user1, 'other'), 0)
+        self.db.user.set(user1, roles='Role1,Role2')
+        self.assertEquals(has('Test', user1, 'other'), 1)
+        self.db.rollback()
+        self.assertEquals(has('Test', user1, 'other'), 0)
+
+        # so is an assignment to a Role's permissions
+        role = self.db.security.role['role1']
+        saved = role.permissions
+        role.permissions = []
+        self.assertEquals(has('Test', user1, 'test', itemid='1'), 0)
+        role.permissions = saved
+        self.assertEquals(has('Test', user1, 'test', itemid='1'), 1)
+        self.assertEquals(has('Cached', user1, 'test', itemid='2'), 1)
+        role.permissions = role.permissions[:1]
+        self.assertEquals(has('Cached', user1, 'test', itemid='2'), 0)
+
     def testTransitiveSearchPermissions(self):
         add = self.db.security.addPermission
         has = self.db.security.hasSearchPermission
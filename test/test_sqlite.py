@@ -19,7 +19,9 @@ import unittest, os, shutil, time
 from roundup.backends import get_backend, have_backend
 
 from db_test_base import DBTest, ROTest, SchemaTest, ClassicInitTest, config
-from db_test_base import ConcurrentDBTest, FilterCacheTest
+from db_test_base import ConcurrentDBTest, FilterCacheTest, NodeCacheTest
+from db_test_base import ConnectionPoolTest, SchemaFingerprintTest
+from db_test_base import JournalFormatTest, commonDBTest, setupSchema
 
 class sqliteOpener:
     if have_backend('sqlite'):
@@ -53,6 +55,139 @@ class sqliteFilterCacheTest(sqliteOpener, FilterCacheTest, unittest.TestCase):
     backend = 'sqlite'
 
 
+class sqliteNodeCacheTest(sqliteOpener, NodeCacheTest, unittest.TestCase):
+    backend = 'sqlite'
+
+
+class sqliteConnectionPoolTest(sqliteOpener, ConnectionPoolTest,
+                               unittest.TestCase):
+    backend = 'sqlite'
+
+
+class sqliteSchemaFingerprintTest(sqliteOpener, SchemaFingerprintTest,
+                                  unittest.TestCase):
+    backend = 'sqlite'
+
+
+class sqliteJournalFormatTest(sqliteOpener, JournalFormatTest,
+                              unittest.TestCase):
+    backend = 'sqlite'
+
+
+class sqliteWordTablesTest(sqliteOpener, commonDBTest, unittest.TestCase):
+    def downgrade(self):
+        # go back to the version 6 full-text index
+        self.db.sql('create table __words (_word varchar, _textid integer)')
+        self.db.sql('insert into __words select _word, _textid '
+            'from __postings, __wordids '
+            'where __postings._wordid = __wordids._wordid')
+        self.db.sql('drop table __postings')
+        self.db.sql('drop table __wordids')
+        self.db.sql("delete from ids where name='__wordids'")
+        self.db.sql('drop table schema_fingerprint')
+        self.db.database_schema['version'] = 6
+        self.db.save_dbschema()
+        self.db.commit()
+        self.db.close()
+
+        self.open_database()
+        setupSchema(self.db, 0, self.module)
+        self.assertEqual(self.db.database_schema['version'],
+            self.db.current_db_version)
+
+    def testUpgrade(self):
+        self.db.issue.create(title='flebble frooz')
+        self.db.issue.create(title='frooz')
+        self.db.commit()
+        # number the words one per statement
+        self.db.__class__.wordids_batch = 1
+        try:
+            self.downgrade()
+        finally:
+            del self.db.__class__.wordids_batch
+        self.assertEqual(self.db.indexer.search(['frooz'], self.db.issue),
+            {'1': {}, '2': {}})
+        self.assertEqual(self.db.indexer.search(['flebble', 'frooz'],
+            self.db.issue), {'1': {}})
+        self.db.issue.create(title='frooz quux')
+        self.db.commit()
+        self.assertEqual(self.db.indexer.search(['frooz', 'quux'],
+            self.db.issue), {'3': {}})
+        self.db.sql('select count(*) from __wordids')
+        self.assertEqual(self.db.cursor.fetchone()[0], 3)
+
+    def testUpgradeEmpty(self):
+        self.downgrade()
+        self.db.issue.create(title='frooz')
+        self.db.commit()
+        self.assertEqual(self.db.indexer.search(['frooz'], self.db.issue),
+            {'1': {}})
+
+
+class sqliteIdsTest(sqliteOpener, commonDBTest, unittest.TestCase):
+    def testNewids(self):
+        first = int(self.db.issue.create(title='spam'))
+        self.assertEqual(self.db.newids('issue', 3),
+            [str(first + i) for i in range(1, 4)])
+        self.assertEqual(self.db.issue.create(title='eggs'), str(first + 4))
+        self.assertEqual(self.db.newids('issue', 0), [])
+
+        # import sets the counter
+        self.db.setid('issue', 10)
+        self.assertEqual(self.db.issue.create(title='ham'), '11')
+
+    def testRollback(self):
+        self.db.commit()
+        self.db.newids('issue', 5)
+        self.db.rollback()
+        self.assertEqual(self.db.issue.create(title='spam'), '1')
+
+
+class sqlitePragmaTest(sqliteOpener, commonDBTest, unittest.TestCase):
+    settings = {'SQLITE_JOURNAL_MODE': 'wal', 'SQLITE_SYNCHRONOUS': 'normal',
+        'SQLITE_CACHE_SIZE': -4096, 'SQLITE_MMAP_SIZE': 1 << 20,
+        'SQLITE_TEMP_STORE': 'memory'}
+
+    def setUp(self):
+        self.saved = {}
+        for name, value in self.settings.items():
+            self.saved[name] = config['RDBMS_' + name]
+            config['RDBMS_' + name] = value
+        commonDBTest.setUp(self)
+
+    def tearDown(self):
+        commonDBTest.tearDown(self)
+        for name, value in self.saved.items():
+            config['RDBMS_' + name] = value
+
+    def pragma(self, db, name):
+        db.sql('pragma %s'%name)
+        return db.cursor.fetchone()[0]
+
+    def testPragmas(self):
+        self.assertEqual(self.pragma(self.db, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(self.db, 'synchronous'), 1)
+        self.assertEqual(self.pragma(self.db, 'cache_size'), -4096)
+        self.assertEqual(self.pragma(self.db, 'temp_store'), 2)
+        self.assertEqual(self.db.conn.isolation_level, 'IMMEDIATE')
+
+    def testReadWhileWriting(self):
+        self.db.issue.create(title='spam')
+        self.db.commit()
+        self.db.issue.set('1', title='eggs')
+        # the uncommitted change doesn't keep other connections from
+        # reading, or the writer from committing while they read
+        db2 = self.module.Database(config, 'admin')
+        setupSchema(db2, 0, self.module)
+        try:
+            self.assertEqual(db2.issue.get('1', 'title'), 'spam')
+            self.db.commit()
+            db2.clearCache()
+            self.assertEqual(db2.issue.get('1', 'title'), 'eggs')
+        finally:
+            db2.close()
+
+
 from session_common import RDBMSTest
 class sqliteSessionTest(sqliteOpener, RDBMSTest, unittest.TestCase):
     pass
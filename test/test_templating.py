@@ -181,6 +181,80 @@ class HTMLClassTestCase(TemplatingTestCase) :
             ae(t('http://roundup.net/%c/' % c),
                '<a href="http://roundup.net/%c/">http://roundup.net/%c/</a>' % (c, c))
 
+class PrefetchTestCase(TemplatingTestCase):
+    def test_prefetchItems(self):
+        calls = []
+        class DB:
+            supported = False
+            def supports_prefetch(self):
+                return self.supported
+            def prefetch(self, classname, ids, propnames=None):
+                calls.append((classname, ids))
+            def getclass(self, classname):
+                return klasses[classname]
+        def get(id, name):
+            calls.append(('get', id))
+            return '1'
+        klasses = {'issue': MockNull(get=get, getprops=lambda:
+            {'status': hyperdb.Link('status')})}
+        db = DB()
+        # nothing is looked up for backends that can't batch it
+        prefetchItems(db, 'issue', ['1', '2'], ['status'])
+        self.assertEqual(calls, [])
+        db.supported = True
+        prefetchItems(db, 'issue', ['1', '2'], ['status'])
+        self.assertEqual(calls, [('issue', ['1', '2']), ('get', '1'),
+            ('get', '2'), ('status', ['1', '1'])])
+
+class FilterResultTestCase(TemplatingTestCase):
+    def test_paging(self):
+        ids = [str(i) for i in range(1, 21)]
+        calls = []
+        def filter_with_permissions(search_matches, filterspec, sort, group,
+                permission, userid, limit=None, offset=None):
+            calls.append((limit, offset))
+            return ids[offset:offset+limit]
+        def filter_count(search_matches, filterspec, permission, userid):
+            calls.append('count')
+            return len(ids)
+        klass = MockNull(filter_with_permissions=filter_with_permissions,
+            filter_count=filter_count)
+        result = FilterResult(klass, None, {}, [], [], 'View', '1', 4)
+        batch = Batch(self.client, result, 3, 3)
+        self.assertEqual(list(batch), ['4', '5', '6'])
+        self.assertEqual(batch.sequence_length, 20)
+        self.assertEqual(batch.next().first, 6)
+        self.assertEqual(batch.previous().first, 0)
+        self.assertEqual(calls, ['count', (12, 0)])
+        self.assertEqual(result[-1], '20')
+        self.assertEqual(calls[-1], (12, 15))
+        self.assertRaises(IndexError, result.__getitem__, 20)
+        self.assertEqual(result[17:], ['18', '19', '20'])
+
+class RankedResultTestCase(TemplatingTestCase):
+    def test_paging(self):
+        # the odd ids are allowed, ranked from the highest id
+        ranked = [(str(i), 1.0 / i) for i in range(20, 0, -1)]
+        calls = []
+        def filter_with_permissions(search_matches, filterspec, sort, group,
+                permission, userid, limit=None, offset=None):
+            calls.append(len(search_matches))
+            return [i for i in search_matches if int(i) % 2]
+        def filter_count(search_matches, filterspec, permission, userid):
+            calls.append('count')
+            return len([i for i in search_matches if int(i) % 2])
+        klass = MockNull(filter_with_permissions=filter_with_permissions,
+            filter_count=filter_count)
+        result = RankedResult(klass, ranked, {}, 'View', '1', 2)
+        batch = Batch(self.client, result, 2, 2)
+        self.assertEqual(list(batch), ['15', '13'])
+        self.assertEqual(batch.sequence_length, 10)
+        self.assertEqual(calls, ['count', 6, 6])
+        self.assertEqual(result[-1], '1')
+        self.assertEqual(calls[-2:], [6, 2])
+        self.assertRaises(IndexError, result.__getitem__, 10)
+        self.assertEqual(len(RankedResult(klass, [], {}, 'View', '1', 2)), 0)
+
 '''
 class HTMLPermissions:
     def is_edit_ok(self):
@@ -225,6 +225,13 @@ class XmlrpcTest(object):
         self.assertEqual(r, ['2', '3', '1'])
         r = self.server.filter('issue', None, {}, group=keygroup)
         self.assertEqual(r, ['2', '3', '1'])
+        # Paging and counting
+        r = self.server.filter('issue', None, {}, limit=1, offset=1)
+        self.assertEqual(r, ['2'])
+        r = self.server.filter('issue', None, {}, sort=keysort, limit=2,
+            offset=1)
+        self.assertEqual(r, ['3', '1'])
+        self.assertEqual(self.server.filter_count('issue', None, stat), 2)
 
     def testMulticall(self):
         translator = TranslationService.get_translation(